@@ -0,0 +1,196 @@
+"""
+Deterministic benchmark. Loads the scene in headless mode on a software GL context, flies the camera along a recorded
+or spline camera path with a fixed timestep, and reports the CPU time percentiles of each stage of the frame along with
+the draw calls and triangles submitted. Results are written as JSON, and can be compared with the results of an earlier
+run (eg. another commit) to spot regressions.
+
+    python benchmark.py --output results.json
+    python benchmark.py --output new.json --compare results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+
+import numpy as np
+
+# Frames rendered and timed, and frames rendered first so that caches, lazy GL state and the shadow maps warm up.
+BENCHMARK_FRAMES = 300
+WARMUP_FRAMES = 10
+BENCHMARK_SIZE = (1280, 720)
+BENCHMARK_PATH = '../camera_paths/flythrough.json'
+PERCENTILES = (50, 90, 99)
+# Stages of a frame, in order. The GPU wait is the time glFinish takes, ie. the GPU work the CPU stages queued.
+STAGES = ('simulation', 'streaming', 'scene update', 'shadow pass', 'occlusion', 'depth prepass', 'main pass', 'skybox',
+          'upscale', 'gpu wait')
+# A stage (or the frame) counts as a regression in --compare if its median is this much slower than the baseline's, and
+# by at least REGRESSION_MIN_MS, so noise in stages that take microseconds is ignored.
+REGRESSION_THRESHOLD = 0.1
+REGRESSION_MIN_MS = 0.1
+
+
+def get_percentiles(values):
+    """
+    Summarises a list of values.
+    :return: Dictionary of the mean, max and PERCENTILES of the values.
+    """
+    values = np.asarray(values, dtype='f8')
+    summary = {'mean': float(values.mean()), 'max': float(values.max())}
+    summary.update({f'p{percentile}': float(np.percentile(values, percentile)) for percentile in PERCENTILES})
+    return summary
+
+
+def get_commit():
+    """
+    Gets the git commit the benchmark runs on, None outside a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(path_file=BENCHMARK_PATH, frames=BENCHMARK_FRAMES, size=BENCHMARK_SIZE, interpolation=None,
+                  warmup=WARMUP_FRAMES, render_scale=1.0, upscale_filter='bilinear', depth_prepass=False):
+    """
+    Renders the scene along a camera path and times each stage of every frame.
+    :param path_file: JSON camera path the camera follows.
+    :param frames: Number of frames timed, spread evenly over the path with a fixed timestep.
+    :param size: Size of the frames.
+    :param interpolation: 'linear' or 'spline', the path file's interpolation if None.
+    :param warmup: Number of untimed frames rendered at the start of the path first.
+    :param render_scale: Resolution the scene is rendered at relative to the frame size, upscaled with upscale_filter.
+    :param depth_prepass: Whether the opaque objects' depth is drawn before they are shaded.
+    :return: The results as a JSON compatible dictionary, times are in milliseconds.
+    """
+    from main import GraphicsEngine
+    from camera_path import CameraPath
+
+    path = CameraPath.load(path_file, interpolation)
+    app = GraphicsEngine(size, headless=True, camera_path=path, profile=True, render_scale=render_scale,
+                         upscale_filter=upscale_filter)
+    renderer = app.scene_renderer
+    renderer.depth_prepass = depth_prepass
+    timestep = path.duration / max(frames - 1, 1)
+    stage_times = {stage: [] for stage in STAGES}
+    frame_times, draw_calls, triangles, memory = [], [], [], []
+
+    for frame in range(-warmup, frames):
+        # Fixed timestep instead of the clock's delta time, so every run renders exactly the same frames.
+        app.time = max(frame, 0) * timestep
+        app.delta_time = timestep * 1000
+        start = time.perf_counter()
+        app.tick()
+        app.render()
+        gpu_start = time.perf_counter()
+        app.ctx.finish()
+        end = time.perf_counter()
+        if frame < 0:
+            continue
+
+        times = dict(app.profiler.last_cpu_times, **{'gpu wait': end - gpu_start})
+        for stage in STAGES:
+            stage_times[stage].append(times.get(stage, 0) * 1000)
+        frame_times.append((end - start) * 1000)
+        _, _, frame_draw_calls, frame_triangles = renderer.queue.stats.frame
+        draw_calls.append(frame_draw_calls)
+        triangles.append(frame_triangles)
+        memory.append(app.resources.resident_bytes / 2 ** 20)
+
+    results = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'gl_renderer': app.ctx.info['GL_RENDERER'],
+        'path': path_file,
+        'interpolation': path.interpolation,
+        'frames': frames,
+        'size': list(size),
+        'render_scale': render_scale,
+        'upscale_filter': upscale_filter,
+        'depth_prepass': depth_prepass,
+        'frame_ms': get_percentiles(frame_times),
+        'stages_ms': {stage: get_percentiles(values) for stage, values in stage_times.items()},
+        'draw_calls': get_percentiles(draw_calls),
+        'triangles': get_percentiles(triangles),
+        'gpu_memory_mb': get_percentiles(memory),
+    }
+    app.destroy()
+    return results
+
+
+def print_results(results):
+    """
+    Prints the results as a table.
+    """
+    prepass = ', depth pre-pass' if results.get('depth_prepass') else ''
+    print(f'{results["frames"]} frames at {results["size"][0]}x{results["size"][1]} '
+          f'(render scale {results.get("render_scale", 1.0)}{prepass}) on {results["gl_renderer"]} '
+          f'(commit {results["commit"]})')
+    columns = ['mean', *(f'p{percentile}' for percentile in PERCENTILES), 'max']
+    print(f'{"":<16}' + ''.join(f'{column:>10}' for column in columns))
+    rows = [(f'{stage} ms', values) for stage, values in results['stages_ms'].items()]
+    rows += [('frame ms', results['frame_ms']), ('draw calls', results['draw_calls']),
+             ('triangles', results['triangles'])]
+    if 'gpu_memory_mb' in results:
+        rows.append(('GPU memory MB', results['gpu_memory_mb']))
+    for name, values in rows:
+        print(f'{name:<16}' + ''.join(f'{values[column]:>10.2f}' for column in columns))
+
+
+def compare_results(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Prints how the median of each stage and of the whole frame changed against a baseline run.
+    :return: The names of the stages that got slower by more than the threshold.
+    """
+    print(f'Compared with commit {baseline.get("commit")}:')
+    regressions = []
+    pairs = [(stage, values, baseline['stages_ms'].get(stage)) for stage, values in results['stages_ms'].items()]
+    pairs.append(('frame', results['frame_ms'], baseline['frame_ms']))
+    for name, values, old in pairs:
+        if old is None:
+            continue
+        change = (values['p50'] - old['p50']) / old['p50'] if old['p50'] else 0
+        slower = change > threshold and values['p50'] - old['p50'] > REGRESSION_MIN_MS
+        if slower:
+            regressions.append(name)
+        print(f'    {name:<14} p50 {old["p50"]:8.2f} -> {values["p50"]:8.2f} ms ({change:+.1%})'
+              f'{"  REGRESSION" if slower else ""}')
+    for counter in ('draw_calls', 'triangles', 'gpu_memory_mb'):
+        if counter in baseline and results[counter]['mean'] != baseline[counter]['mean']:
+            print(f'    {counter} changed: {baseline[counter]["mean"]:.1f} -> {results[counter]["mean"]:.1f} per frame')
+    return regressions
+
+
+if __name__ == '__main__':
+    from main import parse_size
+    from render_target import UPSCALE_FILTERS
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--path', default=BENCHMARK_PATH, help='JSON camera path to fly along')
+    parser.add_argument('--spline', action='store_true', help='fly along a spline through the keyframes')
+    parser.add_argument('--frames', type=int, default=BENCHMARK_FRAMES, help='number of frames timed')
+    parser.add_argument('--size', type=parse_size, default=BENCHMARK_SIZE, help='frame size as WIDTHxHEIGHT')
+    parser.add_argument('--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    parser.add_argument('--scale', type=float, default=1.0, help='resolution the scene is rendered at, eg. 0.5')
+    parser.add_argument('--filter', choices=UPSCALE_FILTERS, default='bilinear', help='filter of the upscale')
+    parser.add_argument('--depth-prepass', action='store_true', help='draw the depth before shading')
+    parser.add_argument('--hardware', action='store_true', help='use the GPU instead of software rendering')
+    args = parser.parse_args()
+
+    if not args.hardware:
+        # Mesa's software rasteriser, so results do not depend on the machine's GPU and driver
+        os.environ.setdefault('LIBGL_ALWAYS_SOFTWARE', '1')
+    results = run_benchmark(args.path, args.frames, args.size, 'spline' if args.spline else None,
+                            render_scale=args.scale, upscale_filter=args.filter, depth_prepass=args.depth_prepass)
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            compare_results(results, json.load(file))
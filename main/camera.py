@@ -15,8 +15,12 @@ SENSITIVITY = 0.05
 
 
 class Camera:
-    def __init__(self, app, position=(0, 2, -6), yaw=90, pitch=0):
+    def __init__(self, app, position=(0, 2, -6), yaw=90, pitch=0, path=None):
+        """
+        :param path: A CameraPath the camera follows instead of mouse and keyboard input, None for user input.
+        """
         self.app = app
+        self.path = path
         self.aspect_ratio = app.WIN_SIZE[0] / app.WIN_SIZE[1]
         self.position = glm.vec3(position)
         self.up = glm.vec3(0, 1, 0)
@@ -24,8 +28,11 @@ class Camera:
         self.forward = glm.vec3(0, 0, -1)
         self.yaw = yaw
         self.pitch = pitch
+        # Position, yaw and pitch at the last two simulation steps, the camera is rendered in between them
+        self.state = self.previous_state = (glm.vec3(position), yaw, pitch)
         self.view_matrix = self.get_view_matrix()
         self.projection_matrix = self.get_projection_matrix()
+        self.app.uniforms.write_camera(self)
 
     def rotate(self):
         """
@@ -36,6 +43,13 @@ class Camera:
         self.pitch -= rel_y * SENSITIVITY
         self.pitch = max(-89, min(89, self.pitch))
 
+    def follow_path(self):
+        """
+        Moves and rotates the camera to its scripted path's position at the app's current time.
+        """
+        position, self.yaw, self.pitch = self.path.get(self.app.time)
+        self.position = glm.vec3(position)
+
     def update_camera_vectors(self):
         """
         Completes vector calculations in line with rotations
@@ -50,14 +64,33 @@ class Camera:
         self.right = glm.normalize(glm.cross(self.forward, glm.vec3(0, 1, 0)))
         self.up = glm.normalize(glm.cross(self.right, self.forward))
 
-    def update(self):
+    def tick(self):
+        """
+        Advances the camera by one simulation step, moving it with user input or along its path.
+        """
+        position, self.yaw, self.pitch = self.state
+        self.position = glm.vec3(position)
+        self.update_camera_vectors()
+        if self.path is None:
+            self.move()
+            self.rotate()
+        else:
+            self.follow_path()
+        self.previous_state, self.state = self.state, (glm.vec3(self.position), self.yaw, self.pitch)
+
+    def interpolate(self, alpha):
         """
-        Updates camera position
+        Places the camera between its last two simulation steps, and writes the camera's uniform buffer once for every
+        shader.
+        :param alpha: 0 at the previous step, 1 at the last step.
         """
-        self.move()
-        self.rotate()
+        (previous_position, previous_yaw, previous_pitch), (position, yaw, pitch) = self.previous_state, self.state
+        self.position = glm.mix(previous_position, position, alpha)
+        self.yaw = previous_yaw + (yaw - previous_yaw) * alpha
+        self.pitch = previous_pitch + (pitch - previous_pitch) * alpha
         self.update_camera_vectors()
         self.view_matrix = self.get_view_matrix()
+        self.app.uniforms.write_camera(self)
 
     def move(self):
         """
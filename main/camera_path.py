@@ -0,0 +1,107 @@
+"""
+Scripted camera paths, used instead of mouse and keyboard input (eg. in headless mode, where there is no user). A path
+is a JSON list of keyframes {"time": seconds, "position": [x, y, z], "yaw": degrees, "pitch": degrees}, or an object
+{"interpolation": "linear" or "spline", "keyframes": [...]}. The camera moves between keyframes in straight lines, or
+along a Catmull-Rom spline through them, holding the first and last keyframe before and after the path. Paths can be
+recorded from the camera while flying through the scene (main.py --record).
+"""
+
+import json
+
+import numpy as np
+
+INTERPOLATIONS = ('linear', 'spline')
+
+
+def catmull_rom(p0, p1, p2, p3, t):
+    """
+    Interpolates between p1 and p2 on the uniform Catmull-Rom spline through p0, p1, p2 and p3.
+    :param t: 0 at p1, 1 at p2.
+    """
+    return 0.5 * (2 * p1 + (p2 - p0) * t + (2 * p0 - 5 * p1 + 4 * p2 - p3) * t ** 2 +
+                  (3 * p1 - p0 - 3 * p2 + p3) * t ** 3)
+
+
+class CameraPath:
+    def __init__(self, keyframes, interpolation='linear'):
+        """
+        :param keyframes: List of dictionaries with time, position, yaw and pitch, in any order.
+        :param interpolation: 'linear' or 'spline'.
+        """
+        if not keyframes:
+            raise ValueError('A camera path needs at least one keyframe')
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError(f'Unknown interpolation {interpolation}, expected one of {INTERPOLATIONS}')
+        self.interpolation = interpolation
+        keyframes = sorted(keyframes, key=lambda keyframe: keyframe['time'])
+        self.times = np.array([keyframe['time'] for keyframe in keyframes], dtype='f8')
+        # Position, yaw and pitch of each keyframe.
+        self.values = np.array([[*keyframe['position'], keyframe.get('yaw', 90), keyframe.get('pitch', 0)]
+                                for keyframe in keyframes], dtype='f8')
+
+    @classmethod
+    def load(cls, path, interpolation=None):
+        """
+        Loads a path from a JSON file.
+        :param interpolation: Overrides the file's interpolation if not None.
+        """
+        with open(path) as file:
+            data = json.load(file)
+        if isinstance(data, list):
+            data = {'keyframes': data}
+        return cls(data['keyframes'], interpolation or data.get('interpolation', 'linear'))
+
+    def save(self, path):
+        """
+        Saves the path to a JSON file.
+        """
+        keyframes = [{'time': round(float(time), 4), 'position': [round(float(value), 4) for value in values[:3]],
+                      'yaw': round(float(values[3]), 4), 'pitch': round(float(values[4]), 4)}
+                     for time, values in zip(self.times, self.values)]
+        with open(path, 'w') as file:
+            json.dump({'interpolation': self.interpolation, 'keyframes': keyframes}, file, indent=1)
+
+    @property
+    def duration(self):
+        """
+        Time of the last keyframe in seconds.
+        """
+        return float(self.times[-1])
+
+    def get(self, time):
+        """
+        Gets the camera's position and orientation on the path.
+        :param time: Time in seconds.
+        :return: The (x, y, z) position, yaw and pitch in degrees.
+        """
+        if self.interpolation == 'linear' or len(self.times) < 2:
+            values = np.array([np.interp(time, self.times, self.values[:, i]) for i in range(self.values.shape[1])])
+        else:
+            last = len(self.times) - 1
+            index = int(np.clip(np.searchsorted(self.times, time, side='right') - 1, 0, last - 1))
+            t = float(np.clip((time - self.times[index]) / (self.times[index + 1] - self.times[index]), 0, 1))
+            values = catmull_rom(*(self.values[min(max(i, 0), last)] for i in range(index - 1, index + 3)), t)
+        return tuple(float(value) for value in values[:3]), float(values[3]), float(values[4])
+
+
+class PathRecorder:
+    """
+    Records the camera's position and orientation every frame, as a path that can be replayed.
+    """
+
+    def __init__(self):
+        self.keyframes = []
+        self.start = None
+
+    def add(self, time, camera):
+        """
+        Adds a keyframe, times are kept relative to the first keyframe.
+        """
+        if self.start is None:
+            self.start = time
+        self.keyframes.append({'time': time - self.start, 'position': list(camera.position), 'yaw': camera.yaw,
+                               'pitch': camera.pitch})
+
+    def save(self, path):
+        if self.keyframes:
+            CameraPath(self.keyframes).save(path)
@@ -0,0 +1,110 @@
+"""
+Spatial subdivision of large meshes into clusters for finer grained culling. Triangles are bucketed into a grid by
+their centroid and reordered so that each cluster is a contiguous range of the index buffer in every level of detail.
+Each cluster keeps its own bounding box, so the renderer can cull clusters and only draw the ranges that are visible.
+"""
+
+import numpy as np
+
+from culling import get_visible
+from mesh import Mesh
+
+# Meshes whose bounding sphere is larger than this (in model units) and that have more triangles than this are split.
+CLUSTER_MIN_RADIUS = 10
+CLUSTER_MIN_TRIANGLES = 1024
+# Number of grid cells along the longest side of the mesh.
+CLUSTER_RESOLUTION = 8
+
+
+def should_cluster(mesh):
+    """
+    Checks if a mesh is big enough to be worth splitting.
+    """
+    return mesh.bounding_sphere[1] > CLUSTER_MIN_RADIUS and mesh.triangle_count > CLUSTER_MIN_TRIANGLES
+
+
+def get_cluster_ids(positions, triangles, origin, cell_size, grid):
+    """
+    Gets the grid cell of each triangle's centroid.
+    :return: A (triangle count,) array of cell ids.
+    """
+    centroids = positions[triangles].mean(axis=1)
+    cells = np.clip(np.floor((centroids - origin) / cell_size).astype(np.int64), 0, np.array(grid) - 1)
+    return np.ravel_multi_index(cells.T, grid)
+
+
+def build_clusters(mesh, resolution=CLUSTER_RESOLUTION):
+    """
+    Splits a mesh into grid clusters. Triangles of every level of detail are sorted by cluster, keeping their order
+    inside a cluster, and empty clusters are dropped.
+    :param mesh: The mesh to split.
+    :param resolution: Number of grid cells along the longest side of the mesh.
+    :return: A mesh with the same triangles, cluster bounds and a (first index, index count) range per level and cluster.
+    """
+    positions = np.asarray(mesh.positions, dtype='f8')
+    origin, extent = mesh.aabb[0], mesh.aabb[1] - mesh.aabb[0]
+    cell_size = max(float(extent.max()), 1e-6) / resolution
+    grid = tuple(np.maximum(np.ceil(extent / cell_size).astype(np.int64), 1))
+
+    parts, lod_ids = [], []
+    for first, count in mesh.lods:
+        triangles = np.asarray(mesh.indices[first:first + count]).reshape(-1, 3)
+        ids = get_cluster_ids(positions, triangles.astype(np.int64), origin, cell_size, grid)
+        order = np.argsort(ids, kind='stable')
+        parts.append(triangles[order].ravel())
+        lod_ids.append(ids[order])
+
+    # Only keep clusters that hold triangles in at least one level.
+    used, remap = np.unique(np.concatenate(lod_ids), return_inverse=True)
+    remap = np.split(remap, np.cumsum([len(ids) for ids in lod_ids])[:-1])
+
+    ranges = np.zeros((len(mesh.lods), len(used), 2), dtype=np.int64)
+    mins = np.full((len(used), 3), np.inf)
+    maxs = np.full((len(used), 3), -np.inf)
+    for level, ((first, _), clusters, indices) in enumerate(zip(mesh.lods, remap, parts)):
+        counts = np.bincount(clusters, minlength=len(used)) * 3
+        ranges[level, :, 0] = first + np.concatenate(([0], np.cumsum(counts)[:-1]))
+        ranges[level, :, 1] = counts
+        corners = positions[indices.astype(np.int64)].reshape(-1, 3, 3)
+        np.minimum.at(mins, clusters, corners.min(axis=1))
+        np.maximum.at(maxs, clusters, corners.max(axis=1))
+
+    return Mesh(mesh.vertices, np.concatenate(parts), mesh.source_vertex_count, mesh.lods, mesh.lod_errors,
+                np.stack([mins, maxs], axis=1).astype('f4'), ranges)
+
+
+def merge_ranges(ranges):
+    """
+    Merges (first, count) ranges that follow each other or overlap into single ranges, so neighbouring visible clusters
+    are drawn with one draw call and no index is drawn twice.
+    :param ranges: A (N, 2) array of ranges sorted by first index.
+    :return: A list of merged (first, count) ranges, empty ranges are dropped.
+    """
+    ranges = np.asarray(ranges).reshape(-1, 2)
+    ranges = ranges[ranges[:, 1] > 0]
+    if len(ranges) == 0:
+        return []
+    # Furthest index reached by each range and the ones before it, a range starting past it starts a new merged range
+    reach = np.maximum.accumulate(ranges[:, 0] + ranges[:, 1])
+    starts = np.ones(len(ranges), dtype=bool)
+    starts[1:] = ranges[1:, 0] > reach[:-1]
+    first = ranges[starts, 0]
+    last = np.append(np.flatnonzero(starts)[1:], len(ranges)) - 1
+    return list(zip(first.tolist(), (reach[last] - first).tolist()))
+
+
+def get_visible_ranges(mesh, level, planes, model_matrix):
+    """
+    Culls the clusters of a mesh against a frustum.
+    :param mesh: A clustered mesh.
+    :param level: The level of detail to draw.
+    :param planes: Frustum planes from get_frustum_planes.
+    :param model_matrix: The model matrix of the object (glm or NumPy).
+    :return: The merged (first, count) ranges of the visible clusters.
+    """
+    mins, maxs = mesh.cluster_bounds[:, 0].astype('f8'), mesh.cluster_bounds[:, 1].astype('f8')
+    centres = (mins + maxs) / 2
+    radii = np.linalg.norm(maxs - mins, axis=1) / 2
+    model_matrices = np.broadcast_to(np.array(model_matrix, dtype='f8'), (len(centres), 4, 4))
+    visible = get_visible(planes, model_matrices, centres, radii, mins, maxs)
+    return merge_ranges(mesh.cluster_ranges[level][visible])
@@ -0,0 +1,94 @@
+"""
+Vectorized frustum culling. Bounding volumes of many objects are tested against the 6 planes of a view frustum at once
+with NumPy, so the cost per object stays small even with thousands of instances.
+"""
+
+import numpy as np
+
+
+def get_frustum_planes(view_projection):
+    """
+    Extracts the planes of a view frustum from a combined projection * view matrix (Gribb/Hartmann method).
+    :param view_projection: A 4x4 matrix (glm or NumPy).
+    :return: A (6, 4) array of normalised planes (a, b, c, d), with the normals pointing into the frustum. The order is
+    left, right, bottom, top, near, far.
+    """
+    m = np.array(view_projection, dtype='f8')
+    planes = np.array([m[3] + m[0], m[3] - m[0], m[3] + m[1], m[3] - m[1], m[3] + m[2], m[3] - m[2]])
+    return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+
+def transform_spheres(centres, radii, model_matrices):
+    """
+    Moves bounding spheres from model space to world space.
+    :param centres: A (N, 3) array of sphere centres.
+    :param radii: A (N,) array of sphere radii.
+    :param model_matrices: A (N, 4, 4) array of model matrices.
+    :return: The world space centres and radii, radii are scaled by the largest scale of each matrix.
+    """
+    world_centres = np.einsum('nij,nj->ni', model_matrices[:, :3, :3], centres) + model_matrices[:, :3, 3]
+    scales = np.linalg.norm(model_matrices[:, :3, :3], axis=1).max(axis=1)
+    return world_centres, radii * scales
+
+
+def transform_boxes(mins, maxs, model_matrices):
+    """
+    Moves axis aligned bounding boxes (AABBs) from model space to world space, the result is the AABB of each
+    transformed box.
+    :param mins: A (N, 3) array of the box minimums.
+    :param maxs: A (N, 3) array of the box maximums.
+    :param model_matrices: A (N, 4, 4) array of model matrices.
+    :return: The world space centres and half extents of the boxes.
+    """
+    centres = (mins + maxs) / 2
+    extents = (maxs - mins) / 2
+    world_centres = np.einsum('nij,nj->ni', model_matrices[:, :3, :3], centres) + model_matrices[:, :3, 3]
+    world_extents = np.einsum('nij,nj->ni', np.abs(model_matrices[:, :3, :3]), extents)
+    return world_centres, world_extents
+
+
+def spheres_in_frustum(planes, centres, radii):
+    """
+    Tests spheres against a frustum.
+    :return: A (N,) boolean array, True for spheres that are at least partly inside.
+    """
+    distances = centres @ planes[:, :3].T + planes[:, 3]
+    return (distances >= -radii[:, None]).all(axis=1)
+
+
+def boxes_in_frustum(planes, centres, extents):
+    """
+    Tests boxes (given as centres and half extents) against a frustum.
+    :return: A (N,) boolean array, True for boxes that are at least partly inside.
+    """
+    distances = centres @ planes[:, :3].T + planes[:, 3]
+    reach = extents @ np.abs(planes[:, :3]).T
+    return (distances >= -reach).all(axis=1)
+
+
+def get_visible(planes, model_matrices, centres, radii, mins, maxs):
+    """
+    Tests model space bounding volumes against a frustum, first with the cheaper sphere test, then with the tighter
+    box test.
+    :param planes: Frustum planes from get_frustum_planes.
+    :param model_matrices: A (N, 4, 4) array of model matrices.
+    :return: A (N,) boolean array, True for visible objects.
+    """
+    visible = spheres_in_frustum(planes, *transform_spheres(centres, radii, model_matrices))
+    if visible.any():
+        boxes = transform_boxes(mins[visible], maxs[visible], model_matrices[visible])
+        visible[visible] = boxes_in_frustum(planes, *boxes)
+    return visible
+
+
+class CullingStats:
+    """
+    Per-frame counters of how many objects a pass drew and culled.
+    """
+
+    def __init__(self):
+        self.drawn = 0
+        self.culled = 0
+
+    def __repr__(self):
+        return f'drawn={self.drawn} culled={self.culled}'
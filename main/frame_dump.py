@@ -0,0 +1,108 @@
+"""
+Streams rendered frames to disk, either as a numbered PNG per frame or as one raw RGB24 video stream (which ffmpeg reads
+with -f rawvideo -pix_fmt rgb24 -s WIDTHxHEIGHT). Frames are read back through two pixel buffer objects (PBOs) used in
+turn: each frame is copied into one PBO without waiting for the GPU, and the other PBO, which holds the previous frame
+and has had a whole frame to finish, is read back. Encoding and writing run on a worker thread, off the GL thread.
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pygame as pg
+
+FRAME_FORMATS = ('png', 'raw')
+# Number of PBOs frames are read back through, a frame is collected this many frames minus one after it is rendered.
+PBO_COUNT = 2
+# Number of frames that may wait for the writer thread before rendering waits for it, bounds the memory they take.
+MAX_QUEUED_FRAMES = 8
+
+
+class FrameDumper:
+    def __init__(self, ctx, framebuffer, output, frame_format='png'):
+        """
+        :param framebuffer: The framebuffer frames are read from.
+        :param output: Folder for PNG frames, or file for the raw stream ('-' for stdout, eg. to pipe into ffmpeg).
+        :param frame_format: One of FRAME_FORMATS.
+        """
+        if frame_format not in FRAME_FORMATS:
+            raise ValueError(f'Unknown frame format {frame_format}, expected one of {FRAME_FORMATS}')
+        self.framebuffer = framebuffer
+        self.size = framebuffer.size
+        self.output = output
+        self.frame_format = frame_format
+        width, height = self.size
+        self.buffers = [ctx.buffer(reserve=width * height * 3) for _ in range(PBO_COUNT)]
+        # Frame number held in each PBO, None while a PBO is empty.
+        self.pending = [None] * PBO_COUNT
+        self.frame = 0
+        self.writer = ThreadPoolExecutor(max_workers=1)
+        self.writes = []
+        # Time the GL thread spent reading frames back.
+        self.read_time = 0
+
+        if frame_format == 'png':
+            os.makedirs(output, exist_ok=True)
+            self.file = None
+        else:
+            self.file = sys.__stdout__.buffer if output == '-' else open(output, 'wb')
+
+    def capture(self):
+        """
+        Starts reading back the frame just rendered, and collects the oldest frame still in a PBO.
+        """
+        start = time.perf_counter()
+        index = self.frame % PBO_COUNT
+        self.framebuffer.read_into(self.buffers[index], components=3)
+        self.pending[index] = self.frame
+        self.frame += 1
+        self.collect(self.frame % PBO_COUNT)
+        self.read_time += time.perf_counter() - start
+
+    def collect(self, index):
+        """
+        Reads a PBO's frame back to the CPU and hands it to the writer thread.
+        """
+        frame = self.pending[index]
+        if frame is None:
+            return
+        self.pending[index] = None
+        data = self.buffers[index].read()
+        self.writes = [write for write in self.writes if not write.done()]
+        if len(self.writes) >= MAX_QUEUED_FRAMES:
+            self.writes.pop(0).result()
+        self.writes.append(self.writer.submit(self.write, frame, data))
+
+    def write(self, frame, data):
+        """
+        Writes one frame, runs on the writer thread. OpenGL rows start at the bottom, so the frame is flipped.
+        """
+        width, height = self.size
+        pixels = np.frombuffer(data, dtype='u1').reshape(height, width, 3)[::-1]
+        if self.frame_format == 'png':
+            image = pg.image.frombuffer(np.ascontiguousarray(pixels).tobytes(), self.size, 'RGB')
+            pg.image.save(image, os.path.join(self.output, f'frame_{frame:05d}.png'))
+        else:
+            self.file.write(pixels.tobytes())
+
+    def finish(self):
+        """
+        Collects the frames still in the PBOs and waits for every frame to be written.
+        """
+        for offset in range(PBO_COUNT):
+            self.collect((self.frame + offset) % PBO_COUNT)
+        for write in self.writes:
+            write.result()
+        self.writer.shutdown()
+        if self.file is not None and self.file is not sys.__stdout__.buffer:
+            self.file.close()
+
+    def report(self):
+        return (f'{self.frame} frames written to {self.output} as {self.frame_format}, '
+                f'{self.read_time / max(self.frame, 1) * 1000:.2f} ms per frame read back on the GL thread')
+
+    def destroy(self):
+        for buffer in self.buffers:
+            buffer.release()
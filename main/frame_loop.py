@@ -0,0 +1,49 @@
+"""
+Timing of the windowed run loop. The simulation (camera movement, scripted paths and scene animations) advances in fixed
+steps of 1 / TICK_RATE seconds, however long each frame takes, so a slow frame makes the simulation catch up with
+several steps instead of one long jump. Frames render the state interpolated between the last two steps. Frames can be
+capped to a rate, or left uncapped (with vsync off) for benchmarking.
+"""
+
+# Simulation steps per second, and the most steps run for one frame. A frame slower than MAX_TICKS_PER_FRAME steps
+# drops the rest of its time, so the simulation slows down instead of falling further behind each frame.
+TICK_RATE = 60
+MAX_TICKS_PER_FRAME = 5
+# Frames per second the loop is capped to, 0 for uncapped.
+FRAME_CAP = 60
+
+
+class FixedTimestep:
+    """
+    Accumulates frame time and hands it out as fixed simulation steps.
+    """
+
+    def __init__(self, tick_rate=TICK_RATE, max_ticks=MAX_TICKS_PER_FRAME):
+        self.timestep = 1 / tick_rate
+        self.max_ticks = max_ticks
+        # Time not yet simulated, always less than one step after advance
+        self.accumulator = 0.0
+
+    @property
+    def alpha(self):
+        """
+        How far the frame is between the last two steps, 0 at the previous step and 1 at the last.
+        """
+        return min(self.accumulator / self.timestep, 1.0)
+
+    def advance(self, frame_time):
+        """
+        Adds a frame's time to the accumulator.
+        :param frame_time: Time the last frame took in seconds.
+        :return: Number of steps the simulation has to run.
+        """
+        self.accumulator += frame_time
+        # The small epsilon stops a frame of exactly one step from being rounded down to none
+        ticks = int(self.accumulator / self.timestep + 1e-9)
+        if ticks > self.max_ticks:
+            ticks = self.max_ticks
+            self.accumulator = 0.0
+        else:
+            self.accumulator = max(self.accumulator - ticks * self.timestep, 0.0)
+        return ticks
+
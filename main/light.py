@@ -4,9 +4,16 @@ Class that sets necessary parameters for Phong lighting
 
 import glm
 
+from camera import FAR
+from shadows import CASCADE_COUNT
+
 
 class Light:
-    def __init__(self, position=(50, 50, -10), colour=(1, 1, 1)):
+    def __init__(self, position=(50, 50, -10), colour=(1, 1, 1), uniforms=None):
+        """
+        :param uniforms: The app's uniform buffers, the light's uniform buffer is written whenever the light changes.
+        """
+        self.uniforms = uniforms
         self.position = glm.vec3(position)
         self.colour = glm.vec3(colour)
         self.direction = (0, 0, 0)
@@ -17,6 +24,25 @@ class Light:
         self.intensity_specular = 1 * self.colour  # specular
 
         self.view_matrix_light = self.get_view_matrix()
+        # Light view projection matrix and far distance of each shadow cascade, fitted by the renderer's shadow map.
+        self.cascade_matrices = [glm.mat4() for _ in range(CASCADE_COUNT)]
+        self.cascade_splits = [FAR] * CASCADE_COUNT
+        self.write_uniforms()
+
+    def set_position(self, position):
+        """
+        Moves the light and updates its uniform buffer.
+        """
+        self.position = glm.vec3(position)
+        self.view_matrix_light = self.get_view_matrix()
+        self.write_uniforms()
+
+    def write_uniforms(self):
+        """
+        Writes the light's matrices and intensities to its uniform buffer.
+        """
+        if self.uniforms is not None:
+            self.uniforms.write_light(self)
 
     def get_view_matrix(self):
         """
@@ -0,0 +1,133 @@
+"""
+Class that loads scene assets in parallel. Textures are decoded and meshes are read on a pool of workers, and the
+finished CPU-side data is handed back to the GL thread which only does the GPU uploads.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from texture_cache import load_texture_data
+from mesh_cache import load_mesh
+from vbo import ObjVBO
+
+# Name the texture array is stored under when the scene's textures are packed into one.
+TEXTURE_ARRAY_NAME = 'texture_array'
+
+
+def decode_texture(path):
+    """
+    Worker job that loads the mip chain of a texture file from the texture cache, decoding it on a cache miss.
+    :return: The TextureData and the time taken in seconds.
+    """
+    start = time.perf_counter()
+    data = load_texture_data(path)
+    return data, time.perf_counter() - start
+
+
+def read_mesh(file, optimise=False, copy=False):
+    """
+    Worker job that reads the indexed mesh of an obj file.
+    :param optimise: Read the mesh optimised for the vertex cache.
+    :param copy: Copies the memory-mapped data into memory, needed when the result is sent back from another process.
+    :return: The mesh and the time taken in seconds.
+    """
+    start = time.perf_counter()
+    mesh = load_mesh(file, optimise)
+    if copy:
+        mesh = mesh.copy()
+    return mesh, time.perf_counter() - start
+
+
+class AssetLoader:
+    """
+    Loads assets on a thread (or process) pool and uploads them to the GPU in the order they were requested.
+    """
+
+    def __init__(self, app, workers=None, use_processes=False, optimise_meshes=False, use_texture_array=False):
+        """
+        :param app: Previously created graphical engine
+        :param workers: Number of workers, defaults to the executor's own default.
+        :param use_processes: Use a process pool instead of a thread pool.
+        :param optimise_meshes: Load meshes optimised for the vertex cache.
+        :param use_texture_array: Pack the textures of every object into the layers of one texture array.
+        """
+        self.app = app
+        self.use_processes = use_processes
+        self.optimise_meshes = optimise_meshes
+        self.use_texture_array = use_texture_array
+        self.texture_array_time = 0
+        executor = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        self.executor = executor(max_workers=workers)
+        self.pending = []
+        self.texture_jobs = {}
+        self.timings = {}
+        self.meshes = {}
+
+    def get_texture_job(self, path):
+        """
+        Gets the decode job for a texture file, textures used by several objects are only decoded once.
+        """
+        if path not in self.texture_jobs:
+            self.texture_jobs[path] = self.executor.submit(decode_texture, path)
+        return self.texture_jobs[path]
+
+    def load_object(self, name, obj_file, texture_file, callback=None):
+        """
+        Starts loading the mesh and texture of an object in the background.
+        :param name: The name the VBO and texture are stored under.
+        :param callback: Called on the GL thread once the object's VBO and texture have been uploaded.
+        """
+        texture_job = self.get_texture_job(texture_file)
+        mesh_job = self.executor.submit(read_mesh, obj_file, self.optimise_meshes, self.use_processes)
+        self.pending.append((name, obj_file, texture_file, texture_job, mesh_job, callback))
+
+    def finish(self):
+        """
+        Waits for the workers and uploads every pending asset, in the order they were requested. With a texture array,
+        every texture is packed and uploaded first, as the array needs all of them.
+        """
+        link = self.app.link
+        if self.use_texture_array and self.pending:
+            textures = {name: texture_job.result()[0] for name, _, _, texture_job, _, _ in self.pending}
+            start = time.perf_counter()
+            with self.app.resources.owner(TEXTURE_ARRAY_NAME):
+                link.texture.add_texture_array(TEXTURE_ARRAY_NAME, textures)
+            self.texture_array_time = time.perf_counter() - start
+
+        for name, obj_file, texture_file, texture_job, mesh_job, callback in self.pending:
+            texture_data, decode_time = texture_job.result()
+            mesh, read_time = mesh_job.result()
+
+            # The object's GPU resources are accounted to it
+            with self.app.resources.owner(name):
+                start = time.perf_counter()
+                if not self.use_texture_array:
+                    link.texture.add_texture(texture_file, name, data=texture_data)
+                vbo = ObjVBO(self.app.ctx, file=obj_file, mesh=mesh, optimise=self.optimise_meshes)
+                link.vao.vbo.add_vbo(vbo, name)
+                upload_time = time.perf_counter() - start
+
+                self.timings[name] = {'texture_decode': decode_time, 'mesh_read': read_time, 'upload': upload_time}
+                self.meshes[name] = mesh
+                if callback is not None:
+                    callback()
+
+        self.pending.clear()
+        self.texture_jobs.clear()
+        self.executor.shutdown()
+
+    def report(self):
+        """
+        Creates a report of the per asset load timings, slowest asset first, and of how much each mesh was shrunk by
+        vertex deduplication.
+        :return: The report as a string.
+        """
+        lines = [f"{'asset':<10} {'decode ms':>10} {'mesh ms':>10} {'upload ms':>10} {'vertices':>10} {'dedup':>7}"]
+        for name, timing in sorted(self.timings.items(), key=lambda item: -sum(item[1].values())):
+            mesh = self.meshes[name]
+            lines.append(f"{name:<10} {timing['texture_decode'] * 1000:>10.1f} {timing['mesh_read'] * 1000:>10.1f} "
+                         f"{timing['upload'] * 1000:>10.1f} {mesh.vertex_count:>10} {mesh.dedup_ratio:>6.2f}x")
+        if self.use_texture_array:
+            lines.append(f'Texture array packed and uploaded in {self.texture_array_time * 1000:.1f} ms')
+        lines.append(self.app.link.texture.report())
+        return '\n'.join(lines)
@@ -0,0 +1,170 @@
+"""
+Level of detail (LOD) generation and selection. Meshes are decimated on the CPU with quadric error vertex clustering
+(Lindstrom 2000): vertices are grouped into grid cells, and each cell collapses onto the vertex with the smallest error
+against the summed plane quadrics of the cell. Since every LOD reuses vertices of the full mesh, all levels share one
+vertex buffer and only differ by their range of the index buffer.
+"""
+
+import numpy as np
+
+from mesh import Mesh
+
+# Fraction of the full mesh's triangles each extra LOD level aims for.
+LOD_RATIOS = (0.5, 0.25, 0.1)
+# Projected size (fraction of the screen height covered by the bounding sphere) below which each level switches to the
+# next coarser one, and how far past a threshold the size has to go before switching, to stop levels flickering.
+LOD_SCREEN_SIZES = (0.5, 0.25, 0.1)
+LOD_HYSTERESIS = 0.1
+# How many levels coarser the shadow pass is drawn than the main pass.
+SHADOW_LOD_BIAS = 1
+# Finest grid the decimator searches, in cells along the longest side of the mesh.
+MAX_RESOLUTION = 1024
+
+
+def get_vertex_quadrics(positions, triangles):
+    """
+    Sums the area weighted plane quadrics of the triangles around each vertex.
+    :param positions: A (vertex count, 3) array of vertex positions.
+    :param triangles: A (triangle count, 3) array of vertex indices.
+    :return: A (vertex count, 4, 4) array of quadrics.
+    """
+    corners = positions[triangles]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    valid = lengths > 0
+    normals = normals[valid] / lengths[valid, None]
+    planes = np.concatenate([normals, -np.einsum('ij,ij->i', normals, corners[valid, 0])[:, None]], axis=1)
+    quadrics = (lengths[valid] / 2)[:, None, None] * planes[:, :, None] * planes[:, None, :]
+
+    # Each triangle's quadric is added to its 3 vertices, bincount is much faster than np.add.at for this.
+    vertex_ids = triangles[valid].T.ravel()
+    weights = np.tile(quadrics.reshape(-1, 16), (3, 1))
+    summed = [np.bincount(vertex_ids, weights=weights[:, i], minlength=len(positions)) for i in range(16)]
+    return np.stack(summed, axis=1).reshape(-1, 4, 4)
+
+
+def simplify(positions, indices, cell_size, quadrics=None):
+    """
+    Decimates a mesh by clustering its vertices on a grid.
+    :param positions: A (vertex count, 3) array of vertex positions.
+    :param indices: The index buffer, 3 indices per triangle.
+    :param cell_size: Size of the grid cells, bigger cells remove more triangles.
+    :param quadrics: Vertex quadrics from get_vertex_quadrics, calculated if None.
+    :return: The simplified index buffer (into the same vertices) and the largest distance any vertex was moved, which
+    is never more than the cell diagonal.
+    """
+    positions = np.asarray(positions, dtype='f8')
+    triangles = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+    if quadrics is None:
+        quadrics = get_vertex_quadrics(positions, triangles)
+
+    cells = np.floor((positions - positions.min(axis=0)) / cell_size).astype(np.int64)
+    _, clusters = np.unique(cells, axis=0, return_inverse=True)
+    clusters = clusters.ravel()
+    cluster_count = clusters.max() + 1
+
+    # Quadric of each cluster, then the error of every vertex against the quadric of its cluster.
+    cluster_quadrics = np.stack([np.bincount(clusters, weights=quadrics.reshape(-1, 16)[:, i],
+                                             minlength=cluster_count) for i in range(16)], axis=1).reshape(-1, 4, 4)
+    homogeneous = np.concatenate([positions, np.ones((len(positions), 1))], axis=1)
+    errors = np.einsum('vi,vij,vj->v', homogeneous, cluster_quadrics[clusters], homogeneous)
+
+    # The vertex with the smallest error represents its cluster.
+    order = np.lexsort((errors, clusters))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = clusters[order][1:] != clusters[order][:-1]
+    representative = np.empty(cluster_count, dtype=np.int64)
+    representative[clusters[order][first]] = order[first]
+
+    collapsed = representative[clusters]
+    simplified = collapsed[triangles]
+    simplified = simplified[(simplified[:, 0] != simplified[:, 1]) & (simplified[:, 1] != simplified[:, 2]) &
+                            (simplified[:, 0] != simplified[:, 2])]
+    # Remove triangles that collapsed onto the same vertices, keeping the original order of the others.
+    if len(simplified):
+        _, unique = np.unique(simplified, axis=0, return_index=True)
+        simplified = simplified[np.sort(unique)]
+
+    used = np.unique(triangles)
+    max_error = np.linalg.norm(positions[used] - positions[collapsed[used]], axis=1).max() if len(used) else 0.0
+    return simplified.ravel().astype(indices.dtype), float(max_error)
+
+
+def build_lod(positions, indices, target, quadrics=None):
+    """
+    Searches for the finest grid that brings a mesh down to a target number of triangles.
+    :return: The simplified index buffer and its error, or None if the mesh cannot be simplified to the target.
+    """
+    extent = float((positions.max(axis=0) - positions.min(axis=0)).max())
+    if extent == 0:
+        return None
+
+    best = None
+    low, high = 1, MAX_RESOLUTION
+    while low <= high:
+        resolution = (low + high) // 2
+        lod = simplify(positions, indices, extent / resolution, quadrics)
+        if len(lod[0]) // 3 <= target:
+            best = lod
+            low = resolution + 1
+        else:
+            high = resolution - 1
+    return best
+
+
+def generate_lods(mesh, ratios=LOD_RATIOS):
+    """
+    Generates the LOD chain of a mesh. The levels are appended to the mesh's index buffer.
+    :param mesh: A mesh with a single level.
+    :param ratios: Fraction of the full mesh's triangles each extra level aims for.
+    :return: A mesh with the full level followed by each level that could be generated.
+    """
+    positions = np.asarray(mesh.vertices[:, -3:], dtype='f8')
+    indices = np.asarray(mesh.indices)
+    quadrics = get_vertex_quadrics(positions, indices.astype(np.int64).reshape(-1, 3))
+
+    parts, lods, errors = [indices], [(0, len(indices))], [0.0]
+    for ratio in ratios:
+        lod = build_lod(positions, indices, int(mesh.triangle_count * ratio), quadrics)
+        if lod is None or len(lod[0]) == 0 or len(lod[0]) >= lods[-1][1]:
+            break
+        lods.append((lods[-1][0] + lods[-1][1], len(lod[0])))
+        errors.append(lod[1])
+        parts.append(lod[0])
+    return Mesh(mesh.vertices, np.concatenate(parts), mesh.source_vertex_count, lods, errors)
+
+
+def get_screen_size(radius, distance, fov):
+    """
+    Gets the fraction of the screen height covered by a bounding sphere.
+    :param radius: Radius of the sphere.
+    :param distance: Distance from the camera to the centre of the sphere.
+    :param fov: Vertical field of view in radians.
+    """
+    if distance <= radius:
+        return float('inf')
+    return radius / (distance * np.tan(fov / 2))
+
+
+class LodSelector:
+    """
+    Picks a LOD level from the projected size of an object, with hysteresis so the level doesn't flicker when the size
+    sits near a threshold.
+    """
+
+    def __init__(self, level_count, screen_sizes=LOD_SCREEN_SIZES, hysteresis=LOD_HYSTERESIS):
+        self.level_count = level_count
+        self.screen_sizes = screen_sizes[:level_count - 1]
+        self.hysteresis = hysteresis
+        self.level = 0
+
+    def select(self, screen_size):
+        """
+        Updates and returns the level for the object's current projected size.
+        """
+        while self.level < len(self.screen_sizes) and \
+                screen_size < self.screen_sizes[self.level] * (1 - self.hysteresis):
+            self.level += 1
+        while self.level > 0 and screen_size > self.screen_sizes[self.level - 1] * (1 + self.hysteresis):
+            self.level -= 1
+        return self.level
@@ -1,50 +1,126 @@
 """
-Main class for setting up the graphics engine and calling render methods.
+Main class for setting up the graphics engine and calling render methods. Running this file opens the scene in a
+window, or with --headless renders it offscreen along a scripted camera path and streams the frames to disk. In a
+window the simulation runs at a fixed timestep (frame_loop.py) and frames are rendered in between its steps.
 """
 
+import argparse
+import os
 import moderngl as mgl
 import sys
 
+# pygame prints a banner when imported, which would end up in a raw video stream on stdout
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
 from renderer import Renderer
 from scene import Scene
 from model import *
 from camera import Camera
 from light import Light
 from link import Link
+from transform import TransformStore
+from uniforms import UniformBuffers
+from camera_path import CameraPath, PathRecorder
+from frame_dump import FrameDumper, FRAME_FORMATS
+from profiler import Profiler, PROFILER_ENABLED
+from overlay import Overlay
+from frame_loop import FixedTimestep, FRAME_CAP
+from render_target import RenderTarget, DynamicResolution, FRAME_BUDGET_MS, UPSCALE_FILTERS
+from scene_manifest import SCENE_MANIFEST
+from streaming import STREAMING_BUDGET
+from resources import ResourceRegistry
 import pygame as pg
 
+# Backend of the standalone context used in headless mode, EGL works without a display (with Mesa's software
+# rasteriser when there is no GPU).
+HEADLESS_BACKEND = 'egl'
+# Frame rate of the scene's clock in headless mode, frames are rendered as fast as possible but timed as at this rate.
+HEADLESS_FPS = 60
+
 
 class GraphicsEngine:
-    def __init__(self, win_size=(1600, 900)):
+    def __init__(self, win_size=(1600, 900), headless=False, camera_path=None, record_path=None,
+                 profile=PROFILER_ENABLED, trace_path=None, vsync=False, render_scale=1.0, upscale_filter='bilinear',
+                 manifest=SCENE_MANIFEST, stream_budget=STREAMING_BUDGET):
         """
         Initiated the graphics engine with a pygame instance and all the parameters required to render the scene.
+        :param headless: Renders into an offscreen framebuffer of a standalone context instead of a window, so no
+        display is needed.
+        :param camera_path: A CameraPath the camera follows instead of mouse and keyboard input.
+        :param record_path: JSON file the camera's path is recorded to, saved when the engine is destroyed.
+        :param profile: Whether the profiler times each stage of the frame.
+        :param trace_path: JSON file a Chrome trace of the frames is written to when the engine is destroyed, enables
+        the profiler.
+        :param vsync: Whether the window waits for the display's refresh to swap buffers.
+        :param render_scale: Resolution the scene is rendered at, relative to the window or frame size.
+        :param upscale_filter: One of UPSCALE_FILTERS, the filter the scene is upscaled with when rendered at a lower
+        resolution.
+        :param manifest: The scene manifest the scene's objects are loaded from.
+        :param stream_budget: GPU bytes the objects streamed in around the camera may take.
         """
+        self.headless = headless
+        if headless:
+            # pygame is still used to load images, its dummy video driver needs no display.
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+
         # Initiate pygame modules
         pg.init()
-
-        # Set openGL attributes
         self.WIN_SIZE = win_size
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_MAJOR_VERSION, 3)
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_MINOR_VERSION, 3)
-        pg.display.gl_set_attribute(pg.GL_CONTEXT_PROFILE_MASK, pg.GL_CONTEXT_PROFILE_CORE)
-
-        # Creating opengl content - DOUBLEBUF = 2 complete colour buffers for drawing (used for optimisation)
-        pg.display.set_mode(self.WIN_SIZE, flags=pg.OPENGL | pg.DOUBLEBUF)
-        self.ctx = mgl.create_context()
-        self.camera = Camera(self)
+
+        # Records every GPU object the context creates, with its owner and size
+        self.resources = ResourceRegistry()
+        if headless:
+            self.ctx = self.resources.wrap(mgl.create_standalone_context(require=330, backend=HEADLESS_BACKEND))
+            self.framebuffer = self.ctx.framebuffer(color_attachments=[self.ctx.renderbuffer(self.WIN_SIZE)],
+                                                    depth_attachment=self.ctx.depth_renderbuffer(self.WIN_SIZE))
+        else:
+            # Set openGL attributes
+            pg.display.gl_set_attribute(pg.GL_CONTEXT_MAJOR_VERSION, 3)
+            pg.display.gl_set_attribute(pg.GL_CONTEXT_MINOR_VERSION, 3)
+            pg.display.gl_set_attribute(pg.GL_CONTEXT_PROFILE_MASK, pg.GL_CONTEXT_PROFILE_CORE)
+
+            # Creating opengl content - DOUBLEBUF = 2 complete colour buffers for drawing (used for optimisation)
+            pg.display.set_mode(self.WIN_SIZE, flags=pg.OPENGL | pg.DOUBLEBUF, vsync=int(vsync))
+            self.ctx = self.resources.wrap(mgl.create_context())
+            self.framebuffer = self.ctx.screen
+        # Framebuffer frames are output to, the window or the offscreen framebuffer
+        self.framebuffer.use()
+        # Framebuffer the scene is rendered into, the output or a lower resolution render target upscaled into it
+        self.scene_framebuffer = self.framebuffer
+        self.render_target = None
+        if upscale_filter not in UPSCALE_FILTERS:
+            raise ValueError(f'Unknown upscale filter {upscale_filter}, expected one of {UPSCALE_FILTERS}')
+        self.upscale_filter = upscale_filter
+
+        # Times the stages of each frame, on the CPU and with GPU timer queries
+        self.profiler = Profiler(self.ctx, enabled=profile or trace_path is not None)
+        self.profiler.tracing = trace_path is not None
+        self.trace_path = trace_path
+
+        # Camera and light data shared by every shader
+        self.uniforms = UniformBuffers(self.ctx)
+        self.camera = Camera(self, path=camera_path)
         self.link = Link(self)
+        # Positions, rotations and scales of every model, their matrices are rebuilt in one batch when they change
+        self.transforms = TransformStore()
 
         # Mouse settings
-        pg.event.set_grab(True)
-        pg.mouse.set_visible(False)
+        if not headless:
+            pg.event.set_grab(True)
+            pg.mouse.set_visible(False)
 
         # Implementing time
         self.clock = pg.time.Clock()
         self.time = 0
         self.delta_time = 0
+        self.frame = 0
+        # Where the frame is between the last two simulation steps
+        self.alpha = 1.0
+        self.record_path = record_path
+        self.path_recorder = PathRecorder() if record_path else None
 
         # Load phong lighting class
-        self.light = Light()
+        self.light = Light(uniforms=self.uniforms)
 
         # Ensuring fragments show in the correct order of depth and culls faces that don't need to be rendered.
         self.ctx.clear(0.9, 0.9, 0.9)
@@ -52,51 +128,216 @@ class GraphicsEngine:
         self.ctx.blend_func = mgl.SRC_ALPHA, mgl.ONE_MINUS_SRC_ALPHA
 
         # Load and render the scene
-        self.scene = Scene(self)
+        self.stream_budget = stream_budget
+        self.scene = Scene(self, manifest)
         self.scene_renderer = Renderer(self)
+        # Milliseconds per stage drawn over the frame, toggled with F3
+        self.overlay = Overlay(self, self.profiler)
+        self.set_render_scale(render_scale)
+        print(self.link.vao.shaders.report())
 
     def check_events(self):
         """
-        Checks if the program needs to quit.
+        Checks if the program needs to quit, and toggles the profiler overlay with F3, occlusion culling with F4, the
+        depth pre-pass with F5 and the overdraw view with F6.
         """
         for event in pg.event.get():
             if event.type == pg.QUIT or (event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE):
-                self.link.destroy()
-                self.scene_renderer.destroy()
-                pg.quit()
+                self.destroy()
                 sys.exit()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F3:
+                self.overlay.enabled = not self.overlay.enabled
+                self.profiler.enabled = self.profiler.enabled or self.overlay.enabled
+            if event.type == pg.KEYDOWN and event.key == pg.K_F4:
+                self.scene_renderer.occlusion_culling = not self.scene_renderer.occlusion_culling
+            if event.type == pg.KEYDOWN and event.key == pg.K_F5:
+                self.scene_renderer.depth_prepass = not self.scene_renderer.depth_prepass
+            if event.type == pg.KEYDOWN and event.key == pg.K_F6:
+                self.scene_renderer.overdraw = not self.scene_renderer.overdraw
+
+    def destroy(self):
+        """
+        Prints the last frame's report and releases every resource.
+        """
+        print(self.scene_renderer.report())
+        print(self.scene.streaming.report())
+        if self.render_target is not None:
+            print(self.render_target)
+        if self.profiler.enabled:
+            print(self.profiler.report())
+        print(self.resources.report())
+        if self.trace_path is not None:
+            self.profiler.export_trace(self.trace_path)
+        if self.path_recorder is not None:
+            self.path_recorder.save(self.record_path)
+        self.scene.destroy()
+        self.link.destroy()
+        self.scene_renderer.destroy()
+        self.set_render_scale(1.0)
+        self.overlay.destroy()
+        self.profiler.destroy()
+        self.uniforms.destroy()
+        if self.headless:
+            for attachment in (*self.framebuffer.color_attachments, self.framebuffer.depth_attachment):
+                attachment.release()
+            self.framebuffer.release()
+        print(self.resources.report_leaks())
+        pg.quit()
 
-    def render(self):
+    def set_render_scale(self, scale):
+        """
+        Sets the resolution the scene is rendered at, relative to the output. Below 1 the scene is rendered into a
+        render target and upscaled.
         """
-        Method for re rendering the scene - called in "run" 60x per second.
+        if scale >= 1:
+            if self.render_target is not None:
+                self.render_target.destroy()
+                self.render_target = None
+            self.scene_framebuffer = self.framebuffer
+            return
+        if self.render_target is None:
+            defines = [] if self.upscale_filter == 'bilinear' else ['SHARPEN']
+            program = self.link.vao.shaders.get_program('upscale', defines)
+            self.render_target = RenderTarget(self.ctx, program, self.framebuffer, scale)
+        self.render_target.resize(scale)
+        self.scene_framebuffer = self.render_target.framebuffer
+
+    def tick(self):
         """
+        Advances the simulation by one step: moves the camera and animates the scene at the current time.
+        """
+        with self.profiler.scope('simulation', gpu=False):
+            self.transforms.begin_tick()
+            self.camera.tick()
+            self.scene.update()
+            if self.path_recorder is not None:
+                self.path_recorder.add(self.time, self.camera)
+
+    def render(self, alpha=1.0):
+        """
+        Method for re rendering the scene - called in "run" once per frame.
+        :param alpha: Where the frame is between the last two simulation steps, 0 at the previous step and 1 at the
+        last.
+        """
+        self.profiler.begin_frame()
+        self.alpha = alpha
+        self.camera.interpolate(alpha)
         # Clear framebuffer
-        self.ctx.clear(color=(0.08, 0.16, 0.18))
+        self.scene_framebuffer.use()
+        self.scene_framebuffer.clear(color=(0.08, 0.16, 0.18))
 
         # Render scene
         self.scene_renderer.render()
+        if self.render_target is not None:
+            with self.profiler.scope('upscale'):
+                self.render_target.upscale()
+        self.overlay.render()
+        self.profiler.end_frame()
+        self.uniforms.stats.end_frame()
+        self.scene_renderer.queue.stats.end_frame()
+        self.resources.collect(self.frame)
 
         # Swap buffers
-        pg.display.flip()
+        if not self.headless:
+            pg.display.flip()
+        self.frame += 1
 
-    def get_time(self):
+    def run(self, frame_cap=FRAME_CAP, budget_ms=None):
         """
-        Gets time in seconds
+        The run loop. Each frame runs as many fixed simulation steps as the last frame took, then renders the scene in
+        between the last two steps.
+        :param frame_cap: Frames per second the loop is capped to, 0 for uncapped.
+        :param budget_ms: Frame time budget in milliseconds, the resolution is adapted to keep frames within it. None
+        keeps the render scale the engine was created with.
         """
-        self.time = pg.time.get_ticks() * 0.001
+        timestep = FixedTimestep()
+        dynamic_resolution = DynamicResolution(budget_ms) if budget_ms else None
+        # Movement is scaled by the length of a simulation step, not by the length of a frame
+        self.delta_time = timestep.timestep * 1000
+        self.clock.tick()
+        frame_time = 0
+        while True:
+            self.check_events()
+            for _ in range(timestep.advance(frame_time)):
+                self.time += timestep.timestep
+                self.tick()
+            self.render(timestep.alpha)
+            frame_time = self.clock.tick(frame_cap) * 0.001
+            if dynamic_resolution is not None:
+                # Time the frame took to render, without the time waited for the frame cap
+                self.set_render_scale(dynamic_resolution.update(self.clock.get_rawtime()))
 
-    def run(self):
+    def run_headless(self, frame_count, frame_dumper=None):
         """
-        The run loop which calls methods to re-render the scene 60x per second.
+        Renders a fixed number of frames without a window or user input, eg. on a build server.
+        :param frame_count: Number of frames to render.
+        :param frame_dumper: A FrameDumper the frames are streamed to, None to only render them.
         """
-        while True:
-            self.get_time()
-            self.check_events()
-            self.camera.update()
+        self.delta_time = 1000 / HEADLESS_FPS
+        for _ in range(frame_count):
+            # One simulation step per frame, time advances by one HEADLESS_FPS frame per frame rendered so runs are
+            # repeatable however long each frame takes
+            self.time = self.frame / HEADLESS_FPS
+            self.tick()
             self.render()
-            # Setting frame rate to 60Hz
-            self.delta_time = self.clock.tick(60)
+            if frame_dumper is not None:
+                frame_dumper.capture()
+        if frame_dumper is not None:
+            frame_dumper.finish()
+            print(frame_dumper.report())
+            frame_dumper.destroy()
+
+
+def parse_size(text):
+    """
+    Parses a WIDTHxHEIGHT size.
+    """
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
 
 if __name__ == '__main__':
-    app = GraphicsEngine()
-    app.run()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--headless', action='store_true', help='render offscreen without a window')
+    parser.add_argument('--size', type=parse_size, default=(1600, 900), help='frame size as WIDTHxHEIGHT')
+    parser.add_argument('--path', help='JSON camera path to follow instead of mouse and keyboard input')
+    parser.add_argument('--record', help='JSON file to record the camera path to, saved on quit')
+    parser.add_argument('--frames', type=int, help='frames to render headless, the length of the path by default')
+    parser.add_argument('--output', help='folder for PNG frames or file for raw video, - for stdout')
+    parser.add_argument('--format', choices=FRAME_FORMATS, default='png', help='format of the dumped frames')
+    parser.add_argument('--profile', action='store_true', help='time each stage of the frame, reported on quit')
+    parser.add_argument('--trace', help='JSON file to write a Chrome trace of the frames to on quit')
+    parser.add_argument('--overlay', action='store_true', help='draw the milliseconds per stage over the frame')
+    parser.add_argument('--fps', type=int, default=FRAME_CAP, help='frame rate cap of the window, 0 for uncapped')
+    parser.add_argument('--vsync', action='store_true', help='wait for the display refresh to swap buffers')
+    parser.add_argument('--adaptive', type=float, nargs='?', const=FRAME_BUDGET_MS, metavar='BUDGET_MS',
+                        help='adapt the resolution to keep frames within a budget (1000 / 60 ms by default)')
+    parser.add_argument('--scale', type=float, default=1.0, help='resolution the scene is rendered at, eg. 0.5')
+    parser.add_argument('--scene', default=SCENE_MANIFEST, help='JSON scene manifest to load')
+    parser.add_argument('--stream-budget', type=float, default=STREAMING_BUDGET / 2 ** 20,
+                        help='MB of GPU memory the objects streamed in around the camera may take')
+    parser.add_argument('--filter', choices=UPSCALE_FILTERS, default='bilinear',
+                        help='filter the scene is upscaled with when rendered below full resolution')
+    parser.add_argument('--depth-prepass', action='store_true',
+                        help='draw the opaque objects\' depth before shading them, so each pixel is shaded once')
+    parser.add_argument('--overdraw', action='store_true',
+                        help='show the fragments shaded per pixel as a heat map, reported on quit')
+    args = parser.parse_args()
+    if args.output == '-':
+        # stdout carries the frames, reports go to stderr
+        sys.stdout = sys.stderr
+
+    path = CameraPath.load(args.path) if args.path else None
+    app = GraphicsEngine(args.size, headless=args.headless, camera_path=path, record_path=args.record,
+                         profile=args.profile or args.overlay, trace_path=args.trace, vsync=args.vsync,
+                         render_scale=args.scale, upscale_filter=args.filter, manifest=args.scene,
+                         stream_budget=int(args.stream_budget * 2 ** 20))
+    app.overlay.enabled = args.overlay
+    app.scene_renderer.depth_prepass = args.depth_prepass or app.scene_renderer.depth_prepass
+    app.scene_renderer.overdraw = args.overdraw
+    if not args.headless:
+        app.run(args.fps, args.adaptive)
+    frame_count = args.frames or (int(path.duration * HEADLESS_FPS) + 1 if path else HEADLESS_FPS)
+    dumper = FrameDumper(app.ctx, app.framebuffer, args.output, args.format) if args.output else None
+    app.run_headless(frame_count, dumper)
+    app.destroy()
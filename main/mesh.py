@@ -0,0 +1,145 @@
+"""
+Class that holds CPU-side mesh data (an indexed vertex buffer) and the NumPy functions used to build it.
+"""
+
+import numpy as np
+
+
+def get_index_dtype(vertex_count):
+    """
+    Gets the smallest index type able to address every vertex of a mesh.
+    :param vertex_count: Number of vertices in the mesh.
+    :return: uint16 or uint32 numpy dtype.
+    """
+    return np.dtype('<u2') if vertex_count <= 0xFFFF else np.dtype('<u4')
+
+
+def deduplicate(vertex_data):
+    """
+    Turns unindexed vertex data (3 vertices per triangle) into unique vertices and an index buffer. Identical rows are
+    found with np.unique on the packed bytes of each vertex, and unique vertices keep the order they first appear in.
+    :param vertex_data: A (vertex count, floats per vertex) float32 array.
+    :return: The unique vertices and the index buffer.
+    """
+    vertex_data = np.ascontiguousarray(vertex_data, dtype='f4')
+    vertex_data = vertex_data.reshape(len(vertex_data), -1)
+    rows = vertex_data.view(np.dtype((np.void, vertex_data.itemsize * vertex_data.shape[1]))).ravel()
+    _, first, inverse = np.unique(rows, return_index=True, return_inverse=True)
+
+    # np.unique sorts the rows, so put the unique vertices back in order of first use.
+    order = np.argsort(first)
+    remap = np.empty_like(order)
+    remap[order] = np.arange(len(order))
+
+    vertices = vertex_data[first[order]]
+    indices = remap[inverse.ravel()].astype(get_index_dtype(len(vertices)))
+    return vertices, indices
+
+
+class Mesh:
+    """
+    An indexed mesh, vertices are interleaved float32 rows (ending with the position) and every 3 indices make a
+    triangle. The index buffer can hold several levels of detail, each one a (first index, index count) range. Large
+    meshes can also be split into spatial clusters, each with its own bounds and range inside every level.
+    """
+
+    def __init__(self, vertices, indices, source_vertex_count=None, lods=None, lod_errors=None, cluster_bounds=None,
+                 cluster_ranges=None):
+        """
+        :param vertices: A (vertex count, floats per vertex) float32 array.
+        :param indices: A uint16/uint32 array of vertex indices.
+        :param source_vertex_count: Number of vertices before deduplication.
+        :param lods: (first index, index count) of each level of detail, finest first. Defaults to one level.
+        :param lod_errors: Largest distance a vertex was moved by the decimation of each level.
+        :param cluster_bounds: A (cluster count, 2, 3) array of the min/max corners of each cluster, None if the mesh
+        is not clustered.
+        :param cluster_ranges: A (level count, cluster count, 2) array of the (first index, index count) range of each
+        cluster in each level.
+        """
+        self.vertices = vertices
+        self.indices = indices
+        self.source_vertex_count = len(indices) if source_vertex_count is None else source_vertex_count
+        self.lods = list(lods) if lods is not None else [(0, len(indices))]
+        self.lod_errors = list(lod_errors) if lod_errors is not None else [0.0] * len(self.lods)
+        self.cluster_bounds = cluster_bounds
+        self.cluster_ranges = cluster_ranges
+        self.aabb = self.get_aabb()
+        self.bounding_sphere = self.get_bounding_sphere()
+
+    @classmethod
+    def from_vertex_data(cls, vertex_data):
+        """
+        Creates an indexed mesh from unindexed vertex data.
+        """
+        vertices, indices = deduplicate(vertex_data)
+        return cls(vertices, indices, len(indices))
+
+    @property
+    def vertex_count(self):
+        return len(self.vertices)
+
+    @property
+    def triangle_count(self):
+        """
+        Number of triangles in the full level of detail.
+        """
+        return self.lods[0][1] // 3
+
+    @property
+    def positions(self):
+        return self.vertices[:, -3:]
+
+    @property
+    def is_clustered(self):
+        return self.cluster_bounds is not None
+
+    def get_ranges(self):
+        """
+        Gets the smallest independent ranges of the index buffer, the clusters of each level if the mesh is clustered,
+        otherwise the levels themselves.
+        :return: A list of (first index, index count) ranges.
+        """
+        if self.is_clustered:
+            return [(first, count) for first, count in self.cluster_ranges.reshape(-1, 2).tolist() if count]
+        return list(self.lods)
+
+    def get_aabb(self):
+        """
+        Calculates the axis aligned bounding box (AABB) of the mesh.
+        :return: The minimum and maximum corners of the box.
+        """
+        if len(self.vertices) == 0:
+            return np.zeros(3, dtype='f4'), np.zeros(3, dtype='f4')
+        return self.positions.min(axis=0), self.positions.max(axis=0)
+
+    def get_bounding_sphere(self):
+        """
+        Calculates a sphere around the mesh, centred on the middle of its bounding box.
+        :return: The centre and radius of the sphere.
+        """
+        if len(self.vertices) == 0:
+            return np.zeros(3, dtype='f4'), 0.0
+        centre = (self.aabb[0] + self.aabb[1]) / 2
+        radius = float(np.sqrt(((self.positions - centre) ** 2).sum(axis=1).max()))
+        return centre, radius
+
+    @property
+    def dedup_ratio(self):
+        """
+        How many times smaller the vertex buffer is than the unindexed vertex data it was built from.
+        """
+        return self.source_vertex_count / max(self.vertex_count, 1)
+
+    def expand(self, lod=0):
+        """
+        Expands a level of the mesh back into unindexed vertex data, 3 vertices per triangle.
+        """
+        first, count = self.lods[lod]
+        return self.vertices[self.indices[first:first + count]]
+
+    def copy(self):
+        """
+        Copies memory-mapped arrays into memory, eg. to send the mesh to another process.
+        """
+        return Mesh(np.array(self.vertices), np.array(self.indices), self.source_vertex_count, self.lods,
+                    self.lod_errors, self.cluster_bounds, self.cluster_ranges)
@@ -0,0 +1,287 @@
+"""
+Compiled binary mesh cache. Turns .obj files into versioned, checksummed binary files holding the deduplicated,
+interleaved '2f 3f 3f' vertex layout used by ObjVBO and its index buffer, so that startup can memory-map them straight
+into buffers instead of parsing the .obj file with pywavefront every time. The LOD chain of each mesh is generated at
+compile time and stored as ranges of the index buffer. Meshes can optionally go through the vertex cache optimisation
+stage before being stored. The crc32 of a cache is checked when it is compiled, and on demand with --verify, but not when
+it is loaded, so loading a mesh only touches the pages that are used and startup does not grow with the size of the
+models. Running this file compiles every model in the models folder, optimised or not as the app loads them
+(scene.OPTIMISE_MESHES) so the caches are not stale at startup, add --no-optimise or --optimise to override it and
+--verify to check the caches that are up to date.
+"""
+
+import glob
+import os
+import struct
+import sys
+import zlib
+from collections import namedtuple
+
+import numpy as np
+import pywavefront
+
+from mesh import Mesh, get_index_dtype
+from mesh_optimiser import optimise_mesh, get_cache_stats
+from lod import generate_lods
+from clusters import build_clusters, should_cluster
+
+# Cache file layout: a fixed size header, the table (padded to 16 bytes), then the raw little-endian float32 vertex
+# data and the index buffer.
+# Header = magic, version, vertex format, number of floats per vertex, vertex count, index count, index size in bytes,
+# vertex count before deduplication, flags for the processing stages used, number of LODs, number of clusters, crc32 of
+# everything after the header and the modification time of the source file the cache was compiled from.
+# Table = an entry per LOD (first index, index count and decimation error of the level), then the float32 min/max
+# corners of each cluster, then the uint32 (first index, index count) range of each cluster in each LOD.
+MAGIC = b'JMSH'
+VERSION = 5
+VERTEX_FORMAT = '2f 3f 3f'
+FLOATS_PER_VERTEX = 8
+HEADER = struct.Struct('<4sI16sIIIIIIIIIq')
+HEADER_SIZE = 128
+LOD_ENTRY = struct.Struct('<IIf')
+EXTENSION = '.mesh'
+
+CacheHeader = namedtuple('CacheHeader', ['vertex_count', 'index_count', 'index_size', 'source_vertex_count', 'flags',
+                                         'lod_count', 'cluster_count', 'crc', 'mtime'])
+
+# Processing stage flags.
+FLAG_OPTIMISED = 1
+
+
+class MeshCacheError(Exception):
+    """
+    Raised when a cache file is missing, out of date or corrupted.
+    """
+
+
+def get_cache_path(file):
+    """
+    Gets the path of the compiled cache for an obj file.
+    :param file: Path to the obj file.
+    :return: Path to the cache file.
+    """
+    return file + EXTENSION
+
+
+def get_source_path(file):
+    """
+    Gets the file the cache is compiled from. Falls back to pywavefront's own cache if the .obj is not available.
+    :param file: Path to the obj file.
+    :return: Path to the source file, or None if there is no source.
+    """
+    for path in (file, file + '.bin'):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def get_source_mtime(file):
+    """
+    Gets the modification time of the source file in nanoseconds, 0 if there is no source.
+    """
+    source = get_source_path(file)
+    return os.stat(source).st_mtime_ns if source else 0
+
+
+def parse_obj(file):
+    """
+    Uses pywavefront to parse an obj file for vertex data. This is the slow path which only runs when compiling.
+    :param file: Path to the obj file.
+    :return: A (vertex count, 8) float32 numpy array of vertex data.
+    """
+    objs = pywavefront.Wavefront(file, cache=True, parse=True)
+    obj = objs.materials.popitem()[1]
+    vertex_data = np.array(obj.vertices, dtype='f4')
+    return vertex_data.reshape(-1, FLOATS_PER_VERTEX)
+
+
+def get_flags(optimise):
+    """
+    Gets the header flags for a set of processing stages.
+    """
+    return FLAG_OPTIMISED if optimise else 0
+
+
+def build_mesh(file, optimise=False):
+    """
+    Builds the indexed mesh and LOD chain that is stored in the cache of an obj file, large meshes are also split into
+    clusters.
+    :param file: Path to the obj file.
+    :param optimise: Run the vertex cache optimisation stage.
+    :return: The built mesh.
+    """
+    mesh = generate_lods(Mesh.from_vertex_data(parse_obj(file)))
+    if should_cluster(mesh):
+        mesh = build_clusters(mesh)
+    if optimise:
+        mesh = optimise_mesh(mesh)
+    return mesh
+
+
+def compile_mesh(file, optimise=False):
+    """
+    Compiles an obj file into a binary cache file next to it.
+    :param file: Path to the obj file.
+    :param optimise: Run the vertex cache optimisation stage.
+    :return: Path to the written cache file.
+    """
+    mesh = build_mesh(file, optimise)
+    cluster_count = len(mesh.cluster_bounds) if mesh.is_clustered else 0
+    table = b''.join(LOD_ENTRY.pack(first, count, error) for (first, count), error in zip(mesh.lods, mesh.lod_errors))
+    if mesh.is_clustered:
+        table += np.ascontiguousarray(mesh.cluster_bounds, dtype='<f4').tobytes()
+        table += np.ascontiguousarray(mesh.cluster_ranges, dtype='<u4').tobytes()
+    table = table.ljust(get_table_size(len(mesh.lods), cluster_count), b'\0')
+    vertex_data = np.ascontiguousarray(mesh.vertices, dtype='<f4').tobytes()
+    index_data = np.ascontiguousarray(mesh.indices).tobytes()
+    path = get_cache_path(file)
+    crc = zlib.crc32(index_data, zlib.crc32(vertex_data, zlib.crc32(table)))
+    header = HEADER.pack(MAGIC, VERSION, VERTEX_FORMAT.encode(), FLOATS_PER_VERTEX, mesh.vertex_count,
+                         len(mesh.indices), mesh.indices.itemsize, mesh.source_vertex_count, get_flags(optimise),
+                         len(mesh.lods), cluster_count, crc, get_source_mtime(file))
+
+    # Written to a temporary file first so that an interrupted compile never leaves a half written cache behind.
+    with open(path + '.tmp', 'wb') as cache:
+        cache.write(header.ljust(HEADER_SIZE, b'\0'))
+        cache.write(table)
+        cache.write(vertex_data)
+        cache.write(index_data)
+    os.replace(path + '.tmp', path)
+    return path
+
+
+def get_table_size(lod_count, cluster_count):
+    """
+    Gets the size of the table in bytes, padded so that the vertex data stays 16 byte aligned.
+    """
+    size = lod_count * LOD_ENTRY.size + cluster_count * 6 * 4 + lod_count * cluster_count * 2 * 4
+    return (size + 15) // 16 * 16
+
+
+def read_header(path):
+    """
+    Reads and validates the header of a cache file.
+    :param path: Path to the cache file.
+    :return: The header's fields as a CacheHeader.
+    """
+    with open(path, 'rb') as cache:
+        data = cache.read(HEADER_SIZE)
+    if len(data) != HEADER_SIZE:
+        raise MeshCacheError(f'{path}: truncated header')
+
+    magic, version, vertex_format, floats, *fields = HEADER.unpack_from(data)
+    header = CacheHeader(*fields)
+    if magic != MAGIC:
+        raise MeshCacheError(f'{path}: not a mesh cache file')
+    if version != VERSION:
+        raise MeshCacheError(f'{path}: cache version {version}, expected {VERSION}')
+    if vertex_format.rstrip(b'\0').decode() != VERTEX_FORMAT or floats != FLOATS_PER_VERTEX:
+        raise MeshCacheError(f'{path}: unexpected vertex format')
+    if header.index_size != get_index_dtype(header.vertex_count).itemsize:
+        raise MeshCacheError(f'{path}: unexpected index size')
+    if header.lod_count == 0:
+        raise MeshCacheError(f'{path}: no levels of detail')
+    size = HEADER_SIZE + get_table_size(header.lod_count, header.cluster_count) + \
+        header.vertex_count * floats * 4 + header.index_count * header.index_size
+    if os.path.getsize(path) != size:
+        raise MeshCacheError(f'{path}: size does not match header')
+    return header
+
+
+def map_mesh(path, verify=False):
+    """
+    Memory-maps the vertex and index data of a cache file without copying it.
+    :param path: Path to the cache file.
+    :param verify: Whether to check the crc32 of the data, this reads the whole file.
+    :return: A mesh whose arrays are read-only views of the memory-mapped file.
+    """
+    header = read_header(path)
+    data = np.memmap(path, dtype='u1', mode='r', offset=HEADER_SIZE)
+    if verify and zlib.crc32(data) != header.crc:
+        raise MeshCacheError(f'{path}: checksum mismatch')
+
+    lod_count, cluster_count = header.lod_count, header.cluster_count
+    lod_table = [LOD_ENTRY.unpack_from(data, i * LOD_ENTRY.size) for i in range(lod_count)]
+    if any(first + length > header.index_count for first, length, _ in lod_table):
+        raise MeshCacheError(f'{path}: level of detail out of range')
+
+    cluster_bounds = cluster_ranges = None
+    if cluster_count:
+        bounds_start = lod_count * LOD_ENTRY.size
+        ranges_start = bounds_start + cluster_count * 6 * 4
+        cluster_bounds = data[bounds_start:ranges_start].view('<f4').reshape(cluster_count, 2, 3)
+        cluster_ranges = data[ranges_start:ranges_start + lod_count * cluster_count * 2 * 4].view('<u4')
+        cluster_ranges = cluster_ranges.reshape(lod_count, cluster_count, 2).astype(np.int64)
+
+    vertex_start = get_table_size(lod_count, cluster_count)
+    vertex_end = vertex_start + header.vertex_count * FLOATS_PER_VERTEX * 4
+    vertices = data[vertex_start:vertex_end].view('<f4').reshape(header.vertex_count, FLOATS_PER_VERTEX)
+    indices = data[vertex_end:].view(get_index_dtype(header.vertex_count))
+    return Mesh(vertices, indices, header.source_vertex_count, [(first, length) for first, length, _ in lod_table],
+                [error for _, _, error in lod_table], cluster_bounds, cluster_ranges)
+
+
+def is_stale(file, optimise=False):
+    """
+    Checks if the cache of an obj file needs to be (re)built, either because the source is newer or because it was
+    compiled with different processing stages.
+    """
+    path = get_cache_path(file)
+    if not os.path.exists(path):
+        return True
+    try:
+        header = read_header(path)
+    except MeshCacheError:
+        return True
+    return get_source_mtime(file) > header.mtime or header.flags != get_flags(optimise)
+
+
+def load_mesh(file, optimise=False, verify=False):
+    """
+    Loads the mesh of an obj file from its cache, compiling the cache first if it is missing or out of date. Freshly
+    compiled caches are verified, caches that were already there are only checked if verify is set.
+    :param file: Path to the obj file.
+    :param optimise: Load the mesh optimised for the vertex cache.
+    :param verify: Whether to check the crc32 of an existing cache.
+    :return: The loaded mesh.
+    """
+    compiled = is_stale(file, optimise)
+    if compiled:
+        compile_mesh(file, optimise)
+    try:
+        return map_mesh(get_cache_path(file), verify or compiled)
+    except MeshCacheError:
+        # Corrupted cache, rebuild it once from the source.
+        compile_mesh(file, optimise)
+        return map_mesh(get_cache_path(file), verify=True)
+
+
+def find_models(folder='../models'):
+    """
+    Finds all obj files in a folder, including ones only available through pywavefront's cache.
+    """
+    files = set(glob.glob(os.path.join(folder, '**', '*.obj'), recursive=True))
+    files.update(path[:-len('.bin')] for path in glob.glob(os.path.join(folder, '**', '*.obj.bin'), recursive=True))
+    return sorted(files)
+
+
+if __name__ == '__main__':
+    from scene import OPTIMISE_MESHES
+
+    flags = ('--optimise', '--no-optimise', '--verify')
+    optimise = '--optimise' in sys.argv or (OPTIMISE_MESHES and '--no-optimise' not in sys.argv)
+    verify = '--verify' in sys.argv
+    for model in [arg for arg in sys.argv[1:] if arg not in flags] or find_models():
+        if is_stale(model, optimise):
+            print(f'Compiling {model} -> {compile_mesh(model, optimise)}')
+            acmr, atvr = get_cache_stats(map_mesh(get_cache_path(model), verify=True).indices)
+            print(f'    ACMR {acmr:.3f}, ATVR {atvr:.3f}')
+            continue
+        if not verify:
+            print(f'Up to date {get_cache_path(model)}')
+            continue
+        try:
+            map_mesh(get_cache_path(model), verify=True)
+            print(f'Verified {get_cache_path(model)}')
+        except MeshCacheError as error:
+            print(f'{error}, recompiling {model} -> {compile_mesh(model, optimise)}')
@@ -0,0 +1,176 @@
+"""
+Optional mesh optimisation stage for the OBJ import path. Triangles are reordered for post-transform vertex cache
+locality with the Tipsify algorithm (Sander et al. 2007), then vertices are reordered in order of first use for vertex
+fetch locality. Everything runs on the CPU with NumPy and Python, no GL context is needed.
+Running this file benchmarks the optimisation on the scene's models with a simulated FIFO vertex cache.
+"""
+
+import sys
+import time
+from collections import deque
+
+import numpy as np
+
+from mesh import Mesh, get_index_dtype
+
+# Size of the post-transform cache the triangle order is optimised for, and the sizes reported by the benchmark.
+CACHE_SIZE = 16
+BENCHMARK_CACHE_SIZES = (16, 32)
+
+
+def count_cache_misses(indices, cache_size=CACHE_SIZE):
+    """
+    Simulates a FIFO post-transform vertex cache, the cache used by most GPUs.
+    :param indices: The index buffer, 3 indices per triangle.
+    :param cache_size: Number of vertices the cache holds.
+    :return: Number of vertices that had to be transformed (cache misses).
+    """
+    cache = deque()
+    cached = set()
+    misses = 0
+    for index in np.asarray(indices).tolist():
+        if index not in cached:
+            misses += 1
+            cache.append(index)
+            cached.add(index)
+            if len(cache) > cache_size:
+                cached.discard(cache.popleft())
+    return misses
+
+
+def get_cache_stats(indices, cache_size=CACHE_SIZE):
+    """
+    Calculates the average cache miss ratio (ACMR - transformed vertices per triangle, 0.5 is the best possible for
+    large meshes and 3 the worst) and the average transform to vertex ratio (ATVR - transformed vertices per referenced
+    vertex, 1 is the best possible).
+    :return: A (ACMR, ATVR) tuple.
+    """
+    indices = np.asarray(indices)
+    if len(indices) == 0:
+        return 0.0, 0.0
+    misses = count_cache_misses(indices, cache_size)
+    return misses / (len(indices) // 3), misses / len(np.unique(indices))
+
+
+def tipsify(indices, vertex_count, cache_size=CACHE_SIZE):
+    """
+    Reorders triangles with Tipsify. Triangles are emitted by fanning around a vertex, and the next fanning vertex is
+    picked among the vertices of the emitted triangles that will still be in the cache, which keeps the cache warm.
+    :param indices: The index buffer, 3 indices per triangle.
+    :param vertex_count: Number of vertices in the vertex buffer.
+    :param cache_size: Size of the cache to optimise for.
+    :return: The reordered index buffer.
+    """
+    indices = np.asarray(indices)
+    triangle_count = len(indices) // 3
+    if triangle_count == 0:
+        return indices.copy()
+
+    # Vertex -> triangle adjacency in compressed form, triangles using vertex v are adjacency[offsets[v]:offsets[v+1]].
+    live = np.bincount(indices, minlength=vertex_count)
+    offsets = np.concatenate(([0], np.cumsum(live))).tolist()
+    adjacency = (np.argsort(indices, kind='stable') // 3).tolist()
+    live = live.tolist()
+    triangles = indices.reshape(-1, 3).tolist()
+
+    cache_time = [0] * vertex_count
+    emitted = [False] * triangle_count
+    dead_end = []
+    output = []
+    timestamp = cache_size + 1
+    cursor = 1
+    fanning = 0
+
+    while fanning >= 0:
+        candidates = []
+        for triangle in adjacency[offsets[fanning]:offsets[fanning + 1]]:
+            if emitted[triangle]:
+                continue
+            for vertex in triangles[triangle]:
+                output.append(vertex)
+                dead_end.append(vertex)
+                candidates.append(vertex)
+                live[vertex] -= 1
+                if timestamp - cache_time[vertex] > cache_size:
+                    cache_time[vertex] = timestamp
+                    timestamp += 1
+            emitted[triangle] = True
+
+        # Next fanning vertex: the live candidate that stays in the cache the longest.
+        fanning = -1
+        best_priority = -1
+        for vertex in candidates:
+            if live[vertex] > 0:
+                priority = 0
+                if timestamp - cache_time[vertex] + 2 * live[vertex] <= cache_size:
+                    priority = timestamp - cache_time[vertex]
+                if priority > best_priority:
+                    best_priority = priority
+                    fanning = vertex
+
+        # Dead end, go back to a recently used vertex, or the next vertex in input order.
+        while fanning == -1 and dead_end:
+            vertex = dead_end.pop()
+            if live[vertex] > 0:
+                fanning = vertex
+        while fanning == -1 and cursor < vertex_count:
+            if live[cursor] > 0:
+                fanning = cursor
+            else:
+                cursor += 1
+
+    return np.array(output, dtype=indices.dtype)
+
+
+def optimise_vertex_fetch(vertices, indices):
+    """
+    Reorders vertices in the order the index buffer first uses them, so that vertex fetches read memory linearly.
+    Vertices that no triangle uses are dropped.
+    :return: The reordered vertices and the remapped index buffer.
+    """
+    used, first = np.unique(indices, return_index=True)
+    order = used[np.argsort(first)]
+    remap = np.zeros(len(vertices), dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    return vertices[order], remap[indices].astype(get_index_dtype(len(order)))
+
+
+def optimise_mesh(mesh, cache_size=CACHE_SIZE):
+    """
+    Runs the full optimisation stage on a mesh, the triangles of each level of detail (or cluster) are reordered
+    separately so that the ranges stay intact.
+    :param mesh: The mesh to optimise.
+    :param cache_size: Size of the cache to optimise for.
+    :return: The optimised mesh.
+    """
+    indices = np.array(mesh.indices)
+    for first, count in mesh.get_ranges():
+        indices[first:first + count] = tipsify(indices[first:first + count], mesh.vertex_count, cache_size)
+    vertices, indices = optimise_vertex_fetch(np.asarray(mesh.vertices), indices)
+    return Mesh(vertices, indices, mesh.source_vertex_count, mesh.lods, mesh.lod_errors, mesh.cluster_bounds,
+                mesh.cluster_ranges)
+
+
+def benchmark(files):
+    """
+    Prints the ACMR/ATVR of each model before and after optimisation, for each cache size in BENCHMARK_CACHE_SIZES.
+    Meshes are built in memory, so the benchmark leaves the mesh caches as they are.
+    """
+    from mesh_cache import build_mesh, find_models
+
+    for file in files or find_models():
+        mesh = build_mesh(file, optimise=False)
+        start = time.perf_counter()
+        optimised = optimise_mesh(mesh)
+        elapsed = time.perf_counter() - start
+        print(f'{file}: {mesh.triangle_count} triangles, optimised in {elapsed:.2f}s')
+        first, count = mesh.lods[0]
+        for cache_size in BENCHMARK_CACHE_SIZES:
+            before = get_cache_stats(mesh.indices[first:first + count], cache_size)
+            after = get_cache_stats(optimised.indices[first:first + count], cache_size)
+            print(f'    FIFO {cache_size:>2}: ACMR {before[0]:.3f} -> {after[0]:.3f}, '
+                  f'ATVR {before[1]:.3f} -> {after[1]:.3f}')
+
+
+if __name__ == '__main__':
+    benchmark(sys.argv[1:])
@@ -3,50 +3,177 @@ Models class for base classs that can be used to build objects
 """
 
 import glm
+import numpy as np
+
+from camera import FOV
+from lod import LodSelector, get_screen_size, SHADOW_LOD_BIAS
+from clusters import get_visible_ranges
+from culling import get_visible
+from transform import compose_matrices, to_column_major, get_reference_matrix
+
+
+def count_triangles(ranges, instances=1):
+    """
+    Counts the triangles drawn from index buffer ranges.
+    :param ranges: (first index, index count) ranges of a triangle list.
+    """
+    return sum(count for _, count in ranges) // 3 * instances
 
 
 class BaseModel:
     """
     A base model for object models
     """
+    # Transparent models are drawn after opaque ones, back-to-front.
+    transparent = False
 
-    def __init__(self, app, vao_name, texture_id, position=(0, 0, 0), rotation=(0, 0, 0), scale=(1, 1, 1)):
+    @property
+    def casts_shadow(self):
+        """
+        Transparent models (eg. water) let the light through, so they only receive shadows.
+        """
+        return not self.transparent
+
+    @property
+    def occludes(self):
+        """
+        Whether the model hides what is behind it, and can be drawn into the occlusion culling depth buffer.
+        """
+        return not self.transparent
+
+    def __init__(self, app, vao_name, texture_id, position=(0, 0, 0), rotation=(0, 0, 0), scale=(1, 1, 1),
+                 transform_id=None):
+        """
+        :param transform_id: A transform of the app's transform store to reuse (eg. by a model streamed in again after
+        it was evicted), a new transform is added if None.
+        """
         self.app = app
-        self.pos = position
-        # Converts euler angles into openGL compatible format
-        self.rot = glm.vec3([glm.radians(a) for a in rotation])
-        self.scale = scale
-        self.model_matrix = self.get_model_matrix()
+        # Converts euler angles into openGL compatible format, the transform is kept in the app's transform store
+        self.transforms = app.transforms
+        if transform_id is None:
+            self.transform_id = self.transforms.add(position, [glm.radians(a) for a in rotation], scale)
+        else:
+            self.transform_id = transform_id
+        self.transforms.update()
         self.texture_id = texture_id
         self.vao_name = vao_name
         self.vao = app.link.vao.vaos[vao_name]
+        self.vbo = app.link.vao.vbo.vbos[vao_name]
+        self.lod_selector = LodSelector(len(self.vbo.mesh.lods))
         self.shader = self.vao.program
         self.camera = self.app.camera
+        self.uniforms = self.app.uniforms
 
     def update(self): ...
 
-    def get_model_matrix(self):
-        model_matrix = glm.mat4()
+    @property
+    def pos(self):
+        return glm.vec3(*self.transforms.positions[self.transform_id])
+
+    @pos.setter
+    def pos(self, position):
+        self.transforms.set_position(self.transform_id, position)
+
+    @property
+    def rot(self):
+        """
+        Euler angles in radians.
+        """
+        return glm.vec3(*self.transforms.rotations[self.transform_id])
+
+    @rot.setter
+    def rot(self, rotation):
+        self.transforms.set_rotation(self.transform_id, rotation)
+
+    @property
+    def scale(self):
+        return glm.vec3(*self.transforms.scales[self.transform_id])
+
+    @scale.setter
+    def scale(self, scale):
+        self.transforms.set_scale(self.transform_id, scale)
+
+    @property
+    def model_matrix(self):
+        """
+        The world matrix of the model from the transform store, as a NumPy (4, 4) array. It is rebuilt when the store
+        is updated after the transform changed.
+        """
+        return self.transforms.world_matrices[self.transform_id]
+
+    @property
+    def model_matrix_data(self):
+        """
+        The model matrix as column major float32 data, the layout shaders expect.
+        """
+        return self.transforms.matrix_data[self.transform_id]
 
-        # Translate object to position
-        model_matrix = glm.translate(model_matrix, self.pos)
+    @property
+    def bounds(self):
+        """
+        The bounding volumes used for culling, in the space the model matrix transforms from.
+        :return: The bounding sphere's centre and radius, and the bounding box's min and max corners.
+        """
+        mesh = self.vbo.mesh
+        return (*mesh.bounding_sphere, *mesh.aabb)
 
-        # Rotate object around XYZ axis as specified in parameters
-        model_matrix = glm.rotate(model_matrix, self.rot.x, glm.vec3(1, 0, 0))
-        model_matrix = glm.rotate(model_matrix, self.rot.y, glm.vec3(0, 1, 0))
-        model_matrix = glm.rotate(model_matrix, self.rot.z, glm.vec3(0, 0, 1))
+    def get_lod(self, bias=0):
+        """
+        Picks the level of detail to draw from the size of the model's bounding sphere on screen.
+        :param bias: How many levels coarser to draw, eg. for shadows.
+        :return: The index of the level.
+        """
+        lods = self.vbo.mesh.lods
+        level = 0
+        if len(lods) > 1:
+            centre, radius = self.vbo.mesh.bounding_sphere
+            model_matrix = self.model_matrix
+            world_centre = model_matrix[:3, :3] @ np.asarray(centre, dtype='f8') + model_matrix[:3, 3]
+            world_radius = radius * float(np.linalg.norm(model_matrix[:3, :3], axis=0).max())
+            distance = float(np.linalg.norm(np.array(self.camera.position) - world_centre))
+            level = self.lod_selector.select(get_screen_size(world_radius, distance, glm.radians(FOV)))
+        return min(level + bias, len(lods) - 1)
+
+    def get_draw_ranges(self, bias=0, planes=None):
+        """
+        Gets the ranges of the index buffer to draw, at the current level of detail. For clustered meshes only the
+        clusters inside the frustum are drawn.
+        :param bias: How many levels coarser to draw, eg. for shadows.
+        :param planes: Frustum planes of the pass, clusters are not culled if None.
+        :return: A list of (first index, index count) ranges.
+        """
+        mesh = self.vbo.mesh
+        level = self.get_lod(bias)
+        if planes is not None and mesh.is_clustered:
+            return get_visible_ranges(mesh, level, planes, self.model_matrix)
+        return [mesh.lods[level]]
 
-        # Scale objects
-        model_matrix = glm.scale(model_matrix, self.scale)
+    def get_model_matrix(self):
+        """
+        Builds the local model matrix with glm, one call per object. Kept as the reference for the transform store.
+        :return: A glm.mat4 model matrix.
+        """
+        return get_reference_matrix(self.pos, self.rot, self.scale)
 
-        return model_matrix
+    def draw(self, planes=None):
+        """
+        Renders the Vertex Array Object at the current level of detail, without updating the shader.
+        :param planes: Frustum planes used to cull the clusters of clustered meshes.
+        :return: Number of draw calls and triangles drawn.
+        """
+        ranges = self.get_draw_ranges(planes=planes)
+        for first, count in ranges:
+            self.vao.render(vertices=count, first=first)
+        return len(ranges), count_triangles(ranges)
 
-    def render(self):
+    def render(self, planes=None):
         """
-        Renders the Vertex Array Object and calls 'update' method.
+        Calls 'update' method and renders the Vertex Array Object at the current level of detail.
+        :param planes: Frustum planes used to cull the clusters of clustered meshes.
+        :return: Number of draw calls and triangles drawn.
         """
         self.update()
-        self.vao.render()
+        return self.draw(planes)
 
 
 class ExtendedBaseModel(BaseModel):
@@ -54,40 +181,72 @@ class ExtendedBaseModel(BaseModel):
     An extended base model class that contains methods for objects.
     """
 
-    def __init__(self, app, vao_name, texture_id, position, rotation, scale):
-        super().__init__(app, vao_name, texture_id, position, rotation, scale)
+    def __init__(self, app, vao_name, texture_id, position, rotation, scale, transform_id=None):
+        super().__init__(app, vao_name, texture_id, position, rotation, scale, transform_id)
         self.on_init()
 
     def update(self):
         """
-        Updates the cube everytime it is called by rotating it.
+        Binds the texture and passes the model matrix, the camera's matrices and position come from its uniform
+        buffer.
         """
         self.texture.use(location=0)
-        self.shader['m_model'].write(self.model_matrix)
-        self.shader['m_view'].write(self.camera.view_matrix)
-        self.shader['camPos'].write(self.camera.position)
+        self.write_model_matrix()
+
+    def write_model_matrix(self):
+        """
+        Passes the model matrix to the shader.
+        """
+        self.uniforms.write_uniform(self.shader, 'm_model', self.model_matrix_data)
 
     def update_shadow(self):
         """
         Updates shadows with model movements.
         """
-        self.shadow_shader['m_model'].write(self.model_matrix)
+        self.uniforms.write_uniform(self.shadow_shader, 'm_model', self.model_matrix_data)
+
+    def draw_shadow(self, planes=None):
+        """
+        Renders the shadow VAO, using a coarser level of detail than the main pass.
+        :param planes: Frustum planes used to cull the clusters of clustered meshes.
+        :return: Number of draw calls and triangles drawn.
+        """
+        ranges = self.get_draw_ranges(SHADOW_LOD_BIAS, planes)
+        for first, count in ranges:
+            self.shadow_vao.render(vertices=count, first=first)
+        return len(ranges), count_triangles(ranges)
 
-    def render_shadow(self):
+    def render_shadow(self, planes=None):
         """
         Completes shadow render.
+        :param planes: Frustum planes used to cull the clusters of clustered meshes.
+        :return: Number of draw calls and triangles drawn.
         """
         self.update_shadow()
-        self.shadow_vao.render()
+        return self.draw_shadow(planes)
 
-    def on_init(self):
+    def update_depth(self):
         """
-        Runs when object is created, passes shadow, light intensity, texture, projection, view and model matrices.
+        Passes the model matrix to the depth pre-pass shader.
         """
-        self.shader['m_view_light'].write(self.app.light.view_matrix_light)
+        self.uniforms.write_uniform(self.depth_shader, 'm_model', self.model_matrix_data)
 
-        self.shader['u_resolution'].write(glm.vec2(self.app.WIN_SIZE))
+    def draw_depth(self, planes=None):
+        """
+        Renders the depth pre-pass VAO at the same level of detail and clusters as the main pass, so the depths match.
+        :param planes: Frustum planes used to cull the clusters of clustered meshes.
+        :return: Number of draw calls and triangles drawn.
+        """
+        ranges = self.get_draw_ranges(planes=planes)
+        for first, count in ranges:
+            self.depth_vao.render(vertices=count, first=first)
+        return len(ranges), count_triangles(ranges)
 
+    def on_init(self):
+        """
+        Runs when object is created, passes the shadow map, texture and model matrix. The projection, view and light
+        matrices and the light intensities come from the uniform buffers.
+        """
         # Depth texture
         self.depth_texture = self.app.link.texture.textures['depth_texture']
         self.shader['shadowMap'] = 1
@@ -96,15 +255,11 @@ class ExtendedBaseModel(BaseModel):
         # Shadows
         self.shadow_vao = self.app.link.vao.vaos[f"shadow_{self.vao_name}"]
         self.shadow_shader = self.shadow_vao.program
-        self.shadow_shader['m_proj'].write(self.app.camera.projection_matrix)
-        self.shadow_shader['m_view_light'].write(self.app.light.view_matrix_light)
-        self.shadow_shader['m_model'].write(self.model_matrix)
+        self.update_shadow()
 
-        # Lighting
-        self.shader['light.position'].write(self.app.light.position)
-        self.shader['light.Ia'].write(self.app.light.intensity_ambient)
-        self.shader['light.Id'].write(self.app.light.intensity_diffuse)
-        self.shader['light.Is'].write(self.app.light.intensity_specular)
+        # Depth pre-pass, only opaque objects have one
+        self.depth_vao = self.app.link.vao.vaos.get(f"depth_{self.vao_name}")
+        self.depth_shader = None if self.depth_vao is None else self.depth_vao.program
 
         # Textures
         self.texture = self.app.link.texture.textures[self.texture_id]
@@ -112,9 +267,7 @@ class ExtendedBaseModel(BaseModel):
         self.texture.use(location=0)
 
         # Matrices
-        self.shader['m_proj'].write(self.app.camera.projection_matrix)
-        self.shader['m_view'].write(self.app.camera.view_matrix)
-        self.shader['m_model'].write(self.model_matrix)
+        self.write_model_matrix()
 
 
 class SkyBox(BaseModel):
@@ -125,29 +278,207 @@ class SkyBox(BaseModel):
 
     def update(self):
         """
-        Updates the skybox when camera moves
+        Nothing to update, the skybox follows the camera through the camera's uniform buffer.
         """
-        self.shader['m_view'].write(glm.mat4(glm.mat3(self.app.camera.view_matrix)))
 
     def on_init(self):
         """
-        Runs when skybox is created, passes light intensity, texture and projection, view and model matrices.
+        Runs when skybox is created, passes the texture. The projection and view matrices come from the camera's
+        uniform buffer.
         """
         # Textures
         self.texture = self.app.link.texture.textures[self.texture_id]
         self.shader['u_texture_skybox'] = 0
         self.texture.use(location=0)
 
-        # Matrices
-        self.shader['m_proj'].write(self.app.camera.projection_matrix)
-        self.shader['m_view'].write(glm.mat4(glm.mat3(self.app.camera.view_matrix)))
-
 
 class ObjModel(ExtendedBaseModel):
     def __init__(self, app, vao_name='ground', texture_id='ground', position=(0, 0, 0), rotation=(0, 0, 0),
-                 scale=(1, 1, 1)):
-        super().__init__(app, vao_name, texture_id, position, rotation, scale)
+                 scale=(1, 1, 1), transparent=False, transform_id=None):
+        """
+        :param transparent: True for blended models (eg. water), drawn after opaque models.
+        """
+        self.transparent = transparent
+        super().__init__(app, vao_name, texture_id, position, rotation, scale, transform_id)
 
-    def update(self):
-        self.model_matrix = self.get_model_matrix()
-        super().update()
+
+class InstancedModel(ExtendedBaseModel):
+    """
+    Draws many copies of one model with a single draw call. The copies share one VBO/VAO and texture, and their model
+    matrices are stored in a per-instance attribute buffer built with NumPy batch maths. Each pass culls the instances
+    against its own frustum, so the main, shadow and depth pre-pass VAOs read separate buffers, and a buffer rewritten
+    within a frame (by each shadow cascade, or by the overdraw count after the pre-pass) is orphaned first, so the
+    write does not wait for the draws still reading the previous matrices.
+    """
+
+    # Passes with their own instance buffer, by the VAO they are drawn with
+    INSTANCE_PASSES = ('main', 'shadow', 'depth')
+
+    # The occlusion culler draws one copy of a mesh per model, not every instance
+    occludes = False
+
+    def __init__(self, app, vao_name, texture_id, positions, rotations=None, scales=None, shader='default',
+                 transform_id=None):
+        """
+        :param positions: A (N, 3) array of instance positions.
+        :param rotations: A (N, 3) array of instance euler angles in degrees, no rotation if None.
+        :param scales: A (N, 3) array of instance scales, no scaling if None.
+        :param shader: The shader the instances are drawn with, 'default' or 'water'.
+        :param transform_id: The transform of the batch to reuse, see BaseModel.
+        """
+        self.transparent = shader == 'water'
+        self.positions = np.array(positions, dtype='f8').reshape(-1, 3)
+        self.instance_count = len(self.positions)
+        self.rotations = np.zeros_like(self.positions) if rotations is None else \
+            np.radians(np.array(rotations, dtype='f8').reshape(-1, 3))
+        self.scales = np.ones_like(self.positions) if scales is None else np.array(scales, dtype='f8').reshape(-1, 3)
+        self.instance_matrices = compose_matrices(self.positions, self.rotations, self.scales)
+        self.instance_buffers = {name: app.ctx.buffer(reserve=max(self.instance_count, 1) * 64, dynamic=True)
+                                 for name in self.INSTANCE_PASSES}
+        self.visible_count = self.instance_count
+        for buffer in self.instance_buffers.values():
+            self.write_instances(buffer, self.instance_matrices)
+
+        app.link.vao.add_vao(vao_name, shader=shader, instance_buffers=self.instance_buffers,
+                             layer=app.link.texture.layers.get(texture_id))
+        super().__init__(app, vao_name, texture_id, (0, 0, 0), (0, 0, 0), (1, 1, 1), transform_id)
+
+    def set_transforms(self, positions=None, rotations=None, scales=None):
+        """
+        Moves the instances, the model matrices of every instance are rebuilt in one batch.
+        :param rotations: Euler angles in degrees.
+        """
+        if positions is not None:
+            self.positions[:] = np.reshape(positions, (-1, 3))
+        if rotations is not None:
+            self.rotations[:] = np.radians(np.reshape(rotations, (-1, 3)))
+        if scales is not None:
+            self.scales[:] = np.reshape(scales, (-1, 3))
+        self.instance_matrices = compose_matrices(self.positions, self.rotations, self.scales)
+
+    def write_instances(self, buffer, matrices):
+        """
+        Uploads model matrices to an instance buffer, in fresh storage (orphaning it) so draws issued earlier in the
+        frame keep reading the matrices they were issued with.
+        """
+        self.visible_count = len(matrices)
+        if self.visible_count:
+            buffer.orphan()
+            buffer.write(to_column_major(matrices))
+
+    def cull_instances(self, planes, buffer):
+        """
+        Uploads only the model matrices of the instances inside a frustum.
+        :param planes: Frustum planes of the pass, every instance is drawn if None.
+        :param buffer: The instance buffer of the pass.
+        """
+        if planes is None:
+            self.write_instances(buffer, self.instance_matrices)
+            return
+        centre, radius, aabb_min, aabb_max = super().bounds
+        count = self.instance_count
+        visible = get_visible(planes, self.instance_matrices,
+                              np.broadcast_to(np.asarray(centre, dtype='f8'), (count, 3)), np.full(count, radius),
+                              np.broadcast_to(np.asarray(aabb_min, dtype='f8'), (count, 3)),
+                              np.broadcast_to(np.asarray(aabb_max, dtype='f8'), (count, 3)))
+        self.write_instances(buffer, self.instance_matrices[visible])
+
+    @property
+    def bounds(self):
+        """
+        The bounding volumes of the whole batch, in world space (the model matrix of the batch is the identity).
+        """
+        _, _, aabb_min, aabb_max = super().bounds
+        corners = np.array([[x, y, z] for x in (aabb_min[0], aabb_max[0]) for y in (aabb_min[1], aabb_max[1])
+                            for z in (aabb_min[2], aabb_max[2])], dtype='f8')
+        world = np.einsum('nij,cj->nci', self.instance_matrices[:, :3, :3], corners) + \
+            self.instance_matrices[:, None, :3, 3]
+        world_min, world_max = world.reshape(-1, 3).min(axis=0), world.reshape(-1, 3).max(axis=0)
+        centre = (world_min + world_max) / 2
+        return centre, float(np.linalg.norm(world_max - centre)), world_min, world_max
+
+    def get_lod(self, bias=0):
+        """
+        Picks the level of detail of the batch from the instance that is closest to the camera.
+        """
+        lods = self.vbo.mesh.lods
+        level = 0
+        if len(lods) > 1:
+            centre, radius = self.vbo.mesh.bounding_sphere
+            world_centres = self.instance_matrices[:, :3, :3] @ np.asarray(centre, dtype='f8') + \
+                self.instance_matrices[:, :3, 3]
+            distances = np.linalg.norm(world_centres - np.array(self.camera.position), axis=1)
+            nearest = int(distances.argmin())
+            world_radius = radius * float(np.abs(self.scales[nearest]).max())
+            level = self.lod_selector.select(get_screen_size(world_radius, distances[nearest], glm.radians(FOV)))
+        return min(level + bias, len(lods) - 1)
+
+    def get_draw_ranges(self, bias=0, planes=None):
+        """
+        Instances are culled one by one instead of by cluster, so the whole level of detail is drawn.
+        """
+        return [self.vbo.mesh.lods[self.get_lod(bias)]]
+
+    def write_model_matrix(self):
+        """
+        Model matrices come from the instance buffer.
+        """
+
+    def update_shadow(self):
+        """
+        Model matrices come from the instance buffer.
+        """
+
+    def update_depth(self):
+        """
+        Model matrices come from the instance buffer.
+        """
+
+    def draw(self, planes=None):
+        """
+        Renders every visible instance in one draw call.
+        :param planes: Frustum planes used to cull the instances.
+        :return: Number of draw calls and triangles drawn.
+        """
+        self.cull_instances(planes, self.instance_buffers['main'])
+        if not self.visible_count:
+            return 0, 0
+        ranges = self.get_draw_ranges()
+        for first, count in ranges:
+            self.vao.render(vertices=count, first=first, instances=self.visible_count)
+        return len(ranges), count_triangles(ranges, self.visible_count)
+
+    def draw_shadow(self, planes=None):
+        """
+        Renders the shadows of every instance inside the light's frustum in one draw call.
+        :param planes: Frustum planes used to cull the instances.
+        :return: Number of draw calls and triangles drawn.
+        """
+        self.cull_instances(planes, self.instance_buffers['shadow'])
+        if not self.visible_count:
+            return 0, 0
+        ranges = self.get_draw_ranges(SHADOW_LOD_BIAS)
+        for first, count in ranges:
+            self.shadow_vao.render(vertices=count, first=first, instances=self.visible_count)
+        return len(ranges), count_triangles(ranges, self.visible_count)
+
+    def draw_depth(self, planes=None):
+        """
+        Renders the depth of every instance inside the camera's frustum in one draw call.
+        :param planes: Frustum planes used to cull the instances.
+        :return: Number of draw calls and triangles drawn.
+        """
+        self.cull_instances(planes, self.instance_buffers['depth'])
+        if not self.visible_count:
+            return 0, 0
+        ranges = self.get_draw_ranges()
+        for first, count in ranges:
+            self.depth_vao.render(vertices=count, first=first, instances=self.visible_count)
+        return len(ranges), count_triangles(ranges, self.visible_count)
+
+    def destroy(self):
+        """
+        Releases the instance buffers, the shared vbo and texture are released by the link.
+        """
+        for buffer in self.instance_buffers.values():
+            buffer.release()
@@ -0,0 +1,216 @@
+"""
+CPU occlusion culling with a software rasterised hierarchical depth buffer (Hi-Z). Each frame the large opaque objects
+in view (the occluders: ground, rocks, trunks and leaves) are drawn at a coarse level of detail into a small depth
+buffer with NumPy, and the buffer is reduced into a pyramid whose texels hold the farthest depth of the texels below.
+Every object in view is then tested by projecting its bounding box: if the nearest point of the box is behind the
+farthest occluder depth over the box's rectangle on screen, the box is hidden and the object is not drawn.
+
+Depths are distances along the view direction (clip space w). Triangles are written with the depth of their farthest
+vertex rather than an interpolated depth, which is cheaper and can only make occluders look farther away, so the test
+never hides a visible object because of it. Triangles crossing the near plane are left out. Nothing here needs a GL
+context.
+"""
+
+import math
+import weakref
+
+import numpy as np
+
+# Width and height of the occlusion depth buffer in pixels.
+OCCLUSION_BUFFER_SIZE = (128, 64)
+# Objects covering at least this fraction of the screen height (by their bounding sphere) are drawn as occluders.
+OCCLUDER_MIN_SCREEN_SIZE = 0.2
+# Occluders are drawn at their finest level of detail with at most this many triangles, or their coarsest level.
+OCCLUDER_MAX_TRIANGLES = 1024
+# Most pixels (triangle count x bounding square area) rasterised in one vectorized batch.
+RASTER_BATCH_PIXELS = 2 ** 20
+
+
+def get_occluder_triangles(mesh, max_triangles=OCCLUDER_MAX_TRIANGLES):
+    """
+    Gets the model space triangles an occluder is drawn with.
+    :return: A (triangle count, 3, 3) array of triangle vertex positions.
+    """
+    level = len(mesh.lods) - 1
+    for index, (_, count) in enumerate(mesh.lods):
+        if count // 3 <= max_triangles:
+            level = index
+            break
+    first, count = mesh.lods[level]
+    positions = mesh.vertices[:, -3:].astype('f8')
+    return positions[mesh.indices[first:first + count].astype(np.int64)].reshape(-1, 3, 3)
+
+
+def project_triangles(triangles, model_view_projection, size, near):
+    """
+    Projects world or model space triangles into the pixels of the depth buffer.
+    :param triangles: A (N, 3, 3) array of triangle vertex positions.
+    :param model_view_projection: The 4x4 matrix taking the positions to clip space.
+    :param size: Width and height of the depth buffer.
+    :param near: Distance of the near plane, triangles with a vertex closer than it are dropped.
+    :return: A (M, 3, 2) array of the pixel positions of each triangle's vertices, and a (M,) array of each triangle's
+    farthest depth.
+    """
+    clip = triangles @ model_view_projection[:3, :3].T + model_view_projection[:3, 3]
+    w = triangles @ model_view_projection[3, :3] + model_view_projection[3, 3]
+    in_front = (w >= near).all(axis=1)
+    clip, w = clip[in_front], w[in_front]
+    pixels = (clip[..., :2] / w[..., None] * 0.5 + 0.5) * np.array(size, dtype='f8')
+    return pixels, w.max(axis=1)
+
+
+def rasterise(depth, pixels, depths):
+    """
+    Writes triangles into a depth buffer, keeping the nearest depth at each pixel. A pixel is covered when its centre is
+    inside the triangle. Triangles are grouped by the power of two size of their bounding rectangle, and each group is
+    rasterised in one vectorized batch, with each edge function the sum of a per column and a per row term.
+    :param depth: A (height, width) float array, written in place.
+    :param pixels: A (N, 3, 2) array of triangle vertex positions in pixels.
+    :param depths: A (N,) array of the depth written for each triangle.
+    """
+    height, width = depth.shape
+    lower = np.maximum(np.ceil(pixels.min(axis=1) - 0.5).astype(np.int64), 0)
+    upper = np.minimum(np.floor(pixels.max(axis=1) - 0.5).astype(np.int64), [width - 1, height - 1])
+    # Back facing (clockwise) triangles are culled, like the renderer culls them, so every edge function is positive
+    # inside the triangles left
+    v0, v1, v2 = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+    area = (v1[:, 0] - v0[:, 0]) * (v2[:, 1] - v0[:, 1]) - (v1[:, 1] - v0[:, 1]) * (v2[:, 0] - v0[:, 0])
+    keep = (lower <= upper).all(axis=1) & (area > 0)
+    pixels, depths, lower, upper = pixels[keep], depths[keep], lower[keep], upper[keep]
+
+    # Edge function of each edge, a * x + b * y + c, positive inside, with x and y relative to the rectangle's corner
+    start, end = pixels, np.roll(pixels, -1, axis=1)
+    a = (start[..., 1] - end[..., 1]).astype('f4')
+    b = (end[..., 0] - start[..., 0]).astype('f4')
+    corner = lower[:, None, :] + 0.5 - start
+    c = (a * corner[..., 0] + b * corner[..., 1]).astype('f4')
+
+    sides = np.ceil(np.log2(upper - lower + 1)).astype(np.int64)
+    groups = sides[:, 0] * 64 + sides[:, 1]
+    flat_depth = depth.reshape(-1)
+    for group in np.unique(groups):
+        group_width, group_height = 2 ** int(group // 64), 2 ** int(group % 64)
+        members = np.flatnonzero(groups == group)
+        batch = max(RASTER_BATCH_PIXELS // (group_width * group_height), 1)
+        columns = np.arange(group_width, dtype='f4')[None, None, :]
+        rows = np.arange(group_height, dtype='f4')[None, :, None]
+        for first in range(0, len(members), batch):
+            chosen = members[first:first + batch]
+            # A pixel is inside when its smallest edge function is positive
+            distance = None
+            for edge in range(3):
+                edge_distance = a[chosen, edge, None, None] * columns + \
+                    (b[chosen, edge, None, None] * rows + c[chosen, edge, None, None])
+                distance = edge_distance if distance is None else np.minimum(distance, edge_distance, out=distance)
+            triangles, ys, xs = np.nonzero(distance >= 0)
+            # Pixels past the rectangle are outside the triangle, except for ones cut off by the edges of the buffer
+            triangles = chosen[triangles]
+            on_screen = (xs <= upper[triangles, 0] - lower[triangles, 0]) & \
+                (ys <= upper[triangles, 1] - lower[triangles, 1])
+            triangles, ys, xs = triangles[on_screen], ys[on_screen], xs[on_screen]
+            indices = (lower[triangles, 1] + ys) * width + lower[triangles, 0] + xs
+            np.minimum.at(flat_depth, indices, depths[triangles])
+
+
+def build_hierarchy(depth):
+    """
+    Builds the Hi-Z pyramid of a depth buffer, each level half the size of the last with the farthest depth of each
+    2x2 block. Odd sizes are padded with infinitely far texels, so the padding never hides anything.
+    :return: A list of levels, the depth buffer first and a 1x1 level last.
+    """
+    levels = [depth]
+    while depth.shape != (1, 1):
+        height, width = depth.shape
+        padded = np.full((height + height % 2, width + width % 2), np.inf)
+        padded[:height, :width] = depth
+        depth = padded.reshape(padded.shape[0] // 2, 2, padded.shape[1] // 2, 2).max(axis=(1, 3))
+        levels.append(depth)
+    return levels
+
+
+def get_box_corners(centres, extents):
+    """
+    Gets the 8 corners of boxes given as centres and half extents.
+    :return: A (N, 8, 3) array.
+    """
+    signs = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype='f8')
+    return centres[:, None, :] + extents[:, None, :] * signs[None, :, :]
+
+
+def boxes_occluded(levels, view_projection, centres, extents, near):
+    """
+    Tests world space boxes against a Hi-Z pyramid. Each box's rectangle on screen is read at the level where it covers
+    at most 2x2 texels (3x3 when it straddles texel edges).
+    :param levels: The pyramid from build_hierarchy.
+    :param view_projection: The 4x4 matrix the occluders were projected with.
+    :param centres: A (N, 3) array of box centres.
+    :param extents: A (N, 3) array of box half extents.
+    :param near: Distance of the near plane, boxes reaching in front of it are never occluded.
+    :return: A (N,) boolean array, True for hidden boxes.
+    """
+    corners = get_box_corners(centres, extents)
+    clip = corners @ view_projection[:3, :3].T + view_projection[:3, 3]
+    w = corners @ view_projection[3, :3] + view_projection[3, 3]
+    occluded = np.zeros(len(centres), dtype=bool)
+    height, width = levels[0].shape
+    for index in np.flatnonzero((w >= near).all(axis=1)):
+        pixels = (clip[index, :, :2] / w[index, :, None] * 0.5 + 0.5) * (width, height)
+        x0, y0 = np.clip(np.floor(pixels.min(axis=0)).astype(int), 0, (width - 1, height - 1))
+        x1, y1 = np.clip(np.floor(pixels.max(axis=0)).astype(int), 0, (width - 1, height - 1))
+        span = max(x1 - x0, y1 - y0) + 1
+        level = min(max(math.ceil(math.log2(span)) - 1, 0), len(levels) - 1)
+        farthest = levels[level][y0 >> level:(y1 >> level) + 1, x0 >> level:(x1 >> level) + 1].max()
+        occluded[index] = w[index].min() > farthest
+    return occluded
+
+
+class OcclusionCuller:
+    """
+    Rasterises the occluders of a frame and tests objects against them.
+    """
+
+    def __init__(self, near, size=OCCLUSION_BUFFER_SIZE):
+        """
+        :param near: Distance of the camera's near plane.
+        :param size: Width and height of the depth buffer.
+        """
+        self.near = near
+        self.size = size
+        self.levels = None
+        # Model space occluder triangles of each mesh, dropped with the mesh (eg. when it is streamed out)
+        self.triangles = weakref.WeakKeyDictionary()
+        self.occluders = 0
+        self.occluder_triangles = 0
+
+    def get_triangles(self, mesh):
+        if mesh not in self.triangles:
+            self.triangles[mesh] = get_occluder_triangles(mesh)
+        return self.triangles[mesh]
+
+    def render(self, view_projection, meshes, model_matrices):
+        """
+        Rasterises occluders into the depth buffer and builds its pyramid.
+        :param view_projection: The camera's 4x4 projection * view matrix.
+        :param meshes: The meshes of the occluders.
+        :param model_matrices: A (N, 4, 4) array of the occluders' model matrices.
+        """
+        width, height = self.size
+        depth = np.full((height, width), np.inf)
+        projected = [project_triangles(self.get_triangles(mesh), view_projection @ model_matrix, self.size, self.near)
+                     for mesh, model_matrix in zip(meshes, model_matrices)]
+        self.occluders = len(projected)
+        self.occluder_triangles = sum(len(depths) for _, depths in projected)
+        if projected:
+            rasterise(depth, np.concatenate([pixels for pixels, _ in projected]),
+                      np.concatenate([depths for _, depths in projected]))
+        self.levels = build_hierarchy(depth)
+
+    def get_occluded(self, view_projection, centres, extents):
+        """
+        :return: A (N,) boolean array, True for the world space boxes hidden by the last occluders rendered.
+        """
+        return boxes_occluded(self.levels, view_projection, centres, extents, self.near)
+
+    def __repr__(self):
+        return f'{self.occluders} occluders ({self.occluder_triangles} triangles)'
+
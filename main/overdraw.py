@@ -0,0 +1,109 @@
+"""
+Debug overdraw view. The opaque objects of the main pass are drawn a second time into a float texture, in the same
+order and with the same depth test as the main pass (after the depth pre-pass if it is on), with a fragment shader that
+outputs 1 and additive blending, so each pixel ends up holding the number of fragments default.frag shaded there. The
+counts are read back for the overdraw statistics and drawn over the frame as a heat map. Counting draws the opaque
+geometry twice more and stalls on the read back, so it is only done while the view is on.
+"""
+
+import moderngl as mgl
+import numpy as np
+
+# Overdraw shown as the hottest colour of the heat map.
+OVERDRAW_HEAT_MAX = 6
+
+
+def get_overdraw_stats(counts):
+    """
+    Summarises the shaded fragments per pixel.
+    :param counts: Array of the fragments shaded in each pixel.
+    :return: The number of pixels covered by opaque objects, the fragments shaded in them, the most fragments shaded in
+    one pixel, and the number of pixels shaded more than once.
+    """
+    counts = np.rint(np.asarray(counts)).astype('i4')
+    covered = counts > 0
+    return (int(covered.sum()), int(counts.sum()), int(counts.max()) if counts.size else 0,
+            int((counts > 1).sum()))
+
+
+class OverdrawStats:
+    """
+    Overdraw of the last counted frame.
+    """
+
+    def __init__(self):
+        self.covered = 0
+        self.fragments = 0
+        self.max = 0
+        self.overdrawn = 0
+
+    @property
+    def overdraw(self):
+        """
+        Fragments shaded per covered pixel, 1 when no pixel is shaded twice.
+        """
+        return self.fragments / self.covered if self.covered else 0
+
+    def __repr__(self):
+        share = 100 * self.overdrawn / self.covered if self.covered else 0
+        return (f'{self.overdraw:.2f} fragments shaded per pixel (max {self.max}), {share:.0f}% of {self.covered} '
+                f'pixels shaded more than once')
+
+
+class OverdrawCounter:
+    def __init__(self, ctx, program):
+        """
+        :param program: The heat map program (overdraw.vert and overdraw.frag).
+        """
+        self.ctx = ctx
+        self.program = program
+        self.program['u_overdraw'] = 0
+        self.program['u_max_overdraw'] = OVERDRAW_HEAT_MAX
+        self.vao = ctx.vertex_array(program, [])
+        self.texture = self.depth = self.framebuffer = None
+        self.stats = OverdrawStats()
+
+    def use(self, size):
+        """
+        Binds and clears the counting framebuffer, recreating it if the frame's size changed.
+        """
+        if self.texture is None or self.texture.size != size:
+            self.release_framebuffer()
+            self.texture = self.ctx.texture(size, components=1, dtype='f4')
+            self.texture.filter = (mgl.NEAREST, mgl.NEAREST)
+            self.depth = self.ctx.depth_renderbuffer(size)
+            self.framebuffer = self.ctx.framebuffer(color_attachments=[self.texture], depth_attachment=self.depth)
+        self.framebuffer.use()
+        self.framebuffer.clear(depth=1.0)
+
+    def count(self, draw):
+        """
+        Counts the fragments shaded by a pass.
+        :param draw: Draws the pass into the bound counting framebuffer.
+        """
+        self.ctx.blend_func = mgl.ONE, mgl.ONE
+        draw()
+        self.ctx.blend_func = mgl.SRC_ALPHA, mgl.ONE_MINUS_SRC_ALPHA
+        counts = np.frombuffer(self.texture.read(), dtype='f4')
+        self.stats.covered, self.stats.fragments, self.stats.max, self.stats.overdrawn = get_overdraw_stats(counts)
+
+    def render(self):
+        """
+        Draws the heat map over the whole of the bound framebuffer.
+        """
+        self.texture.use(location=0)
+        self.ctx.disable(mgl.DEPTH_TEST)
+        self.vao.render(vertices=3)
+        self.ctx.enable(mgl.DEPTH_TEST)
+
+    def release_framebuffer(self):
+        if self.framebuffer is not None:
+            self.framebuffer.release()
+            self.texture.release()
+            self.depth.release()
+            self.texture = self.depth = self.framebuffer = None
+
+    def destroy(self):
+        self.release_framebuffer()
+        self.vao.release()
+
@@ -0,0 +1,83 @@
+"""
+On-screen text overlay showing the profiler's milliseconds per stage. The text is drawn with pygame's font module into
+a texture, redrawn only every few frames, and blended over the top left corner of the frame.
+"""
+
+import moderngl as mgl
+import pygame as pg
+
+# Frames between redraws of the text, and the font size and colours of the text.
+OVERLAY_INTERVAL = 15
+OVERLAY_FONT_SIZE = 20
+OVERLAY_COLOUR = (255, 255, 255)
+OVERLAY_BACKGROUND = (0, 0, 0, 160)
+# Distance from the top left corner of the frame in pixels.
+OVERLAY_MARGIN = 8
+
+
+class Overlay:
+    def __init__(self, app, profiler):
+        self.app = app
+        self.ctx = app.ctx
+        self.profiler = profiler
+        self.enabled = False
+        self.font = pg.font.Font(None, OVERLAY_FONT_SIZE)
+        self.program = app.link.vao.shaders.get_program('overlay')
+        self.program['u_texture_0'] = 0
+        self.vao = self.ctx.vertex_array(self.program, [])
+        self.texture = None
+        self.frames = 0
+
+    def update_texture(self):
+        """
+        Draws the profiler's summary into the overlay's texture, as a table with a column for the stage names and
+        right aligned columns for the CPU and GPU times.
+        """
+        rows = [('', 'CPU ms', 'GPU ms')]
+        rows += [(name, f'{cpu:.2f}', '-' if gpu is None else f'{gpu:.2f}')
+                 for name, (cpu, gpu) in self.profiler.get_summary().items()]
+        widths = [max(self.font.size(row[column])[0] for row in rows) + OVERLAY_MARGIN for column in range(3)]
+        line_height = self.font.get_linesize()
+        surface = pg.Surface((sum(widths) + OVERLAY_MARGIN, line_height * len(rows) + 2 * OVERLAY_MARGIN), pg.SRCALPHA)
+        surface.fill(OVERLAY_BACKGROUND)
+        for row, cells in enumerate(rows):
+            right = OVERLAY_MARGIN
+            for column, cell in enumerate(cells):
+                text = self.font.render(cell, True, OVERLAY_COLOUR)
+                right += widths[column]
+                # Names are left aligned, times right aligned
+                x = right - widths[column] if column == 0 else right - text.get_width() - OVERLAY_MARGIN
+                surface.blit(text, (x, OVERLAY_MARGIN + row * line_height))
+        surface = pg.transform.flip(surface, flip_x=False, flip_y=True)
+
+        if self.texture is None or self.texture.size != surface.get_size():
+            if self.texture is not None:
+                self.texture.release()
+            self.texture = self.ctx.texture(surface.get_size(), components=4)
+            self.texture.filter = (mgl.NEAREST, mgl.NEAREST)
+        self.texture.write(pg.image.tostring(surface, 'RGBA'))
+
+    def render(self):
+        """
+        Draws the overlay over the frame, the profiler has to be enabled for it to have anything to show.
+        """
+        if not self.enabled:
+            return
+        if self.texture is None or self.frames % OVERLAY_INTERVAL == 0:
+            self.update_texture()
+        self.frames += 1
+
+        frame_width, frame_height = self.app.framebuffer.size
+        width, height = self.texture.size
+        left = -1 + 2 * OVERLAY_MARGIN / frame_width
+        top = 1 - 2 * OVERLAY_MARGIN / frame_height
+        self.program['u_rect'] = (left, top - 2 * height / frame_height, left + 2 * width / frame_width, top)
+        self.texture.use(location=0)
+        self.ctx.disable(mgl.DEPTH_TEST)
+        self.vao.render(mgl.TRIANGLE_STRIP, vertices=4)
+        self.ctx.enable(mgl.DEPTH_TEST)
+
+    def destroy(self):
+        self.vao.release()
+        if self.texture is not None:
+            self.texture.release()
@@ -0,0 +1,195 @@
+"""
+Frame profiler. Stages of the frame are wrapped in scopes that time them on the CPU with perf_counter and on the GPU
+with GL timer queries. Queries are double buffered: a frame's queries are read back at the end of the next frame, by
+when the GPU has finished them, so reading them never stalls the pipeline. GL_TIME_ELAPSED queries cannot be nested,
+so only the outermost scope in flight gets a GPU timer and scopes inside it are timed on the CPU only. The profiler
+keeps rolling histories of each scope's time per frame, can record a Chrome trace (chrome://tracing or
+https://ui.perfetto.dev) and is shown by the overlay (overlay.py). When disabled, a scope costs one method call.
+"""
+
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+
+import numpy as np
+
+# Whether the profiler starts enabled.
+PROFILER_ENABLED = False
+# Number of frames the rolling histories keep.
+HISTORY_FRAMES = 240
+HISTOGRAM_BINS = 20
+# Number of sets of GPU queries used in turn, a set is read back this many frames minus one after it is issued.
+QUERY_BUFFERS = 2
+# Trace events kept before recording stops, about 10 MB of JSON.
+MAX_TRACE_EVENTS = 100000
+
+# Returned by Profiler.scope when the profiler is disabled.
+NULL_SCOPE = nullcontext()
+
+
+class ProfilerScope:
+    """
+    Times the code inside a with block. Created by Profiler.scope.
+    """
+
+    def __init__(self, profiler, name, gpu):
+        self.profiler = profiler
+        self.name = name
+        self.gpu = gpu
+        self.query = None
+        self.start = 0
+
+    def __enter__(self):
+        if self.gpu and not self.profiler.gpu_active:
+            self.query = self.profiler.get_query(self.name)
+            self.profiler.gpu_active = True
+            self.query.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter()
+        if self.query is not None:
+            self.query.__exit__()
+            self.profiler.gpu_active = False
+        self.profiler.add_cpu_time(self.name, self.start, end)
+
+
+class Profiler:
+    def __init__(self, ctx, enabled=PROFILER_ENABLED, history=HISTORY_FRAMES):
+        """
+        :param ctx: The moderngl context, GPU timing is disabled if None.
+        :param enabled: Whether scopes are timed.
+        :param history: Number of frames kept in the rolling histories.
+        """
+        self.ctx = ctx
+        self.enabled = enabled
+        self.history = history
+        self.frame = 0
+        self.origin = time.perf_counter()
+        # CPU seconds of each scope in the frame being rendered, and in the last finished frame.
+        self.cpu_times = {}
+        self.last_cpu_times = {}
+        # GPU seconds of each scope in the last frame whose queries were read back.
+        self.last_gpu_times = {}
+        # Rolling histories of milliseconds per frame, by ('cpu' or 'gpu', scope name).
+        self.histories = {}
+        # Query sets used in turn: the queries, the scope name and CPU start time each one was issued for, and how
+        # many were issued in the set's frame.
+        self.query_pools = [[] for _ in range(QUERY_BUFFERS)]
+        self.query_scopes = [[] for _ in range(QUERY_BUFFERS)]
+        self.queries_used = [0] * QUERY_BUFFERS
+        self.gpu_active = False
+        self.frame_start = self.origin
+        # Chrome trace events, recorded while tracing is True.
+        self.tracing = False
+        self.trace_events = []
+
+    def scope(self, name, gpu=True):
+        """
+        Times a stage of the frame, eg. with profiler.scope('shadow pass'): render_shadows().
+        :param name: Name of the stage, the times of scopes with the same name in one frame are added up.
+        :param gpu: Whether to also time the GPU work issued inside the scope.
+        """
+        if not self.enabled:
+            return NULL_SCOPE
+        return ProfilerScope(self, name, gpu and self.ctx is not None)
+
+    def get_query(self, name):
+        """
+        Gets an unused timer query of the current frame's set, creating it the first time.
+        """
+        slot = self.frame % QUERY_BUFFERS
+        index = self.queries_used[slot]
+        if index == len(self.query_pools[slot]):
+            self.query_pools[slot].append(self.ctx.query(time=True))
+            self.query_scopes[slot].append(None)
+        self.query_scopes[slot][index] = (name, time.perf_counter())
+        self.queries_used[slot] += 1
+        return self.query_pools[slot][index]
+
+    def add_cpu_time(self, name, start, end):
+        self.cpu_times[name] = self.cpu_times.get(name, 0) + end - start
+        if self.tracing:
+            self.add_trace_event(name, 'CPU', start, end - start)
+
+    def add_trace_event(self, name, thread, start, duration):
+        """
+        Records a complete ('X') trace event, times are in seconds.
+        """
+        if len(self.trace_events) < MAX_TRACE_EVENTS:
+            self.trace_events.append({'name': name, 'ph': 'X', 'pid': 0, 'tid': thread,
+                                      'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6})
+
+    def begin_frame(self):
+        self.frame_start = time.perf_counter()
+        self.queries_used[self.frame % QUERY_BUFFERS] = 0
+
+    def end_frame(self):
+        """
+        Stores the frame's CPU times and reads back the GPU times of the previous frame.
+        """
+        end = time.perf_counter()
+        if self.enabled:
+            self.cpu_times['frame'] = end - self.frame_start
+            if self.tracing:
+                self.add_trace_event(f'frame {self.frame}', 'CPU', self.frame_start, end - self.frame_start)
+        self.last_cpu_times, self.cpu_times = self.cpu_times, {}
+        self.add_to_histories('cpu', self.last_cpu_times)
+
+        # The previous frame's queries had a whole frame to finish, and are reused by the next frame.
+        slot = (self.frame + 1) % QUERY_BUFFERS
+        if self.queries_used[slot]:
+            gpu_times = {}
+            for query, (name, start) in zip(self.query_pools[slot], self.query_scopes[slot][:self.queries_used[slot]]):
+                elapsed = query.elapsed * 1e-9
+                gpu_times[name] = gpu_times.get(name, 0) + elapsed
+                if self.tracing:
+                    # Timer queries only measure durations, the GPU events are drawn from the CPU start of their scope.
+                    self.add_trace_event(name, 'GPU', start, elapsed)
+            self.queries_used[slot] = 0
+            self.last_gpu_times = gpu_times
+            self.add_to_histories('gpu', gpu_times)
+        self.frame += 1
+
+    def add_to_histories(self, kind, times):
+        for name, seconds in times.items():
+            self.histories.setdefault((kind, name), deque(maxlen=self.history)).append(seconds * 1000)
+
+    def get_summary(self):
+        """
+        Gets the mean milliseconds per frame of each scope over the rolling history.
+        :return: Dictionary of scope names and their (CPU, GPU) means, GPU is None for scopes without GPU times.
+        """
+        names = dict.fromkeys(name for _, name in self.histories)
+        summary = {}
+        for name in names:
+            cpu, gpu = self.histories.get(('cpu', name)), self.histories.get(('gpu', name))
+            summary[name] = (float(np.mean(cpu)) if cpu else 0.0, float(np.mean(gpu)) if gpu else None)
+        return summary
+
+    def get_histogram(self, name, kind='cpu', bins=HISTOGRAM_BINS):
+        """
+        Gets the histogram of a scope's milliseconds per frame over the rolling history.
+        :return: The counts and bin edges, like np.histogram.
+        """
+        return np.histogram(np.array(self.histories.get((kind, name), ()), dtype='f8'), bins=bins)
+
+    def report(self):
+        lines = [f'{"":<16}{"CPU ms":>8}{"GPU ms":>8}']
+        for name, (cpu, gpu) in self.get_summary().items():
+            lines.append(f'{name:<16}{cpu:>8.2f}' + (f'{gpu:>8.2f}' if gpu is not None else f'{"-":>8}'))
+        return '\n'.join(lines)
+
+    def destroy(self):
+        # moderngl queries have no release, they are deleted with the context
+        for pool in self.query_pools:
+            pool.clear()
+
+    def export_trace(self, path):
+        """
+        Writes the recorded events as Chrome trace event JSON.
+        """
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': self.trace_events, 'displayTimeUnit': 'ms'}, file)
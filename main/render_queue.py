@@ -0,0 +1,166 @@
+"""
+Render queue that sorts the draws of a frame by render state. Each draw gets a sort key built from its pass, program,
+texture, VAO and depth, so objects sharing a program and texture are drawn one after another and redundant program
+and texture binds are skipped. Opaque objects are drawn front-to-back (helping early depth rejection), transparent
+objects back-to-front after them so they blend over what is behind them. The depth pre-pass draws the opaque objects'
+depth only, front-to-back, before the opaque pass.
+The queue only talks to the models it is given (their shaders, textures, VAOs and draw methods), so it can be driven
+with mock objects and no GL context.
+"""
+
+from profiler import Profiler
+
+# Passes, in the order they are drawn.
+PASS_SHADOW = 0
+PASS_DEPTH = 1
+PASS_OPAQUE = 2
+PASS_TRANSPARENT = 3
+# Opaque draws counted by the overdraw view (overdraw.py), drawn in the opaque pass's order with the depth-only VAOs.
+PASS_OVERDRAW = 4
+
+
+class RenderStats:
+    """
+    Per-frame counters of program binds, texture binds, draw calls and triangles issued by the queue.
+    """
+
+    def __init__(self):
+        self.program_binds = 0
+        self.texture_binds = 0
+        self.draw_calls = 0
+        self.triangles = 0
+        self.frame = (0, 0, 0, 0)
+
+    def add_draws(self, draws):
+        """
+        Counts the (draw calls, triangles) returned by a model's draw method.
+        """
+        draw_calls, triangles = draws
+        self.draw_calls += draw_calls
+        self.triangles += triangles
+
+    def end_frame(self):
+        """
+        Stores the counters of the finished frame and resets them.
+        """
+        self.frame = (self.program_binds, self.texture_binds, self.draw_calls, self.triangles)
+        self.program_binds = self.texture_binds = self.draw_calls = self.triangles = 0
+
+    def __repr__(self):
+        program_binds, texture_binds, draw_calls, triangles = self.frame
+        return (f'program binds={program_binds} texture binds={texture_binds} draw calls={draw_calls} '
+                f'triangles={triangles}')
+
+
+class RenderQueue:
+    """
+    Collects the draws of one pass at a time, sorts them and issues them with as few state changes as possible.
+    """
+
+    def __init__(self, profiler=None):
+        """
+        :param profiler: Profiler each model's draw is timed with, on the CPU only as the passes hold the GPU timer.
+        """
+        self.commands = []
+        self.stats = RenderStats()
+        # Small ids for GL objects, in the order they are first seen, so sort keys stay stable between frames.
+        self.ids = {}
+        self.next_id = 0
+        self.bound_program = None
+        self.bound_texture = None
+        self.profiler = profiler or Profiler(None, enabled=False)
+
+    def get_id(self, gl_object):
+        key = id(gl_object)
+        if key not in self.ids:
+            self.ids[key] = self.next_id
+            self.next_id += 1
+        return self.ids[key]
+
+    def forget(self, *gl_objects):
+        """
+        Drops the ids of GL objects that are about to be released, so the ids of objects streamed in and out do not
+        pile up, and a new object that reuses a released object's address does not inherit its id. None (no texture or
+        no depth VAO) is skipped, it is shared by every draw without one.
+        """
+        for gl_object in gl_objects:
+            if gl_object is not None:
+                self.ids.pop(id(gl_object), None)
+
+    def get_sort_key(self, render_pass, program, texture, vao, depth):
+        """
+        Builds the sort key of a draw. Opaque (and shadow) draws are grouped by state first and sorted front-to-back
+        inside a group, transparent draws are sorted back-to-front only, as their order matters more than state.
+        Depth pre-pass draws have no texture and few programs, so they are grouped by program only and then sorted
+        front-to-back, which rejects the most fragments.
+        :param render_pass: PASS_SHADOW, PASS_DEPTH, PASS_OPAQUE or PASS_TRANSPARENT.
+        :param depth: Distance from the eye to the object.
+        :return: A tuple, smaller keys are drawn first.
+        """
+        state = (self.get_id(program), self.get_id(texture), self.get_id(vao))
+        if render_pass == PASS_TRANSPARENT:
+            return render_pass, -depth, state
+        if render_pass == PASS_DEPTH:
+            return render_pass, state[:1], depth
+        return render_pass, state, depth
+
+    def submit(self, render_pass, model, depth, planes=None):
+        """
+        Adds a draw of a model to the queue.
+        :param planes: Frustum planes of the pass, passed on to the model to cull its clusters or instances.
+        """
+        if render_pass == PASS_SHADOW:
+            program, texture, vao = model.shadow_shader, None, model.shadow_vao
+        elif render_pass == PASS_DEPTH:
+            program, texture, vao = model.depth_shader, None, model.depth_vao
+        else:
+            program, texture, vao = model.shader, model.texture, model.vao
+        key = self.get_sort_key(PASS_OPAQUE if render_pass == PASS_OVERDRAW else render_pass, program, texture, vao,
+                                depth)
+        if render_pass == PASS_OVERDRAW:
+            program, texture = model.depth_shader, None
+        self.commands.append((key, len(self.commands), render_pass, program, texture, model, planes))
+
+    def bind_program(self, program):
+        """
+        Records a program switch, moderngl binds the program of a VAO when it renders so only switches are counted.
+        """
+        if program is not self.bound_program:
+            self.bound_program = program
+            self.stats.program_binds += 1
+
+    def bind_texture(self, texture):
+        """
+        Binds a texture to location 0, unless it is already bound.
+        """
+        if texture is not None and texture is not self.bound_texture:
+            texture.use(location=0)
+            self.bound_texture = texture
+            self.stats.texture_binds += 1
+
+    def reset_state(self):
+        """
+        Forgets the bound state, eg. after something outside the queue (the skybox) changed it.
+        """
+        self.bound_program = None
+        self.bound_texture = None
+
+    def flush(self):
+        """
+        Sorts and issues every queued draw, then empties the queue.
+        """
+        self.commands.sort(key=lambda command: command[:2])
+        for _, _, render_pass, program, texture, model, planes in self.commands:
+            self.bind_program(program)
+            with self.profiler.scope(model.vao_name, gpu=False):
+                if render_pass == PASS_SHADOW:
+                    model.update_shadow()
+                    self.stats.add_draws(model.draw_shadow(planes))
+                elif render_pass in (PASS_DEPTH, PASS_OVERDRAW):
+                    model.update_depth()
+                    self.stats.add_draws(model.draw_depth(planes))
+                else:
+                    self.bind_texture(texture)
+                    model.write_model_matrix()
+                    self.stats.add_draws(model.draw(planes))
+        self.commands.clear()
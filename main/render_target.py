@@ -0,0 +1,145 @@
+"""
+Dynamic resolution. The scene is rendered into an offscreen colour and depth framebuffer at a fraction of the output's
+resolution, then stretched over the output (the window, or the headless framebuffer) with a bilinear filter, or with a
+contrast adaptive sharpening filter that restores some of the detail lost to the lower resolution. Rendering fewer
+pixels makes the fragment shaders, which dominate the frame at high resolutions, cheaper. The DynamicResolution
+controller picks the scale from the measured frame time, so fill rate bound scenes keep within a frame time budget.
+"""
+
+import math
+
+import moderngl as mgl
+
+UPSCALE_FILTERS = ('bilinear', 'sharpen')
+# Strength of the sharpening filter, 0 to 1.
+SHARPNESS = 0.5
+
+# Frame time budget of the controller in milliseconds, and the range of scales it picks from. Scales are rounded to
+# SCALE_QUANTUM, so small changes in frame time do not recreate the render target.
+FRAME_BUDGET_MS = 1000 / 60
+MIN_RENDER_SCALE = 0.5
+MAX_RENDER_SCALE = 1.0
+SCALE_QUANTUM = 0.05
+# Frames between changes of the scale, and the weight of each frame in the smoothed frame time.
+ADJUST_FRAMES = 15
+FRAME_TIME_SMOOTHING = 0.1
+# The scale is kept while the smoothed frame time is between this share of the budget and the budget, so it does not
+# flip between two scales.
+BUDGET_HEADROOM = 0.85
+# Largest change of the scale at once.
+MAX_SCALE_CHANGE = 0.15
+
+
+def get_scaled_size(size, scale):
+    """
+    Gets the size of a render target at a scale of the output size, at least 1x1.
+    """
+    return tuple(max(int(round(length * scale)), 1) for length in size)
+
+
+class DynamicResolution:
+    """
+    Picks the render scale from the frame time. At a fill rate bound frame, the frame time grows with the number of
+    pixels, ie. with the square of the scale, so the scale that fits the budget is the current scale times
+    sqrt(budget / frame time).
+    """
+
+    def __init__(self, budget_ms=FRAME_BUDGET_MS, min_scale=MIN_RENDER_SCALE, max_scale=MAX_RENDER_SCALE):
+        self.budget_ms = budget_ms
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.scale = max_scale
+        self.frame_ms = None
+        self.frames = 0
+
+    def update(self, frame_ms):
+        """
+        Adds a frame's time.
+        :return: The render scale, changed at most once every ADJUST_FRAMES frames.
+        """
+        if self.frame_ms is None:
+            self.frame_ms = frame_ms
+        self.frame_ms += (frame_ms - self.frame_ms) * FRAME_TIME_SMOOTHING
+        self.frames += 1
+        if self.frames < ADJUST_FRAMES:
+            return self.scale
+        self.frames = 0
+        if self.budget_ms * BUDGET_HEADROOM <= self.frame_ms <= self.budget_ms:
+            return self.scale
+
+        target = self.scale * math.sqrt(self.budget_ms / max(self.frame_ms, 1e-3))
+        target = min(max(target, self.scale - MAX_SCALE_CHANGE), self.scale + MAX_SCALE_CHANGE)
+        target = round(target / SCALE_QUANTUM) * SCALE_QUANTUM
+        scale = round(min(max(target, self.min_scale), self.max_scale), 3)
+        if scale != self.scale:
+            # The smoothed time was measured at the old scale, it is scaled to what the new scale should take
+            self.frame_ms *= (scale / self.scale) ** 2
+            self.scale = scale
+        return self.scale
+
+
+class RenderTarget:
+    def __init__(self, ctx, program, output, scale=1.0):
+        """
+        :param program: The upscale program, with or without sharpening.
+        :param output: The framebuffer the target is upscaled into.
+        :param scale: Resolution of the target relative to the output.
+        """
+        self.ctx = ctx
+        self.program = program
+        self.program['u_texture_0'] = 0
+        if 'u_sharpness' in self.program:
+            self.program['u_sharpness'] = SHARPNESS
+        self.output = output
+        self.vao = ctx.vertex_array(program, [])
+        self.scale = None
+        self.resizes = 0
+        self.texture = self.depth = self.framebuffer = None
+        self.resize(scale)
+
+    @property
+    def size(self):
+        return self.framebuffer.size
+
+    def resize(self, scale):
+        """
+        Recreates the framebuffer at a new scale, if the scale changed.
+        """
+        if scale == self.scale:
+            return
+        self.release()
+        self.scale = scale
+        self.resizes += 1
+        size = get_scaled_size(self.output.size, scale)
+        self.texture = self.ctx.texture(size, components=4)
+        self.texture.filter = (mgl.LINEAR, mgl.LINEAR)
+        self.texture.repeat_x = self.texture.repeat_y = False
+        self.depth = self.ctx.depth_renderbuffer(size)
+        self.framebuffer = self.ctx.framebuffer(color_attachments=[self.texture], depth_attachment=self.depth)
+
+    def use(self):
+        self.framebuffer.use()
+
+    def upscale(self):
+        """
+        Draws the target over the whole output framebuffer.
+        """
+        self.output.use()
+        self.texture.use(location=0)
+        self.ctx.disable(mgl.DEPTH_TEST)
+        self.vao.render(mgl.TRIANGLES, vertices=3)
+        self.ctx.enable(mgl.DEPTH_TEST)
+
+    def __repr__(self):
+        width, height = self.size
+        return f'render scale {self.scale:.2f} ({width}x{height}), resized {self.resizes - 1} times'
+
+    def release(self):
+        for gl_object in (self.framebuffer, self.depth, self.texture):
+            if gl_object is not None:
+                gl_object.release()
+
+    def destroy(self):
+        self.release()
+        self.vao.release()
+
@@ -2,6 +2,23 @@
 Class that renders the scene and it's shadows
 """
 
+import numpy as np
+import glm
+
+from camera import FOV, NEAR
+from culling import get_frustum_planes, get_visible, transform_spheres, transform_boxes, CullingStats
+from occlusion import OcclusionCuller, OCCLUDER_MIN_SCREEN_SIZE
+from overdraw import OverdrawCounter
+from render_queue import RenderQueue, RenderStats, PASS_SHADOW, PASS_DEPTH, PASS_OPAQUE, PASS_TRANSPARENT, PASS_OVERDRAW
+from shadows import ShadowMap
+
+# Skips objects hidden behind the large objects in front of the camera (occlusion.py), toggled with F4.
+OCCLUSION_CULLING = True
+# Draws the opaque objects' depth before shading them, so default.frag runs once per pixel, toggled with F5. It pays
+# off when fragment shading costs more than drawing the opaque geometry a second time.
+DEPTH_PREPASS = False
+
+
 class Renderer:
     def __init__(self, app):
         self.app = app
@@ -9,30 +26,217 @@ class Renderer:
         self.link = app.link
         self.scene = app.scene
 
-        # Depth buffer for shadows
+        # Depth buffer for shadows, and the light projection it is rendered with
         self.depth_texture = self.link.texture.textures['depth_texture']
-        self.depth_framebuffer = self.ctx.framebuffer(depth_attachment=self.depth_texture)
+        self.shadow_map = ShadowMap(app, self.depth_texture)
+
+        # Per-frame counters of drawn and culled objects for the main pass, the shadow map keeps its own per cascade
+        self.stats = {'main': CullingStats(), 'occlusion': CullingStats()}
+        self.occlusion_culling = OCCLUSION_CULLING
+        self.occlusion_culler = OcclusionCuller(NEAR)
+        self.depth_prepass = DEPTH_PREPASS
+        # Debug view counting the fragments shaded per pixel, toggled with F6
+        self.overdraw = False
+        self.overdraw_counter = OverdrawCounter(self.ctx, self.link.vao.shaders.get_program('overdraw'))
+
+        # Times each stage of the frame, and each model's draws
+        self.profiler = app.profiler
+        # Sorts the draws of each pass by render state and depth
+        self.queue = RenderQueue(self.profiler)
+
+    @staticmethod
+    def get_bounds(objects):
+        """
+        Gathers the model matrices and bounds of objects into arrays.
+        :return: The (N, 4, 4) model matrices and the (N, 3) centres, (N,) radii, (N, 3) minimums and (N, 3) maximums
+        of the bounds.
+        """
+        if not objects:
+            return np.zeros((0, 4, 4)), np.zeros((0, 3)), np.zeros(0), np.zeros((0, 3)), np.zeros((0, 3))
+        centres, radii, mins, maxs = zip(*(obj.bounds for obj in objects))
+        return (np.array([obj.model_matrix for obj in objects], dtype='f8'), np.array(centres, dtype='f8'),
+                np.array(radii, dtype='f8'), np.array(mins, dtype='f8'), np.array(maxs, dtype='f8'))
+
+    def get_visible_objects(self, planes, stats, eye, objects=None, bounds=None):
+        """
+        Frustum culls the scene's objects, testing the world space bounds of every object in one vectorized pass.
+        :param planes: The frustum planes of the pass.
+        :param stats: The counters of the pass.
+        :param eye: Position the pass is rendered from, used for the depth of each object.
+        :param objects: The objects to cull, all of the scene's objects if None.
+        :param bounds: The objects' arrays from get_bounds, gathered here if None.
+        :return: The objects inside the frustum, and the distance from the eye to the centre of each one.
+        """
+        objects = self.scene.objects if objects is None else objects
+        if not objects:
+            return [], []
+        model_matrices, centres, radii, mins, maxs = bounds or self.get_bounds(objects)
+        visible = get_visible(planes, model_matrices, centres, radii, mins, maxs)
+        stats.drawn = int(visible.sum())
+        stats.culled = len(objects) - stats.drawn
+        world_centres, _ = transform_spheres(centres[visible], radii[visible], model_matrices[visible])
+        depths = np.linalg.norm(world_centres - np.array(eye, dtype='f8'), axis=1)
+        return [obj for obj, is_visible in zip(objects, visible) if is_visible], depths.tolist()
+
+    def cull_occluded(self, objects, depths, view_projection):
+        """
+        Occlusion culls the objects in the camera's frustum. The objects covering the most of the screen are drawn into
+        the occlusion culler's depth buffer, then every object's bounding box is tested against it.
+        :param objects: The objects in the frustum, and depths the distance from the camera to each one.
+        :param view_projection: The camera's projection * view matrix.
+        :return: The objects that are not hidden, and their depths.
+        """
+        stats = self.stats['occlusion']
+        if not objects:
+            stats.drawn = stats.culled = 0
+            return objects, depths
+        model_matrices, centres, radii, mins, maxs = self.get_bounds(objects)
+        _, world_radii = transform_spheres(centres, radii, model_matrices)
+        distances = np.array(depths)
+        with np.errstate(divide='ignore'):
+            screen_sizes = np.where(distances > world_radii, world_radii / (distances * np.tan(glm.radians(FOV) / 2)),
+                                    np.inf)
+        occluders = [index for index, obj in enumerate(objects)
+                     if obj.occludes and screen_sizes[index] >= OCCLUDER_MIN_SCREEN_SIZE]
+        view_projection = np.array(view_projection, dtype='f8')
+        self.occlusion_culler.render(view_projection, [objects[index].vbo.mesh for index in occluders],
+                                     model_matrices[occluders])
+        occluded = self.occlusion_culler.get_occluded(view_projection, *transform_boxes(mins, maxs, model_matrices))
+        stats.culled = int(occluded.sum())
+        stats.drawn = len(objects) - stats.culled
+        return ([obj for obj, hidden in zip(objects, occluded) if not hidden],
+                [depth for depth, hidden in zip(depths, occluded) if not hidden])
 
     def render_shadow(self):
         """
-        Renders the scene's shadows
+        Renders the scene's shadows into each shadow cascade, only for objects (and clusters of large objects) that
+        intersect the cascade's light frustum. The shadow maps from the last frame are kept if neither the light, the
+        camera nor any shadow caster has moved.
         """
-        self.depth_framebuffer.clear()
-        self.depth_framebuffer.use()
-        for obj in self.scene.objects:
-            obj.render_shadow()
+        casters = [obj for obj in self.scene.objects if obj.casts_shadow]
+        bounds = self.get_bounds(casters)
+        model_matrices, _, _, mins, maxs = bounds
+        if not self.shadow_map.update(model_matrices, mins, maxs):
+            return
+        self.shadow_map.use()
+        light = self.app.light
+        for index, matrix in enumerate(self.shadow_map.matrices):
+            self.shadow_map.use_cascade(index)
+            planes = get_frustum_planes(matrix)
+            objects, depths = self.get_visible_objects(planes, self.shadow_map.stats[index], light.position, casters,
+                                                       bounds)
+            for obj, depth in zip(objects, depths):
+                self.queue.submit(PASS_SHADOW, obj, depth, planes)
+            self.queue.flush()
+
+    def render_depth(self, opaque, planes, framebuffer):
+        """
+        Depth pre-pass, draws the opaque objects' depth only, front-to-back, with the position-only shadow program.
+        :param opaque: (object, depth) pairs of the opaque objects.
+        :param planes: The camera's frustum planes.
+        :param framebuffer: The bound framebuffer, its colour writes are turned off for the pass.
+        """
+        framebuffer.color_mask = False, False, False, False
+        for obj, depth in opaque:
+            self.queue.submit(PASS_DEPTH, obj, depth, planes)
+        self.queue.flush()
+        framebuffer.color_mask = True, True, True, True
+
+    def render_opaque(self, opaque, planes, framebuffer, render_pass=PASS_OPAQUE):
+        """
+        Draws the opaque objects sorted by render state. After the depth pre-pass, only the fragments at the depth it
+        laid down pass the depth test, and the depth buffer is left as it is.
+        :param render_pass: PASS_OPAQUE, or PASS_OVERDRAW to count the fragments the opaque pass shades.
+        """
+        if self.depth_prepass:
+            self.ctx.depth_func = '=='
+            framebuffer.depth_mask = False
+        for obj, depth in opaque:
+            self.queue.submit(render_pass, obj, depth, planes)
+        self.queue.flush()
+        if self.depth_prepass:
+            self.ctx.depth_func = '<'
+            framebuffer.depth_mask = True
+
+    def count_overdraw(self, opaque, planes):
+        """
+        Draws the opaque pass again into the overdraw counter, the same way it was drawn into the frame. Its draws are
+        counted apart, so the frame's counters are the same with the overdraw view on.
+        """
+        counter = self.overdraw_counter
+        counter.use(self.app.scene_framebuffer.size)
+        frame_stats, self.queue.stats = self.queue.stats, RenderStats()
+
+        def draw():
+            if self.depth_prepass:
+                self.render_depth(opaque, planes, counter.framebuffer)
+            self.render_opaque(opaque, planes, counter.framebuffer, PASS_OVERDRAW)
+        counter.count(draw)
+        self.queue.stats = frame_stats
+        self.app.scene_framebuffer.use()
 
     def render(self):
         """
-        Renders each object in the object list, then the skybox.
+        Renders each opaque object (and clusters of large objects) in the camera's frustum sorted by render state and
+        front-to-back, after their depth if the depth pre-pass is on, then the skybox, then transparent objects
+        back-to-front.
+        """
+        profiler = self.profiler
+        self.app.scene_framebuffer.use()
+        self.queue.reset_state()
+        with profiler.scope('streaming', gpu=False):
+            # Loads the objects near the camera and evicts the least recently used ones
+            self.scene.streaming.update(self.app.camera.position)
+        with profiler.scope('scene update', gpu=False):
+            # Rebuilds the model matrices of the transforms that changed since the last frame, in one batch, in
+            # between the last two simulation steps
+            self.app.transforms.update(self.app.alpha)
+        with profiler.scope('shadow pass'):
+            self.render_shadow()
+        self.app.scene_framebuffer.use()
+        with profiler.scope('main pass'):
+            view_projection = self.app.camera.projection_matrix * self.app.camera.view_matrix
+            planes = get_frustum_planes(view_projection)
+            objects, depths = self.get_visible_objects(planes, self.stats['main'], self.app.camera.position)
+            if self.occlusion_culling:
+                with profiler.scope('occlusion', gpu=False):
+                    objects, depths = self.cull_occluded(objects, depths, view_projection)
+            opaque, transparent = [], []
+            for obj, depth in zip(objects, depths):
+                (transparent if obj.transparent else opaque).append((obj, depth))
+        framebuffer = self.app.scene_framebuffer
+        if self.depth_prepass:
+            with profiler.scope('depth prepass'):
+                self.render_depth(opaque, planes, framebuffer)
+        with profiler.scope('main pass'):
+            self.render_opaque(opaque, planes, framebuffer)
+        if self.overdraw:
+            with profiler.scope('overdraw'):
+                self.count_overdraw(opaque, planes)
+
+        with profiler.scope('skybox'):
+            self.queue.stats.add_draws(self.scene.skybox.render())
+        self.queue.reset_state()
+
+        with profiler.scope('main pass'):
+            for obj, depth in transparent:
+                self.queue.submit(PASS_TRANSPARENT, obj, depth, planes)
+            self.queue.flush()
+        if self.overdraw:
+            with profiler.scope('overdraw'):
+                self.overdraw_counter.render()
+
+    def report(self):
+        """
+        Gets the culling, render state and uniform write counters of the last frame.
         """
-        self.app.ctx.screen.use()
-        self.render_shadow()
-        self.scene.update()
-        self.app.ctx.screen.use()
-        for obj in self.scene.objects:
-            obj.render()
-        self.scene.skybox.render()
+        occlusion = (f', occlusion: {self.stats["occlusion"]} by {self.occlusion_culler}' if self.occlusion_culling
+                     else '')
+        prepass = ' after a depth pre-pass' if self.depth_prepass else ''
+        overdraw = f', overdraw: {self.overdraw_counter.stats}' if self.overdraw else ''
+        return (f'Shadow pass: {self.shadow_map}, main pass{prepass}: {self.stats["main"]}{occlusion}{overdraw}, '
+                f'{self.queue.stats}, {self.app.uniforms.stats}')
 
     def destroy(self):
-        self.depth_framebuffer.release()
+        self.shadow_map.destroy()
+        self.overdraw_counter.destroy()
@@ -0,0 +1,216 @@
+"""
+GPU resource accounting. The context is wrapped so every buffer, texture, renderbuffer, vertex array and program it
+creates is recorded with its owner (the asset being loaded, or else the module that created it), where it was created,
+and the frame it was created and released in. Byte sizes are worked out from each object's current size and format,
+MIP chains included, so the registry can report the GPU memory each asset uses and the total resident, and flag every
+handle still alive at shutdown as a leak. The registry only needs objects with moderngl's attributes, so it can be
+tested with a mock context.
+"""
+
+import os
+import sys
+from contextlib import contextmanager
+
+import moderngl as mgl
+
+# Context methods whose objects are tracked, and the kind of resource each one creates.
+TRACKED_FACTORIES = {'buffer': 'buffer', 'texture': 'texture', 'texture_array': 'texture', 'texture_cube': 'texture',
+                     'depth_texture': 'texture', 'renderbuffer': 'renderbuffer', 'depth_renderbuffer': 'renderbuffer',
+                     'vertex_array': 'vertex array', 'program': 'program'}
+MIPMAP_FILTERS = (mgl.NEAREST_MIPMAP_NEAREST, mgl.LINEAR_MIPMAP_NEAREST, mgl.NEAREST_MIPMAP_LINEAR,
+                  mgl.LINEAR_MIPMAP_LINEAR)
+
+
+def is_released(gl_object):
+    """
+    Whether a moderngl object was released, moderngl swaps a released object's internal object for an InvalidObject.
+    """
+    return type(gl_object.mglo).__name__ == 'InvalidObject'
+
+
+def get_mip_chain_texels(width, height):
+    """
+    Gets the number of texels of a full MIP chain, from width x height down to 1x1.
+    """
+    texels = width * height
+    while width > 1 or height > 1:
+        width, height = max(width // 2, 1), max(height // 2, 1)
+        texels += width * height
+    return texels
+
+
+def get_object_size(factory, gl_object):
+    """
+    Gets the GPU bytes of an object from its size and format. Textures sampled with a MIP map filter are counted with
+    their whole MIP chain. Vertex arrays and programs count as 0 bytes.
+    """
+    if factory == 'buffer':
+        return gl_object.size
+    if factory in ('vertex_array', 'program'):
+        return 0
+    texel_size = gl_object.components * int(gl_object.dtype[1])
+    if factory in ('renderbuffer', 'depth_renderbuffer'):
+        width, height = gl_object.size
+        return width * height * texel_size * max(gl_object.samples, 1)
+
+    if factory == 'texture_array':
+        width, height, layers = gl_object.size
+    else:
+        (width, height), layers = gl_object.size, 6 if factory == 'texture_cube' else 1
+    mipmapped = getattr(gl_object, 'filter', (None,))[0] in MIPMAP_FILTERS
+    texels = get_mip_chain_texels(width, height) if mipmapped else width * height
+    return texels * layers * texel_size * max(getattr(gl_object, 'samples', 0), 1)
+
+
+class Resource:
+    """
+    A tracked GPU object and its bookkeeping.
+    """
+
+    def __init__(self, gl_object, factory, owner, site, frame):
+        self.gl_object = gl_object
+        self.factory = factory
+        self.kind = TRACKED_FACTORIES[factory]
+        self.owner = owner
+        # File and line the object was created from
+        self.site = site
+        self.created = frame
+        self.released = None
+
+    @property
+    def size(self):
+        return get_object_size(self.factory, self.gl_object)
+
+
+class TrackedContext:
+    """
+    Wraps a context, recording the objects its tracked factory methods create. Everything else is passed through to the
+    context.
+    """
+
+    def __init__(self, ctx, registry):
+        object.__setattr__(self, 'ctx', ctx)
+        object.__setattr__(self, 'registry', registry)
+
+    def __getattr__(self, name):
+        attribute = getattr(self.ctx, name)
+        if name not in TRACKED_FACTORIES:
+            return attribute
+
+        def create(*args, **kwargs):
+            return self.registry.add(attribute(*args, **kwargs), name)
+        return create
+
+    def __setattr__(self, name, value):
+        setattr(self.ctx, name, value)
+
+
+class ResourceRegistry:
+    def __init__(self):
+        self.resources = []
+        # Resources released so far, and the frames they lived for in total
+        self.released = 0
+        self.released_frames = 0
+        self.owners = []
+        self.frame = 0
+
+    def wrap(self, ctx):
+        """
+        :return: The context wrapped so the objects it creates are tracked.
+        """
+        return TrackedContext(ctx, self)
+
+    @contextmanager
+    def owner(self, name):
+        """
+        Attributes every object created inside the with block to an owner, eg. the asset being loaded.
+        """
+        self.owners.append(name)
+        try:
+            yield
+        finally:
+            self.owners.pop()
+
+    def add(self, gl_object, factory):
+        """
+        Records an object created by the wrapped context.
+        :return: The object.
+        """
+        # The caller of the wrapped factory method
+        frame = sys._getframe(2)
+        module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+        # Programs are shared by every asset drawn with them, so they belong to the module compiling them
+        owner = self.owners[-1] if self.owners and factory != 'program' else module
+        self.resources.append(Resource(gl_object, factory, owner, f'{module}.py:{frame.f_lineno}', self.frame))
+        return gl_object
+
+    def collect(self, frame=None):
+        """
+        Drops the records of released objects. Called once per frame.
+        :param frame: The current frame number, the registry counts frames itself if None.
+        """
+        self.frame = self.frame + 1 if frame is None else frame
+        alive = []
+        for resource in self.resources:
+            if is_released(resource.gl_object):
+                resource.released = self.frame
+                self.released += 1
+                self.released_frames += resource.released - resource.created
+            else:
+                alive.append(resource)
+        self.resources = alive
+
+    @property
+    def resident_bytes(self):
+        """
+        GPU bytes of every live object.
+        """
+        self.collect(self.frame)
+        return sum(resource.size for resource in self.resources)
+
+    def get_owner_sizes(self):
+        """
+        Gets the live objects of each owner by kind.
+        :return: {owner: {kind: (count, bytes)}}
+        """
+        self.collect(self.frame)
+        owners = {}
+        for resource in self.resources:
+            kinds = owners.setdefault(resource.owner, {})
+            count, size = kinds.get(resource.kind, (0, 0))
+            kinds[resource.kind] = (count + 1, size + resource.size)
+        return owners
+
+    def report(self):
+        """
+        Creates a report of the GPU memory each owner uses, largest first.
+        """
+        kinds = list(dict.fromkeys(TRACKED_FACTORIES.values()))
+        owners = self.get_owner_sizes()
+        lines = [f"{'owner':<16}{'MB':>8}" + ''.join(f'{kind + "s":>15}' for kind in kinds)]
+        for owner, sizes in sorted(owners.items(), key=lambda item: -sum(size for _, size in item[1].values())):
+            total = sum(size for _, size in sizes.values())
+            lines.append(f'{owner:<16}{total / 2 ** 20:>8.2f}' +
+                         ''.join(f'{sizes.get(kind, (0, 0))[0]:>15}' for kind in kinds))
+        lifetime = self.released_frames / self.released if self.released else 0
+        lines.append(f'GPU memory resident: {self.resident_bytes / 2 ** 20:.1f} MB in {len(self.resources)} objects, '
+                     f'{self.released} released after {lifetime:.0f} frames on average')
+        return '\n'.join(lines)
+
+    def get_leaks(self):
+        """
+        Gets the objects still alive, to be called once everything was meant to be released.
+        """
+        self.collect(self.frame)
+        return list(self.resources)
+
+    def report_leaks(self):
+        leaks = self.get_leaks()
+        if not leaks:
+            return 'No GPU resources leaked'
+        lines = [f'{len(leaks)} GPU resources leaked ({sum(leak.size for leak in leaks) / 2 ** 20:.1f} MB):']
+        for leak in leaks:
+            lines.append(f'  {leak.kind} of {leak.owner}, {leak.size} bytes, created at frame {leak.created} by '
+                         f'{leak.site}')
+        return '\n'.join(lines)
+
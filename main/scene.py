@@ -1,63 +1,121 @@
 """
-Implements the actual scene, add objects here.
+Implements the actual scene, its objects are listed in a scene manifest (scene_manifest.py).
 """
 
+from functools import partial
+
 from model import *
 from vbo import *
+from loader import AssetLoader
+from scene_manifest import load_manifest, get_transforms, SCENE_MANIFEST
+from streaming import ResidencyManager
 import moderngl as mgl
 
+# Runs the vertex cache optimisation stage (mesh_optimiser.py) on meshes when their cache is compiled.
+OPTIMISE_MESHES = True
+# Packs the textures of every object into one texture array (texture_array.py), so they are bound once per frame.
+USE_TEXTURE_ARRAY = True
+# Streams the objects marked "stream" in the manifest in and out around the camera (streaming.py), instead of loading
+# them at startup.
+STREAMING = True
+
 
 class Scene:
     """
     A class which stores and manages objects in a scene
     """
-    def __init__(self, app):
+    def __init__(self, app, manifest=SCENE_MANIFEST):
+        """
+        :param manifest: The scene manifest the objects are loaded from.
+        """
         self.app = app
+        self.manifest = manifest
         self.objects = []
+        # Water models, rotated every frame
+        self.water_models = []
+        self.streamed = []
+        self.loader = AssetLoader(app, optimise_meshes=OPTIMISE_MESHES, use_texture_array=USE_TEXTURE_ARRAY)
         self.load()
+        self.loader.finish()
+        print(self.loader.report())
         self.skybox = SkyBox(app)
+        # Headless runs load the objects in range straight away, so every run renders the same frames
+        self.streaming = ResidencyManager(app, self, self.streamed, budget=app.stream_budget,
+                                          synchronous=app.headless, optimise_meshes=OPTIMISE_MESHES)
 
     def add_object(self, name, obj_file, texture_file, rotation=(0, 0, 0), position=(0, 0, 0), water=False):
         """
-        Calls relevant methods to insert an object into tee scene (texture, vao, vbo, model methods)
+        Calls relevant methods to insert an object into tee scene (texture, vao, vbo, model methods). The texture and
+        vbo are loaded in the background, the model is created once they have been uploaded.
+        """
+        self.loader.load_object(name, obj_file, texture_file,
+                                callback=partial(self.add_model, name, rotation, position, water))
+
+    def add_model(self, name, rotation, position, water):
+        """
+        Creates the vao and model of an object once its texture and vbo are loaded.
         """
-        self.app.link.texture.add_texture(texture_file, name)
-        self.app.link.vao.vbo.add_vbo(ObjVBO(self.app.ctx, file=obj_file), name)
         model = None
+        layer = self.app.link.texture.layers.get(name)
         if water:
-            self.app.link.vao.add_vao(name, shader='water')
-            model = ObjModel(app=self.app, vao_name=name, texture_id=name, rotation=rotation)
-            self.water = model
+            self.app.link.vao.add_vao(name, shader='water', layer=layer)
+            model = ObjModel(app=self.app, vao_name=name, texture_id=name, rotation=rotation, transparent=True)
+            self.water_models.append(model)
         else:
-            self.app.link.vao.add_vao(name)
+            self.app.link.vao.add_vao(name, layer=layer)
             model = ObjModel(app=self.app, vao_name=name, texture_id=name, rotation=rotation, position=position)
         self.objects.append(model)
 
-    def load(self):
+    def add_instanced_object(self, name, obj_file, texture_file, positions, rotations=None, scales=None, water=False):
         """
-        Loads objects for the scene
+        Inserts many copies of an object into the scene, they share one texture, vbo and vao and are drawn with a single
+        instanced draw call.
+        :param positions: A (N, 3) array of the position of each copy.
+        :param rotations: A (N, 3) array of the euler angles of each copy in degrees.
+        :param scales: A (N, 3) array of the scale of each copy.
         """
+        self.loader.load_object(name, obj_file, texture_file,
+                                callback=partial(self.add_instanced_model, name, positions, rotations, scales, water))
 
-        self.add_object(name='ground', obj_file='../models/ground/ground.obj', texture_file='../textures/ground.jpg')
-        self.add_object(name='rocks', obj_file='../models/ground/rocks.obj', texture_file='../textures/rock.jpg')
-
-        self.add_object(name="trunks1", obj_file='../models/trees/trunks1.obj', texture_file='../textures/bark.jpg')
-        self.add_object(name="trunks2", obj_file='../models/trees/trunks2.obj', texture_file='../textures/bark.jpg')
-        self.add_object(name="leaves1", obj_file='../models/trees/leaves1.obj', texture_file='../textures/leaves.jpg')
-        self.add_object(name="leaves2", obj_file='../models/trees/leaves2.obj', texture_file='../textures/leaves.jpg')
-
-        self.add_object(name="fish", obj_file='../models/animals/fish.obj', texture_file='../textures/fish.jpg',
-            rotation=(180, 0, 0), position=(0, -2.3, 0))
-        self.add_object(name="monkey", obj_file='../models/animals/monkey.obj', texture_file='../textures/monkey.jpg')
-        self.add_object(name="toucan", obj_file='../models/animals/toucan.obj', texture_file='../textures/toucan.jpg')
-        self.add_object(name="frog", obj_file='../models/animals/frog.obj', texture_file='../textures/frog.jpg')
+    def add_instanced_model(self, name, positions, rotations, scales, water):
+        """
+        Creates the instanced model (and its vao) of an object once its texture and vbo are loaded.
+        """
+        model = InstancedModel(app=self.app, vao_name=name, texture_id=name, positions=positions, rotations=rotations,
+                               scales=scales, shader='water' if water else 'default')
+        self.objects.append(model)
 
+    def load(self):
+        """
+        Loads the objects of the scene's manifest. Objects marked "stream" are left to the residency manager, which
+        loads them once the camera gets near them.
+        """
         self.app.ctx.enable(mgl.BLEND)
-        self.add_object(name='water', obj_file='../models/water/water.obj', texture_file='../textures/water.png',
-                        water=True)
+        for entry in load_manifest(self.manifest):
+            if entry.stream and STREAMING:
+                self.streamed.append(entry)
+            elif entry.instances is not None:
+                positions, rotations, scales = get_transforms(entry)
+                self.add_instanced_object(name=entry.name, obj_file=entry.mesh, texture_file=entry.texture,
+                                          positions=positions, rotations=rotations, scales=scales, water=entry.water)
+            else:
+                self.add_object(name=entry.name, obj_file=entry.mesh, texture_file=entry.texture,
+                                rotation=entry.rotation, position=entry.position, water=entry.water)
 
     def update(self):
         """
-        Rotates the water
+        Rotates the water, only its transform is marked dirty and rebuilt.
+        """
+        for water in self.water_models:
+            rotation = water.rot
+            rotation.y = self.app.time
+            water.rot = rotation
+
+    def destroy(self):
+        """
+        Releases the instance buffers of instanced models and stops the streaming workers.
         """
-        self.water.rot.y = self.app.time
+        self.streaming.destroy()
+        for obj in self.objects:
+            if isinstance(obj, InstancedModel):
+                obj.destroy()
@@ -0,0 +1,117 @@
+"""
+Scene manifests, JSON files listing the objects of a scene instead of add_object calls in code. Each object is
+{"name", "mesh": obj file, "texture": image file, "position", "rotation" (degrees), "water": whether it is drawn with
+the water shader, "stream": whether it is streamed in near the camera (streaming.py) instead of loaded at startup,
+"bounds": [x, y, z, radius] world space bounding sphere}. Objects repeated around the scene list their copies in
+"instances": [{"position", "rotation", "scale"}, ...] instead of a position and rotation, and are drawn with one
+instanced draw call (InstancedModel). Paths are relative to the main folder, like every other path. The bounds tell
+the streaming system how close the camera is to an object before its mesh is loaded; running this file fills in the
+bounds of every object from its mesh cache.
+"""
+
+import json
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+SCENE_MANIFEST = '../scenes/jungle.json'
+
+ManifestObject = namedtuple('ManifestObject', ['name', 'mesh', 'texture', 'position', 'rotation', 'water', 'stream',
+                                               'bounds', 'instances'])
+# Placement of one copy of an instanced object, rotation in degrees.
+Instance = namedtuple('Instance', ['position', 'rotation', 'scale'])
+
+
+def load_manifest(path=SCENE_MANIFEST):
+    """
+    Loads the objects of a scene manifest.
+    :return: A list of ManifestObjects, bounds is None for objects without bounds and instances None for objects that
+    are not instanced.
+    """
+    with open(path) as file:
+        data = json.load(file)
+    objects = []
+    for entry in data['objects']:
+        if 'name' not in entry or 'mesh' not in entry or 'texture' not in entry:
+            raise ValueError(f'Manifest object {entry} needs a name, mesh and texture')
+        bounds = entry.get('bounds')
+        instances = entry.get('instances')
+        if instances is not None:
+            if not instances:
+                raise ValueError(f'Manifest object {entry["name"]} has an empty instances list')
+            instances = tuple(Instance(tuple(instance.get('position', (0, 0, 0))),
+                                       tuple(instance.get('rotation', (0, 0, 0))),
+                                       tuple(instance.get('scale', (1, 1, 1)))) for instance in instances)
+        objects.append(ManifestObject(entry['name'], entry['mesh'], entry['texture'],
+                                      tuple(entry.get('position', (0, 0, 0))), tuple(entry.get('rotation', (0, 0, 0))),
+                                      entry.get('water', False), entry.get('stream', False),
+                                      tuple(bounds) if bounds is not None else None, instances))
+    return objects
+
+
+def save_manifest(objects, path=SCENE_MANIFEST):
+    entries = []
+    for obj in objects:
+        entry = {'name': obj.name, 'mesh': obj.mesh, 'texture': obj.texture, 'position': list(obj.position),
+                 'rotation': list(obj.rotation), 'water': obj.water, 'stream': obj.stream}
+        if obj.instances is not None:
+            entry['instances'] = [{field: list(value) for field, value in instance._asdict().items()}
+                                  for instance in obj.instances]
+        if obj.bounds is not None:
+            entry['bounds'] = [round(float(value), 4) for value in obj.bounds]
+        entries.append(entry)
+    # One object per line, so manifests stay readable and diff well
+    with open(path, 'w') as file:
+        file.write('{"objects": [\n' + ',\n'.join(f'  {json.dumps(entry)}' for entry in entries) + '\n]}\n')
+
+
+def get_transforms(obj):
+    """
+    Gets the placement of every copy of a manifest object, a single copy unless it is instanced.
+    :return: (N, 3) arrays of the positions, euler angles in degrees and scales.
+    """
+    instances = obj.instances or [Instance(obj.position, obj.rotation, (1, 1, 1))]
+    return tuple(np.array([instance[field] for instance in instances], dtype='f8').reshape(-1, 3)
+                 for field in range(len(Instance._fields)))
+
+
+def get_world_bounds(mesh, obj):
+    """
+    Gets the world space bounding sphere of a manifest object's mesh placed in the scene, enclosing every copy of
+    instanced objects.
+    :return: The (x, y, z, radius) of the sphere.
+    """
+    from transform import compose_matrices
+
+    positions, rotations, scales = get_transforms(obj)
+    matrices = compose_matrices(positions, np.radians(rotations), scales)
+    centre, radius = mesh.bounding_sphere
+    centres = matrices[:, :3, :3] @ np.asarray(centre, dtype='f8') + matrices[:, :3, 3]
+    radii = radius * np.linalg.norm(matrices[:, :3, :3], axis=1).max(axis=1)
+    world_centre = ((centres - radii[:, None]).min(axis=0) + (centres + radii[:, None]).max(axis=0)) / 2
+    return (*world_centre, float((np.linalg.norm(centres - world_centre, axis=1) + radii).max()))
+
+
+def add_bounds(path=SCENE_MANIFEST, optimise=False):
+    """
+    Fills in the bounds of every object of a manifest whose mesh can be loaded.
+    :param optimise: Read the meshes optimised for the vertex cache, so the cache the scene loads is the one compiled.
+    """
+    from mesh_cache import load_mesh
+
+    objects = []
+    for obj in load_manifest(path):
+        try:
+            obj = obj._replace(bounds=get_world_bounds(load_mesh(obj.mesh, optimise), obj))
+        except OSError as error:
+            print(f'Kept the bounds of {obj.name}, its mesh could not be loaded: {error}')
+        objects.append(obj)
+    save_manifest(objects, path)
+    print(f'Bounds of {len(objects)} objects written to {path}')
+
+
+if __name__ == '__main__':
+    from scene import OPTIMISE_MESHES
+
+    add_bounds(sys.argv[1] if len(sys.argv) > 1 else SCENE_MANIFEST, OPTIMISE_MESHES)
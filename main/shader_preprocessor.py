@@ -0,0 +1,107 @@
+"""
+GLSL preprocessing that OpenGL's own preprocessor does not do. Shader files can pull shared code from other files with
+#include "path" lines (relative to the including file, each file included once), and are compiled with different sets
+of #define macros for each variant (eg. INSTANCED or TEXTURE_ARRAY). #line directives keep compile errors pointing at
+the right line, with each file numbered as a source string. Programs are identified by a key of their sources and the
+macros they actually use, so variants that only differ by unused macros share one program. Nothing here needs a GL
+context.
+"""
+
+import hashlib
+import os
+import re
+
+SHADER_DIR = '../shaders'
+
+INCLUDE_PATTERN = re.compile(r'^\s*#\s*include\s+"([^"]+)"\s*$')
+
+
+def resolve_includes(path, files=None, stack=()):
+    """
+    Reads a shader file and replaces its #include lines with the source of the included files.
+    :param path: The shader file.
+    :param files: Files already included in the shader, they are not included again. Filled in with every file read,
+    in order, so a file's index is its source string number in #line directives.
+    :param stack: Files including this one, to detect cycles.
+    :return: The resolved source.
+    """
+    if files is None:
+        files = []
+    path = os.path.normpath(path)
+    index = len(files)
+    files.append(path)
+    with open(path) as file:
+        lines = file.read().split('\n')
+
+    resolved = [f'#line 1 {index}'] if index else []
+    for number, line in enumerate(lines, start=1):
+        match = INCLUDE_PATTERN.match(line)
+        if match is None:
+            resolved.append(line)
+            continue
+        include = os.path.normpath(os.path.join(os.path.dirname(path), match.group(1)))
+        if include in stack or include == path:
+            raise ValueError(f'{path} line {number}: {include} includes itself')
+        if include in files:
+            resolved.append('')
+            continue
+        if not os.path.isfile(include):
+            raise ValueError(f'{path} line {number}: included file {include} not found')
+        resolved.append(resolve_includes(include, files, stack + (path,)))
+        resolved.append(f'#line {number + 1} {index}')
+    return '\n'.join(resolved)
+
+
+def get_define_name(define):
+    """
+    Gets the name of a macro given as 'NAME' or 'NAME VALUE'.
+    """
+    return define.split()[0]
+
+
+def get_used_defines(sources, defines):
+    """
+    Gets the macros a shader's sources refer to, sorted by name so the order they were given in does not matter.
+    :param sources: The resolved sources of each stage of the program.
+    :param defines: Macros as names or 'NAME VALUE' strings.
+    """
+    return tuple(sorted((define for define in set(defines)
+                         if any(re.search(rf'\b{get_define_name(define)}\b', source) for source in sources)),
+                        key=get_define_name))
+
+
+def add_defines(source, defines):
+    """
+    Adds #define lines to a shader's source, straight after its #version line, and a #line directive so the lines after
+    them keep their numbers.
+    """
+    if not defines:
+        return source
+    version, _, body = source.partition('\n')
+    return '\n'.join([version] + [f'#define {define}' for define in defines] + ['#line 2 0', body])
+
+
+def get_program_key(sources, defines):
+    """
+    Gets the key of a program in the program cache: a hash of its resolved sources and the macros they use.
+    :return: (source hash, defines)
+    """
+    digest = hashlib.sha1('\0'.join(sources).encode()).hexdigest()
+    return digest, get_used_defines(sources, defines)
+
+
+def preprocess(shader_name, defines=(), shader_dir=SHADER_DIR, stages=('vert', 'frag')):
+    """
+    Preprocesses the stages of a shader program.
+    :param shader_name: Name of the shader files, eg. 'default' for default.vert and default.frag.
+    :param defines: Macros to define in every stage.
+    :return: The program's key, its final source of each stage, and the files each stage was built from.
+    """
+    sources, files = [], []
+    for stage in stages:
+        stage_files = []
+        sources.append(resolve_includes(os.path.join(shader_dir, f'{shader_name}.{stage}'), stage_files))
+        files.append(stage_files)
+    key = get_program_key(sources, defines)
+    return key, [add_defines(source, key[1]) for source in sources], files
+
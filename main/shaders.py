@@ -1,36 +1,89 @@
 """
-Class that loads shader files
+Class that loads shader files. Programs are built from a shader's files and a set of macros (shader_preprocessor.py),
+compiled the first time they are asked for and cached, so every object drawn with the same variant shares one program.
 """
 
+import time
+
+import moderngl as mgl
+
+from uniforms import bind_uniform_blocks
+from shadows import PCF_SIZE, CASCADE_COUNT, SHADOW_BIAS
+from shader_preprocessor import preprocess, SHADER_DIR
+
+# Macros defined in every shader.
+GLOBAL_DEFINES = [f'PCF_SIZE {PCF_SIZE}', f'CASCADE_COUNT {CASCADE_COUNT}', f'SHADOW_BIAS {SHADOW_BIAS}']
+
+
 class Shaders:
-    def __init__(self, ctx):
+    def __init__(self, ctx, shader_dir=SHADER_DIR):
         """
         The class that loads shaders
         :param ctx: An interactive 2D vector graphics protocol, previously created for the in GraphicsEngine
+        :param shader_dir: The folder holding the shader files.
         """
         self.ctx = ctx
-        self.programs = {'default': self.get_shader('default'),
-                         'skybox': self.get_shader('skybox'),
-                         'shadow': self.get_shader('shadow_map'),
-                         'water': self.get_shader('water')}
+        self.shader_dir = shader_dir
+        # Compiled programs by their (source hash, defines) key
+        self.programs = {}
+        # Keys of the variants asked for so far, so asking again does not read the files again
+        self.variants = {}
+        # Name and compile time in milliseconds of each compiled variant, by key
+        self.compile_times = {}
+        self.requests = 0
 
-    def get_shader(self, shader_name):
+    def get_program(self, shader_name, defines=()):
         """
-        Gets the specified GLSL shader shaders.
-        :param shader_name: The name of the shaders file.
-        :return: The processed shaders.
+        Gets a program, compiling it if no program with the same sources and macros was compiled before.
+        :param shader_name: The name of the shader files, eg. 'default' for default.vert and default.frag.
+        :param defines: Macros to define in both shaders, eg. INSTANCED, added to the GLOBAL_DEFINES.
+        :return: The program.
         """
-        with open(f'../shaders/{shader_name}.vert') as file:
-            vertex_shader = file.read()
-        with open(f'../shaders/{shader_name}.frag') as file:
-            fragment_shader = file.read()
+        self.requests += 1
+        key = self.variants.get((shader_name, tuple(defines)))
+        if key is not None:
+            return self.programs[key]
+        key, (vertex_shader, fragment_shader), files = preprocess(shader_name, GLOBAL_DEFINES + list(defines),
+                                                                  self.shader_dir)
+        program = self.programs.get(key)
+        if program is not None:
+            self.variants[shader_name, tuple(defines)] = key
+            return program
 
-        program = self.ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+        start = time.perf_counter()
+        try:
+            program = self.ctx.program(vertex_shader=vertex_shader, fragment_shader=fragment_shader)
+        except mgl.Error as error:
+            # Source string numbers in the error are indices into each stage's list of files
+            raise mgl.Error(f'{shader_name} {list(defines)}: {error}\nSource strings: vertex {files[0]}, '
+                            f'fragment {files[1]}') from error
+        bind_uniform_blocks(program)
+        self.compile_times[key] = (self.get_variant_name(shader_name, key[1]), (time.perf_counter() - start) * 1000)
+        self.programs[key] = program
+        self.variants[shader_name, tuple(defines)] = key
         return program
 
+    @staticmethod
+    def get_variant_name(shader_name, defines):
+        names = [define for define in defines if define not in GLOBAL_DEFINES]
+        return f'{shader_name}[{", ".join(names)}]' if names else shader_name
+
+    def report(self):
+        """
+        :return: The compile time of each variant, slowest first.
+        """
+        total = sum(ms for _, ms in self.compile_times.values())
+        lines = [f'{len(self.programs)} shader programs compiled in {total:.1f} ms, '
+                 f'{self.requests - len(self.programs)} requests served from the cache']
+        for name, ms in sorted(self.compile_times.values(), key=lambda item: -item[1]):
+            lines.append(f'  {name:<40}{ms:8.1f} ms')
+        return '\n'.join(lines)
+
     def destroy(self):
         """
         Removes all created resources, acts as a garbage collector as OpenGL does not do this by itself.
         """
         for program in self.programs.values():
             program.release()
+        self.programs.clear()
+        self.variants.clear()
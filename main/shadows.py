@@ -0,0 +1,196 @@
+"""
+Cascaded shadow maps. The camera's frustum is split along its depth into cascades, and each cascade gets its own
+orthographic light projection fitted around its slice of the frustum, so nearby shadows get as many shadow map texels
+as distant ones. moderngl cannot render into the layers of a depth texture array, so the cascades are tiles side by
+side in one depth texture (an atlas), each rendered with its own viewport and only with the casters that intersect it.
+The maps are only re-rendered when the light, the camera or a caster has moved since they were last rendered.
+"""
+
+import glm
+import numpy as np
+
+from camera import FOV, NEAR, FAR
+from culling import transform_boxes, CullingStats
+
+# Width and height of each cascade's tile of the shadow map in texels.
+SHADOW_MAP_SIZE = (1024, 1024)
+# Number of cascades, at most MAX_CASCADES (the split distances are passed to the shaders in one vec4).
+CASCADE_COUNT = 3
+MAX_CASCADES = 4
+# Split scheme, blends between uniform splits (0) and logarithmic splits (1). Logarithmic splits give every cascade the
+# same ratio of far to near distance, uniform splits the same length.
+CASCADE_SPLIT_LAMBDA = 0.75
+# Width of the square percentage closer filtering (PCF) kernel in texels, eg. 1 = hard shadows, 4 = 4x4 samples.
+PCF_SIZE = 4
+# World space distance added around each cascade, so casters on the edge of a tile are not clipped.
+SHADOW_MARGIN = 1.0
+# World space distance surfaces are moved towards the light before their shadow lookups, against shadow acne.
+SHADOW_BIAS = 0.1
+
+# Signs of the 8 corners of a box, relative to its centre.
+BOX_CORNERS = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)], dtype='f8')
+
+
+def get_cascade_splits(near, far, count=CASCADE_COUNT, split_lambda=CASCADE_SPLIT_LAMBDA):
+    """
+    Splits the depth range of a camera into cascades ("practical split scheme").
+    :param near: The camera's near plane distance.
+    :param far: The camera's far plane distance.
+    :param count: The number of cascades.
+    :param split_lambda: 0 for uniform splits, 1 for logarithmic splits, or a blend between them.
+    :return: The count + 1 distances from the camera where the cascades start and end, starting with near and ending
+    with far.
+    """
+    ratios = np.arange(count + 1) / count
+    logarithmic = near * (far / near) ** ratios
+    uniform = near + (far - near) * ratios
+    return split_lambda * logarithmic + (1 - split_lambda) * uniform
+
+
+def get_slice_corners(view_matrix, fov, aspect_ratio, near, far):
+    """
+    Gets the corners of a slice of a perspective camera's frustum.
+    :param view_matrix: The camera's view matrix (glm or NumPy).
+    :param fov: The camera's vertical field of view in degrees.
+    :param aspect_ratio: Width / height of the camera's view.
+    :param near: Distance from the camera where the slice starts.
+    :param far: Distance from the camera where the slice ends.
+    :return: A (8, 3) array of world space corners.
+    """
+    tan_y = np.tan(np.radians(fov) / 2)
+    tan_x = tan_y * aspect_ratio
+    view_corners = np.array([[x * tan_x * depth, y * tan_y * depth, -depth]
+                             for depth in (near, far) for x in (-1, 1) for y in (-1, 1)], dtype='f8')
+    inverse_view = np.linalg.inv(np.array(view_matrix, dtype='f8'))
+    return view_corners @ inverse_view[:3, :3].T + inverse_view[:3, 3]
+
+
+def get_world_corners(mins, maxs, model_matrices):
+    """
+    Gets the corners of the world space AABB of each object's model space box.
+    :return: A (N * 8, 3) array of corners.
+    """
+    centres, extents = transform_boxes(mins, maxs, model_matrices)
+    return (centres[:, None] + extents[:, None] * BOX_CORNERS).reshape(-1, 3)
+
+
+def to_light_space(view_matrix, points):
+    """
+    Moves world space points into the light's view space.
+    """
+    view = np.array(view_matrix, dtype='f8')
+    return points @ view[:3, :3].T + view[:3, 3]
+
+
+def fit_cascade_projection(view_matrix, slice_corners, caster_corners, tile_size=SHADOW_MAP_SIZE,
+                           margin=SHADOW_MARGIN):
+    """
+    Fits an orthographic light projection around a slice of the camera's frustum. The projection covers the bounding
+    sphere of the slice, so its size does not change as the camera turns, and it moves in whole texels, so shadow edges
+    do not shimmer as the camera moves. Its depth range reaches back towards the light to every caster that could
+    shadow the slice.
+    :param view_matrix: The light's view matrix.
+    :param slice_corners: A (8, 3) array of the slice's world space corners, from get_slice_corners.
+    :param caster_corners: A (N, 3) array of world space points of the casters, from get_world_corners.
+    :param tile_size: The (width, height) of the cascade's tile in texels.
+    :param margin: Distance added on every side.
+    :return: The glm projection matrix.
+    """
+    slice_points = to_light_space(view_matrix, slice_corners)
+    centre = slice_points.mean(axis=0)
+    radius = np.ceil(np.linalg.norm(slice_points - centre, axis=1).max() + margin)
+    texel_sizes = 2 * radius / np.array(tile_size, dtype='f8')
+    centre[:2] = np.floor(centre[:2] / texel_sizes) * texel_sizes
+
+    # The light looks down -z, so the nearest points have the largest z.
+    near_z = centre[2] + radius
+    if len(caster_corners):
+        near_z = max(near_z, to_light_space(view_matrix, caster_corners)[:, 2].max() + margin)
+    far_z = centre[2] - radius
+    return glm.ortho(centre[0] - radius, centre[0] + radius, centre[1] - radius, centre[1] + radius, -near_z, -far_z)
+
+
+def get_tile_viewport(index, tile_size=SHADOW_MAP_SIZE):
+    """
+    Gets the (x, y, width, height) viewport of a cascade's tile in the shadow map atlas.
+    """
+    return index * tile_size[0], 0, tile_size[0], tile_size[1]
+
+
+class ShadowMap:
+    """
+    Owns the shadow map atlas' framebuffer and the cascades' light projections, and decides whether the maps have to be
+    re-rendered.
+    """
+
+    def __init__(self, app, depth_texture, cascade_count=CASCADE_COUNT):
+        """
+        :param depth_texture: The depth texture atlas to render into, sampled by the lit shaders.
+        """
+        self.app = app
+        self.depth_texture = depth_texture
+        self.framebuffer = app.ctx.framebuffer(depth_attachment=depth_texture)
+        self.cascade_count = cascade_count
+        self.tile_size = (depth_texture.size[0] // cascade_count, depth_texture.size[1])
+        # The distances the camera's frustum is split at and the light view projection matrix of each cascade.
+        self.splits = get_cascade_splits(NEAR, FAR, cascade_count)
+        self.matrices = [glm.mat4() for _ in range(cascade_count)]
+        # The light, camera and caster transforms the maps were last rendered with, None until they are first rendered.
+        self.state = None
+        # Whether the maps were rendered in the last frame, how many frames reused them and each cascade's counters.
+        self.rendered = False
+        self.frames_reused = 0
+        self.stats = [CullingStats() for _ in range(cascade_count)]
+
+    def update(self, model_matrices, mins, maxs):
+        """
+        Checks whether the light, the camera or any caster moved since the maps were last rendered, and if so refits
+        each cascade's projection and writes the cascades to the light's uniform buffer.
+        :param model_matrices: A (N, 4, 4) array of the casters' world matrices.
+        :param mins: A (N, 3) array of the minimums of the casters' model space (or, for instanced models, world space)
+        bounds.
+        :param maxs: A (N, 3) array of the maximums.
+        :return: True if the maps have to be re-rendered.
+        """
+        light, camera = self.app.light, self.app.camera
+        state = (light.view_matrix_light.to_bytes(), camera.view_matrix.to_bytes(),
+                 camera.projection_matrix.to_bytes(), model_matrices.tobytes(), mins.tobytes(), maxs.tobytes())
+        self.rendered = state != self.state
+        if not self.rendered:
+            self.frames_reused += 1
+            return False
+        self.state = state
+        caster_corners = get_world_corners(mins, maxs, model_matrices)
+        for index in range(self.cascade_count):
+            slice_corners = get_slice_corners(camera.view_matrix, FOV, camera.aspect_ratio,
+                                              self.splits[index], self.splits[index + 1])
+            projection = fit_cascade_projection(light.view_matrix_light, slice_corners, caster_corners, self.tile_size)
+            self.matrices[index] = projection * light.view_matrix_light
+        light.cascade_matrices = self.matrices
+        light.cascade_splits = self.splits[1:]
+        light.write_uniforms()
+        return True
+
+    def use(self):
+        """
+        Clears every cascade and makes the atlas the render target.
+        """
+        self.framebuffer.clear()
+        self.framebuffer.use()
+
+    def use_cascade(self, index):
+        """
+        Renders into a cascade's tile, with its light matrix in the shadow uniform buffer.
+        """
+        self.app.ctx.viewport = get_tile_viewport(index, self.tile_size)
+        self.app.uniforms.write_shadow_cascade(self.matrices[index])
+
+    def __repr__(self):
+        cascades = ', '.join(f'{near:.1f}-{far:.1f}: {stats}'
+                             for near, far, stats in zip(self.splits, self.splits[1:], self.stats))
+        return (f'{self.cascade_count} cascades of {self.tile_size[0]}x{self.tile_size[1]} PCF {PCF_SIZE}x{PCF_SIZE} '
+                f'[{cascades}] {"rendered" if self.rendered else "reused"}, reused for {self.frames_reused} frames')
+
+    def destroy(self):
+        self.framebuffer.release()
+
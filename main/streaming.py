@@ -0,0 +1,265 @@
+"""
+Streams the scene's objects in and out around the camera. Objects marked "stream" in the scene manifest are loaded in
+the background once the camera gets within STREAM_DISTANCE of their bounds: their meshes are read and their textures
+decoded on worker threads, and the GL thread uploads a few of them per frame. Until an object's texture is uploaded it
+is drawn with the placeholder texture (texture 0), and textures upload their coarse MIP levels first. Resident objects
+are evicted least recently used (by the last frame the camera was near them) while the streamed objects take more GPU
+memory than the budget. Objects whose files fail to load are reported once and left out of the scene.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from loader import decode_texture, read_mesh
+from model import ObjModel, InstancedModel
+from scene_manifest import get_transforms, get_world_bounds
+from vbo import ObjVBO
+
+# Distance from the camera to an object's bounding sphere within which it is streamed in.
+STREAM_DISTANCE = 40
+# GPU bytes the streamed objects' meshes and textures may take before the least recently used ones are evicted.
+STREAMING_BUDGET = 256 * 2 ** 20
+# GPU bytes uploaded per frame (meshes and texture MIP levels), at least one upload is made per frame.
+UPLOADS_PER_FRAME = 8 * 2 ** 20
+# Worker threads reading meshes and decoding textures.
+STREAMING_WORKERS = 2
+
+# States of a streamed object.
+UNLOADED = 'unloaded'
+LOADING = 'loading'
+RESIDENT = 'resident'
+FAILED = 'failed'
+
+
+class StreamedObject:
+    """
+    An object of the manifest and its streaming state.
+    """
+
+    def __init__(self, entry):
+        """
+        :param entry: The object's ManifestObject.
+        """
+        self.entry = entry
+        self.state = UNLOADED
+        # World space bounding sphere, from the manifest or measured once the mesh is loaded
+        self.bounds = entry.bounds
+        self.mesh_job = self.texture_job = None
+        self.model = None
+        # Transform kept between evictions, so streaming in again does not add a new one
+        self.transform_id = None
+        self.mesh_size = 0
+        self.last_used = 0
+
+    @property
+    def name(self):
+        return self.entry.name
+
+
+class ResidencyManager:
+    def __init__(self, app, scene, entries, budget=STREAMING_BUDGET, synchronous=False, optimise_meshes=False):
+        """
+        :param scene: The scene streamed objects are added to and removed from.
+        :param entries: The ManifestObjects of the streamed objects.
+        :param budget: GPU bytes the streamed objects may take.
+        :param synchronous: Loads objects in range straight away, on the GL thread, and uploads textures whole, so
+        every frame of a run renders the same (eg. in headless mode).
+        :param optimise_meshes: Load meshes optimised for the vertex cache.
+        """
+        self.app = app
+        self.scene = scene
+        self.budget = budget
+        self.synchronous = synchronous
+        self.optimise_meshes = optimise_meshes
+        self.objects = [StreamedObject(entry) for entry in entries]
+        self.executor = None if synchronous else ThreadPoolExecutor(max_workers=STREAMING_WORKERS)
+        self.frame = 0
+        self.loads = 0
+        self.evictions = 0
+        self.bytes_uploaded = 0
+
+    def get_distances(self, position):
+        """
+        Gets the distance from a position to the bounding sphere of each object, 0 for objects without known bounds
+        so they are always loaded.
+        """
+        distances = np.zeros(len(self.objects))
+        known = [index for index, obj in enumerate(self.objects) if obj.bounds is not None]
+        if known:
+            bounds = np.array([self.objects[index].bounds for index in known], dtype='f8')
+            distances[known] = np.maximum(np.linalg.norm(bounds[:, :3] - np.array(position), axis=1) - bounds[:, 3], 0)
+        return distances
+
+    def update(self, position):
+        """
+        Requests the objects near a position, uploads finished loads within the frame's upload budget, and evicts least
+        recently used objects while over the GPU memory budget.
+        :param position: The camera's position.
+        """
+        self.frame += 1
+        for obj, distance in zip(self.objects, self.get_distances(position)):
+            if distance > STREAM_DISTANCE:
+                continue
+            obj.last_used = self.frame
+            if obj.state == UNLOADED:
+                self.request(obj)
+
+        uploaded = 0
+        for obj in self.objects:
+            if obj.state == LOADING and (self.synchronous or uploaded < UPLOADS_PER_FRAME):
+                try:
+                    uploaded += self.upload(obj)
+                except (OSError, ValueError) as error:
+                    self.fail(obj, error)
+        texture = self.app.link.texture
+        if self.synchronous:
+            while texture.streaming:
+                uploaded += texture.stream_levels(float('inf'))
+        else:
+            uploaded += texture.stream_levels(max(UPLOADS_PER_FRAME - uploaded, 0))
+        self.bytes_uploaded += uploaded
+        self.evict()
+
+    def request(self, obj):
+        """
+        Starts loading an object's mesh and texture.
+        """
+        obj.state = LOADING
+        entry = obj.entry
+        if self.synchronous:
+            try:
+                obj.mesh_job = read_mesh(entry.mesh, self.optimise_meshes)
+                obj.texture_job = decode_texture(entry.texture)
+            except (OSError, ValueError) as error:
+                self.fail(obj, error)
+        else:
+            obj.mesh_job = self.executor.submit(read_mesh, entry.mesh, self.optimise_meshes)
+            obj.texture_job = self.executor.submit(decode_texture, entry.texture)
+
+    def fail(self, obj, error):
+        """
+        Reports an object that failed to load, and drops whatever of it was uploaded.
+        """
+        print(f'Could not stream {obj.name}: {error}')
+        if obj.model is not None:
+            self.unload(obj)
+        obj.mesh_job = obj.texture_job = None
+        obj.state = FAILED
+
+    @staticmethod
+    def get_result(job):
+        """
+        Gets the result of a job, None while it is running. Raises the job's exception if it failed.
+        """
+        if isinstance(job, tuple):
+            return job
+        return job.result() if job.done() else None
+
+    def upload(self, obj):
+        """
+        Uploads whichever of an object's mesh and texture have finished loading. The object is added to the scene with
+        the placeholder texture as soon as its mesh is uploaded.
+        :return: Number of bytes uploaded.
+        """
+        with self.app.resources.owner(obj.name):
+            return self.upload_resources(obj)
+
+    def upload_resources(self, obj):
+        link = self.app.link
+        uploaded = 0
+        entry = obj.entry
+        if obj.model is None:
+            result = self.get_result(obj.mesh_job)
+            if result is None:
+                return 0
+            mesh, _ = result
+            vbo = ObjVBO(self.app.ctx, file=entry.mesh, mesh=mesh, optimise=self.optimise_meshes)
+            link.vao.vbo.add_vbo(vbo, entry.name)
+            shader = 'water' if entry.water else 'default'
+            if entry.instances is not None:
+                positions, rotations, scales = get_transforms(entry)
+                obj.model = InstancedModel(app=self.app, vao_name=entry.name, texture_id=0, positions=positions,
+                                           rotations=rotations, scales=scales, shader=shader,
+                                           transform_id=obj.transform_id)
+            else:
+                link.vao.add_vao(entry.name, shader=shader)
+                obj.model = ObjModel(app=self.app, vao_name=entry.name, texture_id=0, position=entry.position,
+                                     rotation=entry.rotation, transparent=entry.water, transform_id=obj.transform_id)
+                if entry.water:
+                    self.scene.water_models.append(obj.model)
+            obj.transform_id = obj.model.transform_id
+            obj.mesh_size = uploaded = vbo.size
+            if obj.bounds is None:
+                obj.bounds = get_world_bounds(mesh, entry)
+            self.scene.objects.append(obj.model)
+
+        result = self.get_result(obj.texture_job)
+        if result is not None:
+            data, _ = result
+            uploaded += link.texture.add_texture(entry.texture, entry.name, data=data,
+                                                 coarse_first=not self.synchronous)
+            obj.model.texture_id = entry.name
+            obj.model.texture = link.texture.textures[entry.name]
+            obj.mesh_job = obj.texture_job = None
+            obj.state = RESIDENT
+            self.loads += 1
+        return uploaded
+
+    def get_resident_size(self):
+        """
+        Gets the GPU bytes of the streamed objects' meshes and textures, textures shared by several objects count once.
+        """
+        texture = self.app.link.texture
+        keys = {texture.keys[obj.name] for obj in self.objects if obj.name in texture.keys}
+        return sum(obj.mesh_size for obj in self.objects if obj.model is not None) + \
+            sum(texture.sizes[key] for key in keys)
+
+    def evict(self):
+        """
+        Evicts resident objects, least recently used first, until the streamed objects fit in the budget. Objects the
+        camera is near this frame are never evicted.
+        """
+        size = self.get_resident_size()
+        if size <= self.budget:
+            return
+        candidates = sorted((obj for obj in self.objects if obj.state == RESIDENT and obj.last_used < self.frame),
+                            key=lambda obj: obj.last_used)
+        for obj in candidates:
+            if size <= self.budget:
+                break
+            self.unload(obj)
+            self.evictions += 1
+            size = self.get_resident_size()
+
+    def unload(self, obj):
+        """
+        Removes an object from the scene and releases its VAOs, VBO and texture, and the instance buffer of instanced
+        objects.
+        """
+        link = self.app.link
+        queue = self.app.scene_renderer.queue
+        model = obj.model
+        self.scene.objects.remove(model)
+        if model in self.scene.water_models:
+            self.scene.water_models.remove(model)
+        # The render queue's ids of released objects are dropped before their addresses can be reused
+        queue.forget(model.vao, model.shadow_vao, model.depth_vao)
+        link.vao.remove_vao(obj.name)
+        if isinstance(model, InstancedModel):
+            model.destroy()
+        if obj.name in link.texture.keys:
+            queue.forget(link.texture.release_texture(obj.name))
+        obj.model = None
+        obj.mesh_size = 0
+        obj.state = UNLOADED
+
+    def report(self):
+        resident = sum(obj.state == RESIDENT for obj in self.objects)
+        return (f'Streaming: {resident}/{len(self.objects)} objects resident, '
+                f'{self.get_resident_size() / 2 ** 20:.1f}/{self.budget / 2 ** 20:.0f} MB, {self.loads} loads, '
+                f'{self.evictions} evictions, {self.bytes_uploaded / 2 ** 20:.1f} MB uploaded')
+
+    def destroy(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
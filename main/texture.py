@@ -5,6 +5,23 @@ Class for loading textures
 import pygame as pg
 import moderngl as mgl
 
+from texture_cache import load_texture_data, get_data_size
+from texture_array import pack_texture_array
+from shadows import SHADOW_MAP_SIZE, CASCADE_COUNT
+
+# Largest side of the first MIP level uploaded for textures streamed coarse levels first.
+COARSE_MIP_SIZE = 64
+
+
+def get_coarse_level(data):
+    """
+    Gets the largest MIP level of a texture whose sides are at most COARSE_MIP_SIZE.
+    """
+    for level, pixels in enumerate(data.levels):
+        if max(pixels.shape[:2]) <= COARSE_MIP_SIZE:
+            return level
+    return len(data.levels) - 1
+
 
 class Texture:
     """
@@ -14,22 +31,99 @@ class Texture:
     def __init__(self, app):
         self.app = app
         self.ctx = app.ctx
-        self.textures = {0: self.get_texture(path='../textures/wooden_crate.png'),
-                         'skybox': self.get_texture_cube('../textures/skybox2/', 'png'),
-                         'depth_texture': self.get_depth_texture()}
+        # Textures shared by every name whose file has the same content (by content hash), and how many names use each.
+        self.shared = {}
+        self.ref_counts = {}
+        self.keys = {}
+        # GPU bytes uploaded, and not uploaded thanks to sharing.
+        self.bytes_uploaded = 0
+        self.bytes_saved = 0
+        # Layer of each texture packed into a texture array.
+        self.layers = {}
+        # Textures streamed coarse levels first, by content hash: their TextureData and the finest level uploaded.
+        self.streaming = {}
+        # GPU bytes of each shared texture, every MIP level included.
+        self.sizes = {}
+        resources = app.resources
+        with resources.owner('placeholder'):
+            self.textures = {0: self.get_texture(path='../textures/wooden_crate.png')}
+        with resources.owner('skybox'):
+            self.textures['skybox'] = self.get_texture_cube('../textures/skybox2/', 'png')
+        with resources.owner('shadow map'):
+            self.textures['depth_texture'] = self.get_depth_texture()
+
+    def add_texture(self, file, name, data=None, coarse_first=False):
+        """
+        Adds texture objects to the textures array. Files with the same content share one texture.
+        :param data: The TextureData of the file already loaded from the texture cache (eg. by the asset loader),
+        loaded here if None.
+        :param coarse_first: Only uploads the MIP levels up to COARSE_MIP_SIZE, the finer levels are uploaded over the
+        next frames by stream_levels.
+        :return: Number of bytes uploaded, 0 if the texture was shared.
+        """
+        if data is None:
+            data = load_texture_data(file)
+        if name in self.keys:
+            self.release_texture(name)
+        uploaded = 0
+        if data.key in self.shared:
+            self.bytes_saved += get_data_size(data)
+        else:
+            self.shared[data.key] = self.upload_texture(data, coarse_first)
+            self.ref_counts[data.key] = 0
+            self.sizes[data.key] = get_data_size(data)
+            self.bytes_uploaded += self.sizes[data.key]
+            uploaded = get_data_size(data, get_coarse_level(data)) if coarse_first else self.sizes[data.key]
+        self.ref_counts[data.key] += 1
+        self.keys[name] = data.key
+        self.textures[name] = self.shared[data.key]
+        return uploaded
+
+    def add_texture_array(self, name, textures):
+        """
+        Packs textures into one texture array and adds it to the textures array, under its own name and the name of
+        every packed texture. The layer of each texture is kept in layers.
+        :param textures: Dictionary of texture names and their TextureData from the texture cache.
+        """
+        array_data = pack_texture_array(textures.values())
+        array = self.ctx.texture_array(size=(*array_data.size, len(array_data.layers)),
+                                       components=array_data.components, data=array_data.pixels)
+
+        # moderngl cannot write single levels of a texture array, so its MIP maps are built on the GPU.
+        array.filter = (mgl.LINEAR_MIPMAP_LINEAR, mgl.LINEAR)
+        array.build_mipmaps()
+        array.anisotropy = 32
 
-    def add_texture(self, file, name):
+        self.textures[name] = array
+        self.bytes_uploaded += array_data.pixels.nbytes * 4 // 3
+        self.bytes_saved += (len(textures) - len(array_data.layers)) * array_data.pixels[0].nbytes * 4 // 3
+        for texture_name, data in textures.items():
+            self.textures[texture_name] = array
+            self.layers[texture_name] = array_data.layers[data.key]
+
+    def release_texture(self, name):
         """
-        Adds texture objects to the textures array.
+        Removes a texture from the textures array, the GPU texture is released once no name uses it.
+        :return: The GPU texture if it was released, else None.
         """
-        self.textures[name] = self.get_texture(path=file)
+        key = self.keys.pop(name)
+        texture = self.textures.pop(name)
+        self.ref_counts[key] -= 1
+        if self.ref_counts[key] == 0:
+            texture.release()
+            del self.shared[key], self.ref_counts[key], self.sizes[key]
+            self.streaming.pop(key, None)
+            return texture
+        return None
 
-    def get_depth_texture(self):
+    def get_depth_texture(self, size=SHADOW_MAP_SIZE, cascade_count=CASCADE_COUNT):
         """
-        Generates a depth texture used in shadow mapping using moderngl.
+        Generates a depth texture used in shadow mapping using moderngl, with the shadow cascades side by side.
+        :param size: The size of each cascade, independent of the window size.
+        :param cascade_count: The number of shadow cascades.
         :return: The generated depth texture.
         """
-        dt = self.ctx.depth_texture(self.app.WIN_SIZE)
+        dt = self.ctx.depth_texture((size[0] * cascade_count, size[1]))
         dt.repeat_x = False
         dt.repeat_y = False
         return dt
@@ -44,7 +138,7 @@ class Texture:
         faces = ['right', 'left', 'top', 'bottom', 'front', 'back']
         textures = []
         for face in faces:
-            textures.append(pg.image.load(path + f'{face}.{ext}').convert())
+            textures.append(pg.image.load(path + f'{face}.{ext}'))
         size = textures[0].get_size()
         texture_cube = self.ctx.texture_cube(size=size, components=3, data=None)
 
@@ -56,28 +150,84 @@ class Texture:
 
     def get_texture(self, path):
         """
-        Loads the texture image from a given path.
+        Loads the texture image from a given path, through the texture cache.
         :param path: path to the image.
         :return: ctx texture object.
         """
-        texture = pg.image.load(path).convert()
+        return self.upload_texture(load_texture_data(path))
 
-        # Makes texture compatible with pygame's axis system
-        texture = pg.transform.flip(texture, flip_x=False, flip_y=True)
-        texture = self.ctx.texture(size=texture.get_size(), components=3, data=pg.image.tostring(texture, 'RGB'))
+    def upload_texture(self, data, coarse_first=False):
+        """
+        Uploads a texture and its precomputed MIP maps to the GPU level by level, must be called from the thread that
+        owns the GL context.
+        :param data: The TextureData from the texture cache.
+        :param coarse_first: Only uploads the levels up to COARSE_MIP_SIZE, see stream_levels.
+        :return: ctx texture object.
+        """
+        texture = self.ctx.texture(size=data.size, components=data.components)
 
-        # Generate MIP maps for optimisation and antialiasing.
+        # MIP maps for optimisation and antialiasing. moderngl only writes levels it has allocated, build_mipmaps
+        # allocates them (on the still empty texture) before each level is written.
         texture.filter = (mgl.LINEAR_MIPMAP_LINEAR, mgl.LINEAR)
-        texture.build_mipmaps()
+        texture.build_mipmaps(0, len(data.levels) - 1)
+        level = get_coarse_level(data) if coarse_first else 0
+        if level:
+            self.streaming[data.key] = (data, level)
+            self.write_base_level(texture, data, level)
+        else:
+            for level, pixels in enumerate(data.levels):
+                texture.write(pixels, level=level)
 
         # Anisotropic filtering for antialiasing and improving sharpness lost by MIP maps.
         texture.anisotropy = 32
 
         return texture
 
+    @staticmethod
+    def write_base_level(texture, data, level):
+        """
+        Makes a MIP level the finest level sampled and writes it. moderngl only sets the base level through
+        build_mipmaps, which also rebuilds the coarser levels on the GPU, so the precomputed coarser levels are written
+        again over the rebuilt ones. They are at most a third of the size of the level.
+        :return: Number of bytes written.
+        """
+        texture.build_mipmaps(level, len(data.levels) - 1)
+        for finer_level, pixels in enumerate(data.levels[level:], level):
+            texture.write(pixels, level=finer_level)
+        return get_data_size(data, level)
+
+    def stream_levels(self, max_bytes):
+        """
+        Uploads the next finer MIP level of textures streamed coarse levels first, until max_bytes have been uploaded.
+        At least one level is uploaded if any is left, however big.
+        :return: Number of bytes uploaded.
+        """
+        uploaded = 0
+        for key, (data, level) in list(self.streaming.items()):
+            if uploaded and uploaded + get_data_size(data, level - 1) > max_bytes:
+                break
+            uploaded += self.write_base_level(self.shared[key], data, level - 1)
+            if level == 1:
+                del self.streaming[key]
+            else:
+                self.streaming[key] = (data, level - 1)
+        return uploaded
+
+    def report(self):
+        """
+        Creates a report of how much GPU memory sharing textures between files with the same content saved.
+        """
+        if self.layers:
+            textures = f'{len(set(self.layers.values()))} texture array layers for {len(self.layers)} objects'
+        else:
+            textures = f'{len(self.shared)} unique textures for {len(self.keys)} objects'
+        return (f'{textures}, {self.bytes_uploaded / 2 ** 20:.1f} MB uploaded, '
+                f'{self.bytes_saved / 2 ** 20:.1f} MB saved by sharing')
+
     def destroy(self):
         """
         Acts as a garbage collector for textures.
         """
-        for texture in self.textures.values():
-            texture.release
+        # Textures shared by several names are released once
+        for texture in {id(texture): texture for texture in self.textures.values()}.values():
+            texture.release()
@@ -0,0 +1,99 @@
+"""
+CPU-only packer that combines the scene's textures into the layers of one 2D texture array, so every object samples
+the same texture and the renderer binds it once per frame instead of once per object. Each object keeps its own UVs
+(and repeat wrapping, which an atlas would break) and reads its layer index from a per-VAO vertex attribute. Every
+layer has the same size, so textures of other sizes are resampled: bigger textures are downsampled from the closest
+mip level, and the array's own mip maps are built on the GPU instead of coming from the texture cache.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+# Size of every layer of the texture array.
+LAYER_SIZE = (1024, 1024)
+
+# pixels = a (layer count, height, width, components) uint8 array, layers = the layer of each texture's content hash.
+TextureArrayData = namedtuple('TextureArrayData', ['size', 'components', 'pixels', 'layers'])
+
+
+def resize_image(image, size):
+    """
+    Resamples an image with bilinear filtering. Samples wrap around the edges, like the repeat wrapping the textures are
+    drawn with.
+    :param image: A (height, width, components) uint8 array.
+    :param size: The (width, height) to resample to.
+    :return: The resampled uint8 array.
+    """
+    width, height = size
+    source_height, source_width = image.shape[:2]
+    if (source_width, source_height) == (width, height):
+        return np.asarray(image)
+
+    # Positions of the new texel centres in the source image.
+    y = (np.arange(height) + 0.5) * source_height / height - 0.5
+    x = (np.arange(width) + 0.5) * source_width / width - 0.5
+    y0, x0 = np.floor(y).astype(np.int64), np.floor(x).astype(np.int64)
+    fy, fx = (y - y0)[:, None, None], (x - x0)[None, :, None]
+    y0, y1 = y0 % source_height, (y0 + 1) % source_height
+    x0, x1 = x0 % source_width, (x0 + 1) % source_width
+
+    image = np.asarray(image, dtype='f4')
+    top = image[y0][:, x0] * (1 - fx) + image[y0][:, x1] * fx
+    bottom = image[y1][:, x0] * (1 - fx) + image[y1][:, x1] * fx
+    return (top * (1 - fy) + bottom * fy + 0.5).astype('u1')
+
+
+def get_source_level(data, size):
+    """
+    Picks the smallest mip level of a texture that is still at least as big as a layer, so downsampling by more than 2x
+    starts from the box filtered mip chain instead of skipping texels.
+    :param data: The TextureData from the texture cache.
+    :param size: The (width, height) of a layer.
+    :return: The (height, width, components) array of the level.
+    """
+    source = data.levels[0]
+    for level in data.levels[1:]:
+        if level.shape[1] < size[0] or level.shape[0] < size[1]:
+            break
+        source = level
+    return source
+
+
+def add_components(image, components):
+    """
+    Adds an opaque alpha channel to RGB images packed into an RGBA array.
+    """
+    if image.shape[2] == components:
+        return image
+    alpha = np.full((*image.shape[:2], components - image.shape[2]), 255, dtype='u1')
+    return np.concatenate([image, alpha], axis=2)
+
+
+def pack_texture_array(textures, size=LAYER_SIZE):
+    """
+    Packs textures into the layers of a texture array, textures with the same content share a layer.
+    :param textures: TextureData of each texture, from the texture cache.
+    :param size: The (width, height) of every layer.
+    :return: The TextureArrayData.
+    """
+    unique = {}
+    for data in textures:
+        unique.setdefault(data.key, data)
+    components = max((data.components for data in unique.values()), default=3)
+    pixels = np.empty((len(unique), size[1], size[0], components), dtype='u1')
+    for layer, data in enumerate(unique.values()):
+        pixels[layer] = add_components(resize_image(get_source_level(data, size), size), components)
+    return TextureArrayData(size, components, pixels, {key: layer for layer, key in enumerate(unique)})
+
+
+def get_resample_error(data, array_data):
+    """
+    Measures how much a texture changed by being packed, by resampling its layer back to the texture's own size.
+    :return: The mean absolute difference per channel, in 0-255 units.
+    """
+    width, height = data.size
+    layer = array_data.pixels[array_data.layers[data.key], ..., :data.components]
+    restored = resize_image(layer, (width, height)).astype('f4')
+    return float(np.abs(restored - np.asarray(data.levels[0], dtype='f4')).mean())
+
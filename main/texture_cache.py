@@ -0,0 +1,257 @@
+"""
+Content-addressed texture cache. Images are decoded once, flipped for OpenGL, and their whole mip chain is built on the
+CPU with NumPy. The result is stored in a binary file named after the hash of the image file's content, so files with
+the same content share one cache file (and one GPU texture, see Texture). At startup the cache is memory-mapped and
+uploaded level by level, so neither decoding nor mipmap generation runs on the GL thread. The content hash of each
+image is kept in an index next to the cache with the file's size and modification time, so unchanged images are not
+read again to find their cache file, and checksums are only checked when a cache is compiled, so loading only reads
+the pages that are uploaded. Running this file compiles every texture in the textures folder, add --verify to check
+the caches that are up to date.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+from collections import namedtuple
+
+import numpy as np
+import pygame as pg
+
+# Cache file layout: a fixed size header, then the raw pixel rows of each mip level, largest first.
+# Header = magic, version, width, height, number of components (3 = RGB, 4 = RGBA), number of mip levels and crc32 of
+# the pixel data.
+MAGIC = b'JTEX'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIIII')
+HEADER_SIZE = 32
+EXTENSION = '.tex'
+CACHE_FOLDER = '../textures/.cache'
+# Index of the source images hashed so far, absolute path -> [size, modification time in ns, content hash].
+INDEX_FILE = 'index.json'
+IMAGE_EXTENSIONS = ('png', 'jpg', 'jpeg')
+
+# key = content hash of the image file, levels = a (height, width, components) uint8 array per mip level.
+TextureData = namedtuple('TextureData', ['key', 'size', 'components', 'levels'])
+
+
+class TextureCacheError(Exception):
+    """
+    Raised when a cache file is missing or corrupted.
+    """
+
+
+def get_content_hash(path):
+    """
+    Hashes the content of an image file, files with the same content get the same key wherever they are.
+    """
+    with open(path, 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()
+
+
+def get_cache_path(key, folder=CACHE_FOLDER):
+    return os.path.join(folder, key + EXTENSION)
+
+
+def read_index(folder=CACHE_FOLDER):
+    """
+    Reads the index of hashed source images, empty if it is missing or unreadable.
+    """
+    try:
+        with open(os.path.join(folder, INDEX_FILE)) as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return index if isinstance(index, dict) else {}
+
+
+def write_index(index, folder=CACHE_FOLDER):
+    """
+    Writes the index of hashed source images. Workers loading textures at the same time each write a temporary file
+    and replace the index with it, so the index is never half written, at worst an entry is lost and hashed again.
+    """
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, INDEX_FILE)
+    temporary = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(temporary, 'w') as file:
+        json.dump(index, file)
+    os.replace(temporary, path)
+
+
+def get_source_key(path, folder=CACHE_FOLDER):
+    """
+    Gets the content hash of an image file, from the index when the file's size and modification time are the ones it
+    was hashed with, else by hashing it and adding it to the index.
+    """
+    stat = os.stat(path)
+    source = os.path.abspath(path)
+    index = read_index(folder)
+    entry = index.get(source)
+    if entry is not None and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return entry[2]
+    key = get_content_hash(path)
+    index[source] = [stat.st_size, stat.st_mtime_ns, key]
+    write_index(index, folder)
+    return key
+
+
+def get_data_size(data, first_level=0):
+    """
+    Gets the number of bytes a texture takes on the GPU, every mip level included.
+    :param first_level: Only counts this level and the coarser ones.
+    """
+    return sum(level.nbytes for level in data.levels[first_level:])
+
+
+def decode_image(path):
+    """
+    Decodes an image file into RGB pixels (RGBA if the image has an alpha channel), flipped to match OpenGL's texture
+    coordinates.
+    :return: A (height, width, components) uint8 array.
+    """
+    image = pg.image.load(path)
+
+    # Makes texture compatible with pygame's axis system
+    image = pg.transform.flip(image, flip_x=False, flip_y=True)
+    mode = 'RGBA' if image.get_flags() & pg.SRCALPHA else 'RGB'
+    width, height = image.get_size()
+    return np.frombuffer(pg.image.tostring(image, mode), dtype='u1').reshape(height, width, len(mode))
+
+
+def build_mipmaps(image):
+    """
+    Builds the mip chain of an image with a 2x2 box filter, halving each side (rounded down, at least 1) per level like
+    OpenGL does.
+    :param image: A (height, width, components) uint8 array.
+    :return: The levels, starting with the image itself and ending with a 1x1 level.
+    """
+    levels = [image]
+    while levels[-1].shape[0] > 1 or levels[-1].shape[1] > 1:
+        level = levels[-1].astype('f4')
+        height, width = max(level.shape[0] // 2, 1), max(level.shape[1] // 2, 1)
+        if level.shape[0] > 1:
+            level = (level[0:height * 2:2] + level[1:height * 2:2]) / 2
+        if level.shape[1] > 1:
+            level = (level[:, 0:width * 2:2] + level[:, 1:width * 2:2]) / 2
+        levels.append((level + 0.5).astype('u1'))
+    return levels
+
+
+def compile_texture(path, key=None, folder=CACHE_FOLDER):
+    """
+    Decodes an image file and writes its mip chain to the cache.
+    :param key: The content hash of the file, computed if None.
+    :return: Path to the written cache file.
+    """
+    key = key or get_content_hash(path)
+    levels = build_mipmaps(decode_image(path))
+    height, width, components = levels[0].shape
+    pixel_data = b''.join(np.ascontiguousarray(level).tobytes() for level in levels)
+    header = HEADER.pack(MAGIC, VERSION, width, height, components, len(levels), zlib.crc32(pixel_data))
+
+    # Written to a temporary file first so that an interrupted compile never leaves a half written cache behind.
+    os.makedirs(folder, exist_ok=True)
+    cache_path = get_cache_path(key, folder)
+    with open(cache_path + '.tmp', 'wb') as cache:
+        cache.write(header.ljust(HEADER_SIZE, b'\0'))
+        cache.write(pixel_data)
+    os.replace(cache_path + '.tmp', cache_path)
+    return cache_path
+
+
+def get_level_sizes(width, height, level_count):
+    """
+    Gets the (width, height) of each mip level.
+    """
+    return [(max(width >> level, 1), max(height >> level, 1)) for level in range(level_count)]
+
+
+def map_texture(path, key, verify=False):
+    """
+    Memory-maps the mip levels of a cache file without copying them.
+    :param key: The content hash the file is stored under.
+    :param verify: Whether to check the crc32 of the pixel data, this reads the whole file.
+    :return: The texture's TextureData, its levels are read-only views of the memory-mapped file.
+    """
+    with open(path, 'rb') as cache:
+        header = cache.read(HEADER_SIZE)
+    if len(header) != HEADER_SIZE:
+        raise TextureCacheError(f'{path}: truncated header')
+    magic, version, width, height, components, level_count, crc = HEADER.unpack_from(header)
+    if magic != MAGIC:
+        raise TextureCacheError(f'{path}: not a texture cache file')
+    if version != VERSION:
+        raise TextureCacheError(f'{path}: cache version {version}, expected {VERSION}')
+    sizes = get_level_sizes(width, height, level_count)
+    if components not in (3, 4) or sizes[-1] != (1, 1):
+        raise TextureCacheError(f'{path}: unexpected texture format')
+    if os.path.getsize(path) != HEADER_SIZE + sum(w * h * components for w, h in sizes):
+        raise TextureCacheError(f'{path}: size does not match header')
+
+    data = np.memmap(path, dtype='u1', mode='r', offset=HEADER_SIZE)
+    if verify and zlib.crc32(data) != crc:
+        raise TextureCacheError(f'{path}: checksum mismatch')
+    levels = []
+    offset = 0
+    for level_width, level_height in sizes:
+        size = level_width * level_height * components
+        levels.append(data[offset:offset + size].reshape(level_height, level_width, components))
+        offset += size
+    return TextureData(key, (width, height), components, levels)
+
+
+def load_texture_data(path, folder=CACHE_FOLDER, verify=False):
+    """
+    Loads the mip chain of an image file from the cache, compiling it first if the file's content is not cached yet.
+    Freshly compiled caches are verified, caches that were already there are only checked if verify is set. Does not
+    touch the GL context so it can run on a worker thread/process.
+    :param path: Path to the image file.
+    :param verify: Whether to check the crc32 of an existing cache.
+    :return: The texture's TextureData.
+    """
+    key = get_source_key(path, folder)
+    cache_path = get_cache_path(key, folder)
+    compiled = not os.path.exists(cache_path)
+    if compiled:
+        compile_texture(path, key, folder)
+    try:
+        return map_texture(cache_path, key, verify or compiled)
+    except TextureCacheError:
+        # Corrupted cache, rebuild it once from the image.
+        compile_texture(path, key, folder)
+        return map_texture(cache_path, key, verify=True)
+
+
+def find_textures(folder='../textures'):
+    """
+    Finds all images in a folder and its subfolders.
+    """
+    files = set()
+    for extension in IMAGE_EXTENSIONS:
+        files.update(glob.glob(os.path.join(folder, '**', f'*.{extension}'), recursive=True))
+    return sorted(files)
+
+
+if __name__ == '__main__':
+    verify = '--verify' in sys.argv
+    keys = {}
+    for image in [arg for arg in sys.argv[1:] if arg != '--verify'] or find_textures():
+        key = get_source_key(image)
+        if key in keys:
+            print(f'Same content as {keys[key]}: {image}')
+            continue
+        keys[key] = image
+        if not os.path.exists(get_cache_path(key)):
+            print(f'Compiling {image} -> {compile_texture(image, key)}')
+        elif not verify:
+            print(f'Up to date {image}')
+        else:
+            try:
+                map_texture(get_cache_path(key), key, verify=True)
+                print(f'Verified {image}')
+            except TextureCacheError as error:
+                print(f'{error}, recompiling {image} -> {compile_texture(image, key)}')
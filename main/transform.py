@@ -0,0 +1,267 @@
+"""
+Batch transform maths with NumPy. Builds many model matrices at once, matching the glm
+translate * rotate x * rotate y * rotate z * scale chain of get_reference_matrix, without a glm call per object.
+The TransformStore keeps the transforms of every model in contiguous arrays and only rebuilds the ones that changed.
+Running this file benchmarks the store against the glm chain.
+"""
+
+import sys
+import time
+
+import glm
+import numpy as np
+
+# Number of transforms the store has room for before its arrays are grown, and the number used by the benchmark.
+INITIAL_CAPACITY = 64
+BENCHMARK_TRANSFORMS = 10000
+
+
+def get_reference_matrix(position, rotation, scale):
+    """
+    Builds a model matrix with a chain of glm calls, one object at a time. This is the reference the vectorized path is
+    checked against.
+    :param position: The position of the object.
+    :param rotation: Euler angles in radians.
+    :param scale: The scale of the object.
+    :return: A glm.mat4 model matrix.
+    """
+    model_matrix = glm.mat4()
+
+    # Translate object to position
+    model_matrix = glm.translate(model_matrix, glm.vec3(*position))
+
+    # Rotate object around XYZ axis as specified in parameters
+    model_matrix = glm.rotate(model_matrix, rotation[0], glm.vec3(1, 0, 0))
+    model_matrix = glm.rotate(model_matrix, rotation[1], glm.vec3(0, 1, 0))
+    model_matrix = glm.rotate(model_matrix, rotation[2], glm.vec3(0, 0, 1))
+
+    # Scale objects
+    model_matrix = glm.scale(model_matrix, glm.vec3(*scale))
+
+    return model_matrix
+
+
+def get_rotation_matrices(rotations):
+    """
+    Builds rotation matrices from euler angles, rotating around X, then Y, then Z in the same order as the glm chain.
+    :param rotations: A (N, 3) array of euler angles in radians.
+    :return: A (N, 3, 3) array of rotation matrices.
+    """
+    rotations = np.asarray(rotations, dtype='f8').reshape(-1, 3)
+    cos, sin = np.cos(rotations), np.sin(rotations)
+    ones, zeros = np.ones(len(rotations)), np.zeros(len(rotations))
+
+    x = np.stack([ones, zeros, zeros, zeros, cos[:, 0], -sin[:, 0], zeros, sin[:, 0], cos[:, 0]], axis=1)
+    y = np.stack([cos[:, 1], zeros, sin[:, 1], zeros, ones, zeros, -sin[:, 1], zeros, cos[:, 1]], axis=1)
+    z = np.stack([cos[:, 2], -sin[:, 2], zeros, sin[:, 2], cos[:, 2], zeros, zeros, zeros, ones], axis=1)
+    return x.reshape(-1, 3, 3) @ y.reshape(-1, 3, 3) @ z.reshape(-1, 3, 3)
+
+
+def compose_matrices(positions, rotations, scales):
+    """
+    Builds model matrices from positions, euler angles and scales.
+    :param positions: A (N, 3) array of positions.
+    :param rotations: A (N, 3) array of euler angles in radians.
+    :param scales: A (N, 3) array of scales.
+    :return: A (N, 4, 4) array of model matrices, rows are matrix rows (like np.array of a glm matrix).
+    """
+    positions = np.asarray(positions, dtype='f8').reshape(-1, 3)
+    matrices = np.zeros((len(positions), 4, 4))
+    matrices[:, :3, :3] = get_rotation_matrices(rotations) * np.asarray(scales, dtype='f8').reshape(-1, 1, 3)
+    matrices[:, :3, 3] = positions
+    matrices[:, 3, 3] = 1
+    return matrices
+
+
+def to_column_major(matrices):
+    """
+    Converts model matrices into float32 data in the column major layout GLSL expects, eg. for a per-instance mat4
+    attribute.
+    :param matrices: A (N, 4, 4) array of model matrices.
+    :return: A (N, 16) float32 array.
+    """
+    return np.ascontiguousarray(np.transpose(matrices, (0, 2, 1)), dtype='f4').reshape(-1, 16)
+
+
+class TransformStore:
+    """
+    Positions, rotations (euler angles in radians) and scales of many objects stored in contiguous NumPy arrays. Setting
+    a value marks the transform dirty, and update() rebuilds the model matrices of dirty transforms (and their children)
+    in one vectorized pass. A transform can have a parent, its world matrix is then parent world * local.
+    With a fixed timestep, begin_tick() keeps the transforms of the last simulation step so update(alpha) can build the
+    matrices of the transforms that moved in between the last two steps.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.count = 0
+        self.positions = np.zeros((capacity, 3))
+        self.rotations = np.zeros((capacity, 3))
+        self.scales = np.ones((capacity, 3))
+        self.parents = np.full(capacity, -1, dtype=np.int64)
+        self.depths = np.zeros(capacity, dtype=np.int64)
+        self.dirty = np.zeros(capacity, dtype=bool)
+        # Transforms of the previous simulation step, and which matrices were built from values in between steps.
+        self.previous_positions = np.zeros((capacity, 3))
+        self.previous_rotations = np.zeros((capacity, 3))
+        self.previous_scales = np.ones((capacity, 3))
+        self.interpolated = np.zeros(capacity, dtype=bool)
+        self.local_matrices = np.tile(np.eye(4), (capacity, 1, 1))
+        self.world_matrices = np.tile(np.eye(4), (capacity, 1, 1))
+        # Column major float32 copies of the world matrices, ready to be written to shaders.
+        self.matrix_data = np.tile(np.eye(4, dtype='f4').ravel(), (capacity, 1))
+
+    def grow(self, capacity):
+        """
+        Resizes the arrays to hold more transforms, keeping the existing ones.
+        """
+        for name, fill in (('positions', 0), ('rotations', 0), ('scales', 1), ('parents', -1), ('depths', 0),
+                           ('dirty', False), ('previous_positions', 0), ('previous_rotations', 0),
+                           ('previous_scales', 1), ('interpolated', False)):
+            old = getattr(self, name)
+            new = np.full((capacity, *old.shape[1:]), fill, dtype=old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+        for name in ('local_matrices', 'world_matrices', 'matrix_data'):
+            old = getattr(self, name)
+            new = np.tile(np.eye(4, dtype=old.dtype).reshape(old.shape[1:]), (capacity, *[1] * (old.ndim - 1)))
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def add(self, position=(0, 0, 0), rotation=(0, 0, 0), scale=(1, 1, 1), parent=-1):
+        """
+        Adds a transform to the store.
+        :param rotation: Euler angles in radians.
+        :param parent: Index of the parent transform, parents have to be added before their children.
+        :return: The index of the transform.
+        """
+        if self.count == len(self.positions):
+            self.grow(len(self.positions) * 2)
+        index = self.count
+        self.count += 1
+        self.positions[index] = self.previous_positions[index] = position
+        self.rotations[index] = self.previous_rotations[index] = rotation
+        self.scales[index] = self.previous_scales[index] = scale
+        self.set_parent(index, parent)
+        return index
+
+    def set_parent(self, index, parent):
+        """
+        Attaches a transform to a parent transform, or detaches it if parent is -1.
+        """
+        if parent >= index:
+            raise ValueError(f'Parent {parent} of transform {index} has to be added before it')
+        self.parents[index] = parent
+        self.depths[index] = 0 if parent < 0 else self.depths[parent] + 1
+        self.dirty[index] = True
+
+    def set_position(self, index, position):
+        self.positions[index] = position
+        self.dirty[index] = True
+
+    def set_rotation(self, index, rotation):
+        """
+        :param rotation: Euler angles in radians.
+        """
+        self.rotations[index] = rotation
+        self.dirty[index] = True
+
+    def set_scale(self, index, scale):
+        self.scales[index] = scale
+        self.dirty[index] = True
+
+    def begin_tick(self):
+        """
+        Keeps the transforms as the previous simulation step's, before the next step changes them.
+        """
+        count = self.count
+        self.previous_positions[:count] = self.positions[:count]
+        self.previous_rotations[:count] = self.rotations[:count]
+        self.previous_scales[:count] = self.scales[:count]
+
+    def update(self, alpha=1.0):
+        """
+        Rebuilds the local matrices of dirty transforms, then the world matrices of dirty transforms and of everything
+        below them in the hierarchy, one hierarchy level at a time.
+        :param alpha: Where between the previous simulation step (0) and the last one (1) to build the matrices of
+        transforms that moved between them.
+        :return: Number of world matrices that were rebuilt.
+        """
+        count = self.count
+        dirty = self.dirty[:count]
+        previous = (self.previous_positions[:count], self.previous_rotations[:count], self.previous_scales[:count])
+        current = (self.positions[:count], self.rotations[:count], self.scales[:count])
+        # Matrices built in between steps last frame have to be rebuilt, even if their transforms stopped moving
+        dirty |= self.interpolated[:count]
+        if alpha < 1:
+            moving = np.zeros(count, dtype=bool)
+            for old, new in zip(previous, current):
+                moving |= (old != new).any(axis=1)
+            dirty |= moving
+            self.interpolated[:count] = moving
+        else:
+            self.interpolated[:count] = False
+        if not dirty.any():
+            return 0
+        indices = np.flatnonzero(dirty)
+        if alpha < 1:
+            values = [old[indices] + (new[indices] - old[indices]) * alpha for old, new in zip(previous, current)]
+        else:
+            values = [new[indices] for new in current]
+        self.local_matrices[indices] = compose_matrices(*values)
+
+        parents, depths = self.parents[:count], self.depths[:count]
+        changed = dirty.copy()
+        max_depth = int(depths.max())
+        for depth in range(1, max_depth + 1):
+            level = depths == depth
+            changed[level] |= changed[parents[level]]
+
+        for depth in range(max_depth + 1):
+            indices = np.flatnonzero(changed & (depths == depth))
+            if depth == 0:
+                self.world_matrices[indices] = self.local_matrices[indices]
+            else:
+                self.world_matrices[indices] = self.world_matrices[parents[indices]] @ self.local_matrices[indices]
+
+        indices = np.flatnonzero(changed)
+        self.matrix_data[indices] = to_column_major(self.world_matrices[indices])
+        dirty[:] = False
+        return len(indices)
+
+
+def benchmark(count=BENCHMARK_TRANSFORMS):
+    """
+    Prints the time taken to build model matrices with the glm chain and with the store, when every transform changed
+    and when only one did, and the largest difference between the two paths.
+    """
+    rng = np.random.default_rng(0)
+    positions = rng.uniform(-100, 100, (count, 3))
+    rotations = rng.uniform(-np.pi, np.pi, (count, 3))
+    scales = rng.uniform(0.5, 2, (count, 3))
+
+    start = time.perf_counter()
+    reference = [get_reference_matrix(*transform) for transform in zip(positions.tolist(), rotations.tolist(),
+                                                                        scales.tolist())]
+    glm_time = time.perf_counter() - start
+
+    store = TransformStore()
+    for transform in zip(positions, rotations, scales):
+        store.add(*transform)
+    start = time.perf_counter()
+    store.update()
+    full_time = time.perf_counter() - start
+
+    store.set_rotation(0, (0, 1, 0))
+    start = time.perf_counter()
+    store.update()
+    single_time = time.perf_counter() - start
+    store.set_rotation(0, rotations[0])
+    store.update()
+
+    error = np.abs(np.array([np.array(matrix) for matrix in reference]) - store.world_matrices[:count]).max()
+    print(f'{count} transforms: glm chain {glm_time * 1000:.2f}ms, store (all dirty) {full_time * 1000:.2f}ms, '
+          f'store (one dirty) {single_time * 1000:.3f}ms, max difference {error:.2e}')
+
+
+if __name__ == '__main__':
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else BENCHMARK_TRANSFORMS)
@@ -0,0 +1,110 @@
+"""
+Uniform buffer objects (UBOs) for the state every shader shares. The camera block (projection and view matrices and
+camera position) is written once per frame and the light block (shadow cascades and Phong intensities) once per change,
+instead of writing the same uniforms into every program for every object. The shadow cascade block holds the light
+matrix of the cascade being rendered into, written once per cascade. All use the std140 layout, where vec3s take 16
+bytes like vec4s and every element of an array takes a multiple of 16 bytes.
+"""
+
+import glm
+
+from shadows import CASCADE_COUNT, MAX_CASCADES
+
+# Uniform block binding points, and the blocks bound to them in every program that declares them.
+CAMERA_BINDING = 0
+LIGHT_BINDING = 1
+SHADOW_CASCADE_BINDING = 2
+BLOCK_BINDINGS = {'Camera': CAMERA_BINDING, 'Light': LIGHT_BINDING, 'ShadowCascade': SHADOW_CASCADE_BINDING}
+
+# Sizes of the blocks in bytes: Camera = mat4 m_proj, mat4 m_view, vec3 camPos, Light = mat4 m_cascades[CASCADE_COUNT],
+# vec4 cascadeSplits, vec3 position, vec3 Ia, vec3 Id, vec3 Is, ShadowCascade = mat4 m_cascade.
+CAMERA_BLOCK_SIZE = 64 * 2 + 16
+LIGHT_BLOCK_SIZE = 64 * CASCADE_COUNT + 16 + 16 * 4
+SHADOW_CASCADE_BLOCK_SIZE = 64
+
+
+def bind_uniform_blocks(program):
+    """
+    Points the uniform blocks a program declares at their binding points.
+    """
+    for name, binding in BLOCK_BINDINGS.items():
+        block = program.get(name, None)
+        if block is not None:
+            block.binding = binding
+
+
+class UniformStats:
+    """
+    Per-frame counters of single uniform writes and uniform buffer writes.
+    """
+
+    def __init__(self):
+        self.uniform_writes = 0
+        self.buffer_writes = 0
+        self.frame = (0, 0)
+
+    def end_frame(self):
+        """
+        Stores the counters of the finished frame and resets them.
+        """
+        self.frame = (self.uniform_writes, self.buffer_writes)
+        self.uniform_writes = self.buffer_writes = 0
+
+    def __repr__(self):
+        uniform_writes, buffer_writes = self.frame
+        return f'uniform writes={uniform_writes} buffer writes={buffer_writes}'
+
+
+class UniformBuffers:
+    """
+    Holds the camera, light and shadow cascade uniform buffers, bound to their binding points for the lifetime of the
+    context.
+    """
+
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.camera_buffer = ctx.buffer(reserve=CAMERA_BLOCK_SIZE, dynamic=True)
+        self.camera_buffer.bind_to_uniform_block(CAMERA_BINDING)
+        self.light_buffer = ctx.buffer(reserve=LIGHT_BLOCK_SIZE)
+        self.light_buffer.bind_to_uniform_block(LIGHT_BINDING)
+        self.shadow_cascade_buffer = ctx.buffer(reserve=SHADOW_CASCADE_BLOCK_SIZE, dynamic=True)
+        self.shadow_cascade_buffer.bind_to_uniform_block(SHADOW_CASCADE_BINDING)
+        self.stats = UniformStats()
+
+    def write_camera(self, camera):
+        """
+        Writes the camera block, once per frame.
+        """
+        self.camera_buffer.write(camera.projection_matrix.to_bytes() + camera.view_matrix.to_bytes() +
+                                 glm.vec4(camera.position, 0).to_bytes())
+        self.stats.buffer_writes += 1
+
+    def write_light(self, light):
+        """
+        Writes the light block, whenever the light changes.
+        """
+        splits = list(light.cascade_splits) + [0] * (MAX_CASCADES - len(light.cascade_splits))
+        cascades = b''.join(matrix.to_bytes() for matrix in light.cascade_matrices) + glm.vec4(*splits).to_bytes()
+        self.light_buffer.write(cascades + b''.join(
+            glm.vec4(value, 0).to_bytes() for value in (light.position, light.intensity_ambient,
+                                                       light.intensity_diffuse, light.intensity_specular)))
+        self.stats.buffer_writes += 1
+
+    def write_shadow_cascade(self, matrix):
+        """
+        Writes the shadow cascade block, before each cascade is rendered.
+        """
+        self.shadow_cascade_buffer.write(matrix.to_bytes())
+        self.stats.buffer_writes += 1
+
+    def write_uniform(self, program, name, value):
+        """
+        Writes a single uniform that is not part of a block, eg. a model matrix, and counts it.
+        """
+        program[name].write(value)
+        self.stats.uniform_writes += 1
+
+    def destroy(self):
+        self.camera_buffer.release()
+        self.light_buffer.release()
+        self.shadow_cascade_buffer.release()
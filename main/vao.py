@@ -3,6 +3,8 @@ Class for Vertex Array Objects (VAO) - object containing one or more Vertex Buff
 the information for a complete rendered object. The VAO dictionary is initialised with a cube VAO.
 """
 
+import numpy as np
+
 from vbo import VBO
 from shaders import Shaders
 
@@ -12,42 +14,95 @@ class VAO:
         self.ctx = ctx
         self.vbo = VBO(ctx)
         self.shaders = Shaders(ctx)
+        # One float buffers holding the texture array layer of each object
+        self.layer_buffers = {}
         self.vaos = {
             'skybox': self.get_vao(
-                program=self.shaders.programs['skybox'],
+                program=self.shaders.get_program('skybox'),
                 vbo=self.vbo.vbos['skybox'])
         }
 
-    def get_vao(self, program, vbo):
+    def get_vao(self, program, vbo, instance_buffer=None, layer_buffer=None):
         """
-        Creates and returns a VAO. In the buffer, '3f' refers to the buffer format and 'in_position' is an input
-        attribute that defines how vertexes are stored in the VBO.
+        Creates and returns an indexed VAO. In the buffer, '3f' refers to the buffer format and 'in_position' is an input
+        attribute that defines how vertexes are stored in the VBO. Triangles are read from the VBO's index buffer.
+        :param instance_buffer: Buffer of per-instance model matrices ('16f/i' = 16 floats per instance), for instanced
+        programs.
+        :param layer_buffer: Buffer holding the object's texture array layer ('1f/r' = 1 float for the whole draw), for
+        texture array programs.
         :return: The created VAO
         """
-        vao = self.ctx.vertex_array(program, [(vbo.vbo, vbo.format, *vbo.attribs)], skip_errors=True)
+        content = [(vbo.vbo, vbo.format, *vbo.attribs)]
+        if instance_buffer is not None:
+            content.append((instance_buffer, '16f/i', 'in_model'))
+        if layer_buffer is not None:
+            content.append((layer_buffer, '1f/r', 'in_layer'))
+        vao = self.ctx.vertex_array(program, content, index_buffer=vbo.ibo,
+                                    index_element_size=vbo.index_element_size, skip_errors=True)
         return vao
 
-    def add_vao(self, name, shader='default'):
+    def add_vao(self, name, shader='default', instance_buffers=None, layer=None):
         """
-        Creates VAOs (and their corresponding shadow VAOs) and adds them to the dictionary.
+        Creates VAOs (and their corresponding shadow VAOs, and depth pre-pass VAOs for opaque objects) and adds them to
+        the dictionary.
+        :param instance_buffers: Buffers of per-instance model matrices of the main, shadow and depth pre-pass VAOs, by
+        'main', 'shadow' and 'depth'. The instanced shader variants are used if given.
+        :param layer: The object's layer in the scene's texture array, the texture array shader variants are used if
+        given.
+        :param shader: 'default' or 'water'.
         """
-        if shader == 'water':
-            self.vaos[name] = self.get_vao(
-                program=self.shaders.programs['water'],
-                vbo=self.vbo.vbos[name])
-            self.vaos["shadow_"+name] = self.get_vao(
-                program=self.shaders.programs['shadow'],
-                vbo=self.vbo.vbos[name])
+        defines = []
+        if instance_buffers is not None:
+            defines.append('INSTANCED')
         else:
-            self.vaos[name] = self.get_vao(
-                    program=self.shaders.programs['default'],
-                    vbo=self.vbo.vbos[name])
-            self.vaos["shadow_"+name] = self.get_vao(
-                program=self.shaders.programs['shadow'],
-                vbo=self.vbo.vbos[name])
+            instance_buffers = {}
+        layer_buffer = None
+        if layer is not None:
+            layer_buffer = self.ctx.buffer(np.array([layer], dtype='f4'))
+            self.layer_buffers[name] = layer_buffer
+            defines.append('TEXTURE_ARRAY')
+        # Water is the default shader drawn partly transparent
+        if shader == 'water':
+            defines.append('WATER')
+        # Programs are compiled the first time a variant is needed
+        self.vaos[name] = self.get_vao(
+            program=self.shaders.get_program('default', defines),
+            vbo=self.vbo.vbos[name],
+            instance_buffer=instance_buffers.get('main'),
+            layer_buffer=layer_buffer)
+        self.vaos["shadow_"+name] = self.get_vao(
+            program=self.shaders.get_program('shadow_map', defines),
+            vbo=self.vbo.vbos[name],
+            instance_buffer=instance_buffers.get('shadow'))
+        # Position-only shadow program projected by the camera, water is blended so it gets no depth pre-pass
+        if shader != 'water':
+            self.vaos["depth_"+name] = self.get_vao(
+                program=self.shaders.get_program('shadow_map', defines + ['DEPTH_PREPASS']),
+                vbo=self.vbo.vbos[name],
+                instance_buffer=instance_buffers.get('depth'))
+
+    def remove_vao(self, name):
+        """
+        Releases an object's VAOs (and its shadow and depth VAOs, layer buffer and VBO) and removes them from the
+        dictionaries.
+        """
+        self.vaos.pop(name).release()
+        self.vaos.pop('shadow_' + name).release()
+        depth_vao = self.vaos.pop('depth_' + name, None)
+        if depth_vao is not None:
+            depth_vao.release()
+        layer_buffer = self.layer_buffers.pop(name, None)
+        if layer_buffer is not None:
+            layer_buffer.release()
+        self.vbo.remove_vbo(name)
+
     def destroy(self):
         """
-        Calls destroy function for VBOs and Shaders
+        Releases the VAOs and calls destroy function for VBOs and Shaders
         """
+        for vao in self.vaos.values():
+            vao.release()
         self.vbo.destroy()
         self.shaders.destroy()
+        for buffer in self.layer_buffers.values():
+            buffer.release()
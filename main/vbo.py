@@ -3,7 +3,9 @@ Class that holds VBOs for objects
 """
 
 import numpy as np
-import pywavefront
+
+from mesh import Mesh
+from mesh_cache import load_mesh
 
 
 class VBO:
@@ -13,6 +15,12 @@ class VBO:
     def add_vbo(self, vbo, name):
         self.vbos[name] = vbo
 
+    def remove_vbo(self, name):
+        """
+        Releases a VBO and removes it from the dictionary.
+        """
+        self.vbos.pop(name).destroy()
+
     def destroy(self):
         """
         Acts as a garbage collector for VBO objects
@@ -29,25 +37,48 @@ class BaseVBO:
         :param ctx: An interactive 2D vector graphics protocol, previously created for the in GraphicsEngine
         """
         self.ctx = ctx
-        self.vbo = self.get_vbo()
+        self.mesh = self.get_mesh()
+        self.vbo, self.ibo = self.get_vbo()
         self.format: str = None
         self.attrib: list = None
         self.file = None
 
+    def get_mesh(self):
+        """
+        Creates an indexed mesh by deduplicating the vertex data.
+        :return: The created mesh.
+        """
+        return Mesh.from_vertex_data(self.get_vertex_data())
+
     def get_vbo(self):
         """
-        Creates and returns a VBO.
-        :return: The created VBO.
+        Creates and returns a VBO holding the unique vertices of the mesh and the index buffer (IBO) that goes with it.
+        :return: The created VBO and IBO.
         """
-        vertex_data = self.get_vertex_data()
-        vbo = self.ctx.buffer(vertex_data)
-        return vbo
+        vbo = self.ctx.buffer(self.mesh.vertices)
+        ibo = self.ctx.buffer(self.mesh.indices)
+        return vbo, ibo
+
+    @property
+    def index_element_size(self):
+        """
+        The byte size of each index in the IBO, 2 or 4.
+        """
+        return self.mesh.indices.itemsize
 
     def destroy(self):
         """
         Acts as a garbage collector for VBOs
         """
         self.vbo.release()
+        self.ibo.release()
+
+    @property
+    def size(self):
+        """
+        Bytes the vertex and index buffers take on the GPU.
+        """
+        return self.vbo.size + self.ibo.size
 
 class SkyBoxVBO(BaseVBO):
     """
@@ -91,27 +122,25 @@ class SkyBoxVBO(BaseVBO):
 
 
 class ObjVBO(BaseVBO):
-    def __init__(self, app, file):
+    def __init__(self, app, file, mesh=None, optimise=False):
         """
         Initialises a VBO from an obj file with parameters needed.
         :param app: Previously created graphical engine
+        :param mesh: Mesh already loaded from the obj file (eg. by the asset loader), loaded here if None.
+        :param optimise: Load the mesh optimised for the vertex cache (see mesh_optimiser.py).
         """
         self.ctx = app
         self.format = '2f 3f 3f'
         self.attribs = ['in_texcoord_0', 'in_normal', 'in_position']
         self.file = file
         self.ctx = app
-        vertex_data = self.get_vertex_data()
-        vbo = self.ctx.buffer(vertex_data)
-        self.vbo = vbo
+        self.optimise = optimise
+        self.mesh = mesh if mesh is not None else self.get_mesh()
+        self.vbo, self.ibo = self.get_vbo()
 
-    def get_vertex_data(self):
+    def get_mesh(self):
         """
-        Uses pywavefront to parse cat obj file for vertex data.
-        :return: A numpy array of vertex data.
+        Memory-maps the compiled mesh cache of the obj file, the cache is (re)built from the obj file when needed.
+        :return: The indexed mesh.
         """
-        objs = pywavefront.Wavefront(self.file, cache=True, parse=True)
-        obj = objs.materials.popitem()[1]
-        vertex_data = obj.vertices
-        vertex_data = np.array(vertex_data, dtype='f4')
-        return vertex_data
+        return load_mesh(self.file, self.optimise)
@@ -0,0 +1,7 @@
+// Projection and view matrices and the camera position, shared by every program through uniform buffers written once
+// per frame (uniforms.py).
+layout (std140) uniform Camera {
+    mat4 m_proj;
+    mat4 m_view;
+    vec3 camPos;
+};
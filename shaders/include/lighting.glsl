@@ -0,0 +1,87 @@
+// Phong lighting with cascaded shadow maps. Needs the normal and fragPos inputs and the Camera block declared before
+// it is included.
+
+// Number of shadow cascades, set by the Shaders class from shadows.py.
+#ifndef CASCADE_COUNT
+#define CASCADE_COUNT 3
+#endif
+
+// The light view projection matrix of each shadow cascade, and the distance from the camera where each one ends.
+layout (std140) uniform Light {
+    mat4 m_cascades[CASCADE_COUNT];
+    vec4 cascadeSplits;
+    vec3 position;
+    vec3 Ia;
+    vec3 Id;
+    vec3 Is;
+} light;
+
+uniform sampler2DShadow shadowMap;
+
+// Width of the square percentage closer filtering kernel, and how far surfaces are moved towards the light before their
+// shadow lookups, set by the Shaders class from shadows.py.
+#ifndef PCF_SIZE
+#define PCF_SIZE 4
+#endif
+#ifndef SHADOW_BIAS
+#define SHADOW_BIAS 0.1
+#endif
+
+// Function to calculate and 'soften' shadows. Picks the first cascade whose slice of the camera's frustum holds the
+// fragment, then averages PCF_SIZE x PCF_SIZE lookups around the fragment in that cascade's tile of the shadow map,
+// using openGL's shadow samplers to see if each one is within shadow. The offsets are in shadow map texels, so the
+// softening does not depend on the window's resolution.
+float getShadow() {
+    float depth = -(m_view * vec4(fragPos, 1.0)).z;
+    int cascade = 0;
+    while (cascade < CASCADE_COUNT && depth > light.cascadeSplits[cascade]) {
+        cascade++;
+    }
+    if (cascade == CASCADE_COUNT) {
+        return 1.0;
+    }
+
+    // Orthographic projection, so no divide by w. The bias is in world units, scaled to the cascade's depth range.
+    vec3 shadowCoord = (light.m_cascades[cascade] * vec4(fragPos, 1.0)).xyz * 0.5 + 0.5;
+    shadowCoord.z -= SHADOW_BIAS * 0.5 * abs(light.m_cascades[cascade][2][2]);
+
+    // The cascades are tiles side by side, lookups are clamped to the fragment's tile.
+    vec2 texelSize = 1.0 / vec2(textureSize(shadowMap, 0));
+    float tileStart = float(cascade) / float(CASCADE_COUNT);
+    float tileEnd = float(cascade + 1) / float(CASCADE_COUNT);
+    shadowCoord.x = tileStart + shadowCoord.x / float(CASCADE_COUNT);
+
+    float start = -0.5 * float(PCF_SIZE - 1);
+    float shadow = 0.0;
+    for (int y = 0; y < PCF_SIZE; y++) {
+        for (int x = 0; x < PCF_SIZE; x++) {
+            vec2 uv = shadowCoord.xy + (vec2(x, y) + start) * texelSize;
+            uv.x = clamp(uv.x, tileStart + 0.5 * texelSize.x, tileEnd - 0.5 * texelSize.x);
+            shadow += texture(shadowMap, vec3(uv, shadowCoord.z));
+        }
+    }
+    return shadow / float(PCF_SIZE * PCF_SIZE);
+}
+
+// Function to calculate lighting using Phong lighting. Also applies shadows.
+vec3 getLight(vec3 colour) {
+    vec3 Normal = normalize(normal);
+
+    // Ambient light intensity
+    vec3 ambient = light.Ia;
+
+    // Diffusion light intensity using Lambert's law
+    vec3 lightDir = normalize(light.position - fragPos);
+    vec3 diffuse = max(0.0, dot(lightDir, Normal)) * light.Id;
+
+    // Specular light intensity
+    vec3 viewDir = normalize(camPos - fragPos);
+    vec3 reflectDir = reflect(-lightDir, normal);
+    float spec = pow(max(dot(viewDir, reflectDir), 0.0), 32.0);
+    vec3 specular = spec * light.Is;
+
+    // Shadows
+    float shadow = getShadow();
+
+    return colour * (ambient + (diffuse + specular) * shadow);
+}
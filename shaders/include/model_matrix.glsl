@@ -0,0 +1,7 @@
+// Instanced models read their model matrix from a per-instance attribute instead of a uniform.
+#ifdef INSTANCED
+layout (location = 3) in mat4 in_model;
+#define m_model in_model
+#else
+uniform mat4 m_model;
+#endif
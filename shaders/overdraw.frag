@@ -0,0 +1,22 @@
+#version 330 core
+
+// Shows the overdraw counted by overdraw.py as a heat map: pixels shaded once are blue, then green, yellow and red up
+// to u_max_overdraw times or more. Pixels no opaque object covers are left black.
+layout (location = 0) out vec4 fragColor;
+
+in vec2 uv;
+
+uniform sampler2D u_overdraw;
+uniform float u_max_overdraw;
+
+void main() {
+    float count = texture(u_overdraw, uv).r;
+    if (count < 0.5) {
+        fragColor = vec4(0.0, 0.0, 0.0, 1.0);
+        return;
+    }
+    float heat = clamp((count - 1.0) / max(u_max_overdraw - 1.0, 1.0), 0.0, 1.0);
+    vec3 colour = heat < 0.5 ? mix(vec3(0.0, 0.2, 1.0), vec3(0.0, 1.0, 0.2), heat * 2.0)
+                             : mix(vec3(1.0, 1.0, 0.0), vec3(1.0, 0.0, 0.0), heat * 2.0 - 1.0);
+    fragColor = vec4(colour, 1.0);
+}
@@ -0,0 +1,9 @@
+#version 330 core
+
+// Fullscreen triangle built from the vertex index, so no vertex buffer is needed.
+out vec2 uv;
+
+void main() {
+    uv = vec2((gl_VertexID << 1) & 2, gl_VertexID & 2);
+    gl_Position = vec4(uv * 2.0 - 1.0, 0.0, 1.0);
+}
@@ -0,0 +1,12 @@
+#version 330 core
+
+// Draws the overlay's text texture, blended over the scene.
+layout (location = 0) out vec4 fragColor;
+
+in vec2 uv;
+
+uniform sampler2D u_texture_0;
+
+void main() {
+    fragColor = texture(u_texture_0, uv);
+}
@@ -0,0 +1,12 @@
+#version 330 core
+
+// Screen space quad built from the vertex index, so no vertex buffer is needed.
+out vec2 uv;
+
+// Corners of the quad in normalised device coordinates (left, bottom, right, top).
+uniform vec4 u_rect;
+
+void main() {
+    uv = vec2(gl_VertexID & 1, gl_VertexID >> 1);
+    gl_Position = vec4(mix(u_rect.xy, u_rect.zw, uv), 0.0, 1.0);
+}
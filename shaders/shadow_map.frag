@@ -1,5 +1,13 @@
 #version 330 core
 
-// Empty as shadows dont need colour
+// Empty as shadows dont need colour. The depth pre-pass is drawn with colour writes off, but the overdraw counter
+// (overdraw.py) draws it with additive blending, adding 1 for each fragment that passes the depth test.
+#ifdef DEPTH_PREPASS
+layout (location = 0) out vec4 fragColor;
+#endif
 
-void main() {}
\ No newline at end of file
+void main() {
+#ifdef DEPTH_PREPASS
+    fragColor = vec4(1.0);
+#endif
+}
@@ -2,13 +2,26 @@
 
 layout (location = 2) in vec3 in_position;
 
-// Loading projection, model and light matrices.
-uniform mat4 m_proj;
-uniform mat4 m_view_light;
-uniform mat4 m_model;
+// The depth pre-pass draws the camera's view, projected exactly as default.vert does so both passes write the same
+// depths and the shading pass can test them for equality.
+#ifdef DEPTH_PREPASS
+#include "include/camera.glsl"
+invariant gl_Position;
+#else
+// Loading the light view projection matrix of the shadow cascade being rendered from its uniform buffer (uniforms.py).
+layout (std140) uniform ShadowCascade {
+    mat4 m_cascade;
+};
+#endif
+
+#include "include/model_matrix.glsl"
 
 void main() {
+#ifdef DEPTH_PREPASS
+    gl_Position = m_proj * m_view * m_model * vec4(in_position, 1.0);
+#else
     // Generating Model View Projection matrix
-    mat4 mvp = m_proj * m_view_light * m_model;
+    mat4 mvp = m_cascade * m_model;
     gl_Position = mvp * vec4(in_position, 1.0);
+#endif
 }
\ No newline at end of file
@@ -0,0 +1,32 @@
+#version 330 core
+
+// Stretches the scene, rendered at a lower resolution, over the whole frame. The texture's linear filter does the
+// bilinear upscale. With SHARPEN defined, a contrast adaptive sharpening filter is applied on top: each pixel is pushed
+// away from its four neighbours, less so where the neighbourhood already has high contrast, so edges are sharpened
+// without ringing.
+layout (location = 0) out vec4 fragColor;
+
+in vec2 uv;
+
+uniform sampler2D u_texture_0;
+#ifdef SHARPEN
+uniform float u_sharpness;
+#endif
+
+void main() {
+    vec3 colour = texture(u_texture_0, uv).rgb;
+#ifdef SHARPEN
+    vec2 texel = 1.0 / vec2(textureSize(u_texture_0, 0));
+    vec3 north = texture(u_texture_0, uv + vec2(0.0, texel.y)).rgb;
+    vec3 south = texture(u_texture_0, uv - vec2(0.0, texel.y)).rgb;
+    vec3 east = texture(u_texture_0, uv + vec2(texel.x, 0.0)).rgb;
+    vec3 west = texture(u_texture_0, uv - vec2(texel.x, 0.0)).rgb;
+    vec3 minimum = min(colour, min(min(north, south), min(east, west)));
+    vec3 maximum = max(colour, max(max(north, south), max(east, west)));
+    // Sharpening amount, low where the neighbourhood is close to black or white
+    vec3 amount = sqrt(clamp(min(minimum, 1.0 - maximum) / max(maximum, 1e-4), 0.0, 1.0));
+    vec3 weight = -amount / mix(8.0, 5.0, u_sharpness);
+    colour = clamp((colour + (north + south + east + west) * weight) / (1.0 + 4.0 * weight), 0.0, 1.0);
+#endif
+    fragColor = vec4(colour, 1.0);
+}
@@ -0,0 +1,22 @@
+"""
+Shared set up of the tests. The modules in the main folder import each other by name and open files relative to the
+main folder (eg. '../models'), so the main folder is put on the path and tests that read the repo's files run from it.
+"""
+
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_DIR = os.path.join(ROOT_DIR, 'main')
+sys.path.insert(0, MAIN_DIR)
+
+
+@pytest.fixture
+def main_dir(monkeypatch):
+    """
+    Runs a test from the main folder.
+    """
+    monkeypatch.chdir(MAIN_DIR)
+    return MAIN_DIR
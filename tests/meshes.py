@@ -0,0 +1,70 @@
+"""
+Synthetic meshes for the tests, in the '2f 3f 3f' (uv, normal, position) vertex layout of the mesh cache.
+"""
+
+import numpy as np
+
+from mesh import Mesh
+
+
+def make_mesh(positions, triangles, normals=None):
+    """
+    Builds an indexed mesh from positions and (triangle count, 3) vertex indices, with uvs taken from x and z.
+    """
+    positions = np.asarray(positions, dtype='f4')
+    if normals is None:
+        normals = np.tile(np.array([0, 1, 0], dtype='f4'), (len(positions), 1))
+    vertices = np.concatenate([positions[:, [0, 2]], normals, positions], axis=1).astype('f4')
+    indices = np.asarray(triangles).ravel().astype(np.dtype('<u2') if len(positions) <= 0xFFFF else np.dtype('<u4'))
+    return Mesh(vertices, indices)
+
+
+def make_grid(cells=16, size=1.0, height=None):
+    """
+    Makes a flat grid in the xz plane of cells x cells quads, 2 triangles each.
+    :param height: Function of the (x, z) arrays giving the height of each vertex, flat if None.
+    """
+    coordinates = np.linspace(0, size, cells + 1)
+    x, z = np.meshgrid(coordinates, coordinates, indexing='ij')
+    y = np.zeros_like(x) if height is None else height(x, z)
+    positions = np.stack([x, y, z], axis=-1).reshape(-1, 3)
+    corner = (np.arange(cells)[:, None] * (cells + 1) + np.arange(cells)[None, :]).ravel()
+    triangles = np.concatenate([np.stack([corner, corner + 1, corner + cells + 1], axis=1),
+                                np.stack([corner + 1, corner + cells + 2, corner + cells + 1], axis=1)])
+    return make_mesh(positions, triangles)
+
+
+def make_sphere(rings=16, segments=32, radius=1.0):
+    """
+    Makes a UV sphere around the origin, with a vertex at each pole.
+    """
+    theta = np.linspace(0, np.pi, rings + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, segments, endpoint=False)
+    theta, phi = np.meshgrid(theta, phi, indexing='ij')
+    positions = np.stack([np.sin(theta) * np.cos(phi), np.cos(theta), np.sin(theta) * np.sin(phi)], axis=-1)
+    positions = np.concatenate([[[0, 1, 0]], positions.reshape(-1, 3), [[0, -1, 0]]]) * radius
+    south, last_ring = len(positions) - 1, 1 + (rings - 2) * segments
+    triangles = []
+    for segment in range(segments):
+        following = (segment + 1) % segments
+        triangles.append([0, 1 + following, 1 + segment])
+        triangles.append([south, last_ring + segment, last_ring + following])
+        for row in range(rings - 2):
+            a, b = 1 + row * segments + segment, 1 + row * segments + following
+            c, d = a + segments, b + segments
+            triangles += [[a, b, c], [b, d, c]]
+    return make_mesh(positions, triangles, normals=positions / radius)
+
+
+def get_triangle_set(vertices, indices):
+    """
+    Gets the triangles of an index buffer as a sorted list of vertex rows, each triangle rotated to start with its
+    smallest vertex so the winding is kept but the order of triangles and of vertices in the buffer does not matter.
+    """
+    rows = [tuple(row) for row in np.asarray(vertices).tolist()]
+    triangles = []
+    for a, b, c in np.asarray(indices, dtype=np.int64).reshape(-1, 3).tolist():
+        triangle = (rows[a], rows[b], rows[c])
+        start = triangle.index(min(triangle))
+        triangles.append(triangle[start:] + triangle[:start])
+    return sorted(triangles)
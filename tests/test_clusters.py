@@ -0,0 +1,74 @@
+"""
+Tests of the split/merge invariants of mesh clusters, on synthetic meshes.
+"""
+
+import numpy as np
+import pytest
+
+from clusters import CLUSTER_MIN_RADIUS, build_clusters, merge_ranges, should_cluster
+from lod import generate_lods
+from tests.meshes import get_triangle_set, make_grid, make_sphere
+
+SIZE = 4 * CLUSTER_MIN_RADIUS
+
+
+@pytest.fixture(params=['grid', 'sphere'])
+def mesh(request):
+    if request.param == 'grid':
+        mesh = make_grid(48, SIZE, height=lambda x, z: np.sin(x / 5) * np.cos(z / 7))
+    else:
+        mesh = make_sphere(32, 64, SIZE / 2)
+    return generate_lods(mesh)
+
+
+def get_level(mesh, level):
+    first, count = mesh.lods[level]
+    return mesh.indices[first:first + count]
+
+
+def test_large_meshes_are_clustered(mesh):
+    assert should_cluster(mesh)
+    assert not should_cluster(make_grid(4, SIZE))
+    assert not should_cluster(make_grid(48, CLUSTER_MIN_RADIUS / 2))
+
+
+def test_clusters_concatenate_to_levels(mesh):
+    clustered = build_clusters(mesh, resolution=4)
+    assert clustered.lods == mesh.lods
+    assert clustered.cluster_ranges.shape == (len(mesh.lods), len(clustered.cluster_bounds), 2)
+    for level, (first, count) in enumerate(mesh.lods):
+        ranges = clustered.cluster_ranges[level]
+        # Clusters tile the level's range in order, with no gaps or overlaps
+        assert ranges[0, 0] == first
+        np.testing.assert_array_equal(ranges[1:, 0], ranges[:-1, 0] + ranges[:-1, 1])
+        assert ranges[-1, 0] + ranges[-1, 1] == first + count
+        assert np.all(ranges[:, 1] % 3 == 0)
+        assert merge_ranges(ranges) == [(first, count)]
+
+        triangles = np.concatenate([clustered.indices[start:start + length] for start, length in ranges])
+        assert get_triangle_set(mesh.vertices, triangles) == get_triangle_set(mesh.vertices, get_level(mesh, level))
+
+
+def test_cluster_bounds_hold_their_triangles(mesh):
+    clustered = build_clusters(mesh, resolution=4)
+    positions = np.asarray(clustered.positions)
+    assert np.all(clustered.cluster_ranges[:, :, 1].sum(axis=0) > 0)
+    for level in range(len(clustered.lods)):
+        for (start, length), (low, high) in zip(clustered.cluster_ranges[level], clustered.cluster_bounds):
+            corners = positions[clustered.indices[start:start + length]]
+            if len(corners):
+                assert np.all(corners >= low - 1e-5) and np.all(corners <= high + 1e-5)
+
+
+@pytest.mark.parametrize('ranges, merged', [
+    ([], []),
+    ([(0, 0), (6, 0)], []),
+    ([(0, 3), (3, 6), (9, 3)], [(0, 12)]),
+    ([(0, 3), (6, 3)], [(0, 3), (6, 3)]),
+    ([(0, 3), (3, 0), (3, 3)], [(0, 6)]),
+    ([(0, 6), (3, 6)], [(0, 9)]),
+    ([(0, 12), (3, 3), (6, 3), (15, 3)], [(0, 12), (15, 3)]),
+    ([(0, 6), (2, 2), (6, 3), (12, 3)], [(0, 9), (12, 3)]),
+])
+def test_merge_ranges(ranges, merged):
+    assert merge_ranges(np.array(ranges, dtype=np.int64)) == merged
@@ -0,0 +1,25 @@
+"""
+Tests of the fixed timestep of the run loop.
+"""
+
+from frame_loop import MAX_TICKS_PER_FRAME, FixedTimestep
+
+
+def test_steps_per_frame():
+    """
+    Frames of any length are split into the right number of steps.
+    """
+    timestep = FixedTimestep(tick_rate=60)
+    assert [timestep.advance(1 / 60) for _ in range(60)] == [1] * 60
+    assert sum(timestep.advance(0.007) for _ in range(100)) == 42
+    assert [timestep.advance(1 / 120) for _ in range(4)] == [0, 1, 0, 1]
+
+
+def test_alpha():
+    timestep = FixedTimestep(tick_rate=60)
+    assert timestep.advance(1 / 240) == 0 and abs(timestep.alpha - 0.25) < 1e-9
+
+
+def test_slow_frame_clamped():
+    timestep = FixedTimestep(tick_rate=60)
+    assert timestep.advance(1.0) == MAX_TICKS_PER_FRAME and timestep.accumulator == 0
@@ -0,0 +1,199 @@
+"""
+Tests of the instanced model's batch maths and per-instance culling, with a stub app (context, link, camera and
+uniforms) instead of a GL context.
+"""
+
+from types import SimpleNamespace
+
+import glm
+import numpy as np
+import pytest
+
+from culling import get_frustum_planes, get_visible, transform_boxes
+from model import InstancedModel
+from transform import TransformStore, compose_matrices, get_reference_matrix, to_column_major
+from tests.meshes import make_sphere
+
+# Camera at the origin looking down -z
+PLANES = get_frustum_planes(glm.perspective(glm.radians(50), 16 / 9, 0.1, 100) *
+                            glm.lookAt(glm.vec3(0), glm.vec3(0, 0, -1), glm.vec3(0, 1, 0)))
+
+
+class StubBuffer:
+    """
+    Records the data written and counts the writes made without orphaning the storage first.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.data = None
+        self.orphaned = False
+        self.unorphaned_writes = 0
+        self.released = False
+
+    def orphan(self):
+        self.orphaned = True
+
+    def write(self, data):
+        data = np.asarray(data)
+        assert data.nbytes <= self.size
+        self.data = data.copy()
+        self.unorphaned_writes += not self.orphaned
+        self.orphaned = False
+
+    def release(self):
+        self.released = True
+
+
+class StubProgram(dict):
+    pass
+
+
+class StubVAO:
+    def __init__(self, program, instance_buffer):
+        self.program = program
+        self.instance_buffer = instance_buffer
+        self.renders = []
+
+    def render(self, vertices, first=0, instances=1):
+        self.renders.append((first, vertices, instances))
+
+
+class StubVAOs:
+    """
+    Stands in for the link's VAO manager, creating the main, shadow and depth VAOs of an object.
+    """
+
+    def __init__(self, mesh):
+        self.vaos = {}
+        self.vbo = SimpleNamespace(vbos={})
+        self.mesh = mesh
+
+    def add_vao(self, name, shader='default', instance_buffers=None, layer=None):
+        self.vbo.vbos[name] = SimpleNamespace(mesh=self.mesh)
+        self.vaos[name] = StubVAO(StubProgram(), instance_buffers['main'])
+        self.vaos['shadow_' + name] = StubVAO(StubProgram(), instance_buffers['shadow'])
+        if shader != 'water':
+            self.vaos['depth_' + name] = StubVAO(StubProgram(), instance_buffers['depth'])
+
+
+def make_app(mesh):
+    texture = SimpleNamespace(use=lambda location=0: None)
+    return SimpleNamespace(
+        ctx=SimpleNamespace(buffer=lambda reserve, dynamic=False: StubBuffer(reserve)),
+        link=SimpleNamespace(vao=StubVAOs(mesh),
+                             texture=SimpleNamespace(layers={}, textures={'rock': texture, 'depth_texture': texture})),
+        transforms=TransformStore(), camera=SimpleNamespace(position=(0, 0, 0)),
+        uniforms=SimpleNamespace(write_uniform=lambda program, name, data: None))
+
+
+def make_rocks(positions, rotations=None, scales=None):
+    mesh = make_sphere(radius=0.5)
+    return InstancedModel(make_app(mesh), 'rocks', 'rock', positions, rotations, scales)
+
+
+@pytest.fixture
+def rocks():
+    """
+    A row of instances across the camera's view, most of them outside it.
+    """
+    count = 21
+    positions = np.stack([np.linspace(-100, 100, count), np.zeros(count), np.full(count, -20)], axis=1)
+    rotations = np.stack([np.zeros(count), np.linspace(0, 360, count), np.zeros(count)], axis=1)
+    scales = np.tile(np.linspace(0.5, 2, count)[:, None], (1, 3))
+    return make_rocks(positions, rotations, scales)
+
+
+def get_instance_data(model, render_pass='main'):
+    return model.instance_buffers[render_pass].data.reshape(-1, 16)
+
+
+def test_matrices(rocks):
+    """
+    The batch maths matches the glm matrix chain of each instance.
+    """
+    for matrix, position, rotation, scale in zip(rocks.instance_matrices, rocks.positions, rocks.rotations,
+                                                 rocks.scales):
+        reference = np.array(get_reference_matrix(glm.vec3(*position), glm.vec3(*rotation), glm.vec3(*scale)))
+        assert np.allclose(matrix, reference, atol=1e-5)
+    # Every instance is uploaded to every pass's buffer at first, column major
+    for render_pass in InstancedModel.INSTANCE_PASSES:
+        assert np.array_equal(get_instance_data(rocks, render_pass), to_column_major(rocks.instance_matrices))
+
+
+def test_set_transforms(rocks):
+    positions = rocks.positions + (0, 1, 0)
+    rocks.set_transforms(positions=positions)
+    expected = compose_matrices(positions, rocks.rotations, rocks.scales)
+    assert np.allclose(rocks.instance_matrices, expected)
+
+
+def test_cull_instances(rocks):
+    centre, radius = rocks.vbo.mesh.bounding_sphere
+    aabb_min, aabb_max = rocks.vbo.mesh.aabb
+    count = rocks.instance_count
+    expected = get_visible(PLANES, rocks.instance_matrices, np.tile(centre, (count, 1)), np.full(count, radius),
+                           np.tile(aabb_min, (count, 1)), np.tile(aabb_max, (count, 1)))
+    assert 0 < expected.sum() < count
+
+    rocks.cull_instances(PLANES, rocks.instance_buffers['main'])
+    assert rocks.visible_count == expected.sum()
+    assert np.array_equal(get_instance_data(rocks), to_column_major(rocks.instance_matrices[expected]))
+
+    # Without planes every instance is drawn again
+    rocks.cull_instances(None, rocks.instance_buffers['main'])
+    assert rocks.visible_count == count
+    assert np.array_equal(get_instance_data(rocks), to_column_major(rocks.instance_matrices))
+
+
+def test_draw(rocks):
+    draw_calls, triangles = rocks.draw(PLANES)
+    first, vertices, instances = rocks.vao.renders[-1]
+    assert draw_calls == 1 and instances == rocks.visible_count
+    assert triangles == vertices // 3 * instances
+
+    # Nothing is drawn when every instance is culled
+    rocks.set_transforms(positions=rocks.positions + (0, 0, 200))
+    assert rocks.draw(PLANES) == (0, 0) and rocks.draw_shadow(PLANES) == (0, 0) and rocks.draw_depth(PLANES) == (0, 0)
+    assert len(rocks.vao.renders) == 1
+
+
+def test_pass_buffers(rocks):
+    """
+    Each pass draws from its own buffer, so a later pass culling against another frustum does not overwrite the
+    matrices an earlier pass was drawn with, and every write goes to orphaned storage.
+    """
+    # A light looking down the row of instances from its right end sees more of them than the camera
+    light_planes = get_frustum_planes(glm.ortho(-30, 30, -30, 30, 0.1, 300) *
+                                      glm.lookAt(glm.vec3(150, 0, -20), glm.vec3(0, 0, -20), glm.vec3(0, 1, 0)))
+    rocks.draw(PLANES)
+    main_data = get_instance_data(rocks).copy()
+    for _ in range(3):
+        rocks.draw_shadow(light_planes)
+    rocks.draw_depth(PLANES)
+    rocks.draw_depth(PLANES)
+    assert np.array_equal(get_instance_data(rocks), main_data)
+    assert len(get_instance_data(rocks, 'shadow')) > len(main_data)
+    assert np.array_equal(get_instance_data(rocks, 'depth'), main_data)
+    assert rocks.vao.renders[-1][2] == len(main_data)
+    assert rocks.shadow_vao.renders[-1][2] == len(get_instance_data(rocks, 'shadow'))
+    assert all(buffer.unorphaned_writes == 0 for buffer in rocks.instance_buffers.values())
+
+
+def test_bounds(rocks):
+    """
+    The bounds of the batch hold the world space box of every instance.
+    """
+    centre, radius, world_min, world_max = rocks.bounds
+    aabb_min, aabb_max = rocks.vbo.mesh.aabb
+    count = rocks.instance_count
+    centres, extents = transform_boxes(np.tile(aabb_min, (count, 1)), np.tile(aabb_max, (count, 1)),
+                                       rocks.instance_matrices)
+    assert np.all(world_min <= centres - extents + 1e-9) and np.all(centres + extents <= world_max + 1e-9)
+    assert np.allclose(centre, (world_min + world_max) / 2)
+    assert np.isclose(radius, np.linalg.norm(world_max - centre))
+
+
+def test_destroy(rocks):
+    rocks.destroy()
+    assert all(buffer.released for buffer in rocks.instance_buffers.values())
@@ -0,0 +1,79 @@
+"""
+Tests of the LOD decimator and selector on synthetic meshes.
+"""
+
+import numpy as np
+import pytest
+
+from lod import LOD_RATIOS, LOD_HYSTERESIS, LOD_SCREEN_SIZES, LodSelector, build_lod, generate_lods, simplify
+from tests.meshes import make_grid, make_sphere
+
+MESHES = {
+    'grid': lambda: make_grid(32, height=lambda x, z: 0.1 * np.sin(6 * x) * np.cos(6 * z)),
+    'sphere': lambda: make_sphere(24, 48),
+}
+
+
+@pytest.fixture(params=sorted(MESHES))
+def mesh(request):
+    return MESHES[request.param]()
+
+
+def test_levels_within_targets(mesh):
+    lods = generate_lods(mesh)
+    assert len(lods.lods) > 1
+    for (_, count), ratio in zip(lods.lods[1:], LOD_RATIOS):
+        assert count // 3 <= int(mesh.triangle_count * ratio)
+
+
+def test_levels_decrease_strictly(mesh):
+    lods = generate_lods(mesh)
+    counts = [count for _, count in lods.lods]
+    assert counts[0] == len(mesh.indices)
+    assert all(finer > coarser for finer, coarser in zip(counts, counts[1:]))
+    # Levels follow each other in the index buffer and only use the mesh's own vertices
+    for (first, count), (next_first, _) in zip(lods.lods, lods.lods[1:]):
+        assert first + count == next_first
+    assert int(lods.indices.max()) < mesh.vertex_count
+    assert len(lods.lod_errors) == len(lods.lods) and lods.lod_errors[0] == 0
+
+
+@pytest.mark.parametrize('cell_size', [0.05, 0.2, 0.5])
+def test_error_within_cell_diagonal(mesh, cell_size):
+    indices, error = simplify(mesh.positions, mesh.indices, cell_size)
+    assert 0 <= error <= cell_size * np.sqrt(3)
+    assert len(indices) % 3 == 0 and len(indices) < len(mesh.indices)
+    triangles = indices.reshape(-1, 3)
+    # No triangle collapsed onto fewer than 3 vertices
+    assert np.all((triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2]) &
+                  (triangles[:, 0] != triangles[:, 2]))
+
+
+def test_flat_mesh_cannot_be_simplified():
+    positions = np.zeros((3, 3))
+    assert build_lod(positions, np.array([0, 1, 2], dtype='u2'), 0) is None
+
+
+def test_selector_switches_at_thresholds():
+    selector = LodSelector(len(LOD_SCREEN_SIZES) + 1)
+    threshold = LOD_SCREEN_SIZES[0]
+    assert selector.select(threshold * (1 - LOD_HYSTERESIS / 2)) == 0
+    assert selector.select(threshold * (1 - LOD_HYSTERESIS * 2)) == 1
+    assert selector.select(threshold * (1 + LOD_HYSTERESIS / 2)) == 1
+    assert selector.select(threshold * (1 + LOD_HYSTERESIS * 2)) == 0
+    assert selector.select(0) == len(LOD_SCREEN_SIZES)
+    assert selector.select(float('inf')) == 0
+
+
+def test_selector_does_not_flicker():
+    selector = LodSelector(len(LOD_SCREEN_SIZES) + 1)
+    for threshold in LOD_SCREEN_SIZES:
+        # Sizes jittering around a threshold, within the hysteresis band, keep the level the selector settled on
+        selector.select(threshold * 0.5)
+        sizes = threshold * (1 + LOD_HYSTERESIS * 0.9 * np.sin(np.arange(100)))
+        assert len({selector.select(size) for size in sizes}) == 1
+
+
+def test_selector_clamped_to_levels():
+    selector = LodSelector(2)
+    assert selector.select(0) == 1
@@ -0,0 +1,71 @@
+"""
+Tests that deduplicating the vertices of a mesh into an indexed mesh leaves the triangles it renders unchanged.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from mesh import Mesh, deduplicate, get_index_dtype
+from mesh_cache import parse_obj
+
+# A 2x1 grid of quads in the xz plane, every vertex of the middle edge is shared by 4 triangles.
+GRID_OBJ = '''v 0 0 0
+v 1 0 0
+v 2 0 0
+v 0 0 1
+v 1 0 1
+v 2 0 1
+vt 0 0
+vt 0.5 0
+vt 1 0
+vt 0 1
+vt 0.5 1
+vt 1 1
+vn 0 1 0
+f 1/1/1 4/4/1 2/2/1
+f 2/2/1 4/4/1 5/5/1
+f 2/2/1 5/5/1 3/3/1
+f 3/3/1 5/5/1 6/6/1
+'''
+
+
+def write_obj(folder, text):
+    path = os.path.join(folder, 'grid.obj')
+    with open(path, 'w') as file:
+        file.write(text)
+    return path
+
+
+def test_grid_triangles_unchanged(tmp_path):
+    vertex_data = parse_obj(write_obj(str(tmp_path), GRID_OBJ))
+    mesh = Mesh.from_vertex_data(vertex_data)
+    assert mesh.vertex_count == 6
+    assert mesh.source_vertex_count == 12
+    assert mesh.dedup_ratio == 2
+    np.testing.assert_array_equal(mesh.expand(), vertex_data)
+
+
+@pytest.mark.parametrize('model', ['ground/rocks.obj', 'water/water.obj', 'animals/fish.obj'])
+def test_model_triangles_unchanged(main_dir, model):
+    file = os.path.join('../models', model)
+    if not os.path.exists(file) and not os.path.exists(file + '.bin'):
+        pytest.skip(f'{file} is not in the repo')
+    vertex_data = parse_obj(file)
+    mesh = Mesh.from_vertex_data(vertex_data)
+    assert mesh.vertex_count <= len(vertex_data)
+    np.testing.assert_array_equal(mesh.expand(), vertex_data)
+
+
+def test_vertices_keep_first_use_order():
+    rows = np.array([[2, 2], [1, 1], [2, 2], [3, 3], [1, 1], [3, 3]], dtype='f4')
+    vertices, indices = deduplicate(rows)
+    np.testing.assert_array_equal(vertices, [[2, 2], [1, 1], [3, 3]])
+    np.testing.assert_array_equal(indices, [0, 1, 0, 2, 1, 2])
+    assert indices.dtype == np.dtype('<u2')
+
+
+def test_index_dtype():
+    assert get_index_dtype(0xFFFF) == np.dtype('<u2')
+    assert get_index_dtype(0x10000) == np.dtype('<u4')
@@ -0,0 +1,50 @@
+"""
+Tests of the vertex cache optimisation stage, on synthetic meshes.
+"""
+
+import numpy as np
+
+from mesh import Mesh
+from mesh_optimiser import count_cache_misses, get_cache_stats, optimise_mesh, optimise_vertex_fetch, tipsify
+from tests.meshes import get_triangle_set, make_grid, make_sphere
+
+
+def shuffle_triangles(mesh, seed=0):
+    """
+    Puts a mesh's triangles in a random order, like an exporter with no locality would.
+    """
+    triangles = np.asarray(mesh.indices).reshape(-1, 3)
+    order = np.random.default_rng(seed).permutation(len(triangles))
+    return Mesh(mesh.vertices, triangles[order].ravel())
+
+
+def test_fifo_cache_misses():
+    assert count_cache_misses([0, 1, 2, 0, 1, 2], cache_size=3) == 3
+    # 3 is pushed in and 0 out of a cache of 3, so 0 misses again
+    assert count_cache_misses([0, 1, 2, 3, 0], cache_size=3) == 5
+    assert get_cache_stats([], 16) == (0.0, 0.0)
+
+
+def test_tipsify_keeps_triangles():
+    mesh = shuffle_triangles(make_sphere())
+    indices = tipsify(mesh.indices, mesh.vertex_count)
+    assert len(indices) == len(mesh.indices)
+    assert get_triangle_set(mesh.vertices, indices) == get_triangle_set(mesh.vertices, mesh.indices)
+
+
+def test_optimise_mesh_improves_cache_use():
+    mesh = shuffle_triangles(make_grid(32))
+    optimised = optimise_mesh(mesh)
+    assert get_triangle_set(optimised.vertices, optimised.indices) == get_triangle_set(mesh.vertices, mesh.indices)
+    before, _ = get_cache_stats(mesh.indices)
+    after, _ = get_cache_stats(optimised.indices)
+    assert after < before * 0.75
+    assert after < 1.0
+
+
+def test_vertex_fetch_order():
+    vertices = np.arange(5, dtype='f4')[:, None]
+    reordered, indices = optimise_vertex_fetch(vertices, np.array([3, 1, 3, 4, 1, 3]))
+    # Vertices in order of first use, unused ones (0 and 2) dropped
+    np.testing.assert_array_equal(reordered[:, 0], [3, 1, 4])
+    np.testing.assert_array_equal(indices, [0, 1, 0, 2, 1, 0])
@@ -0,0 +1,68 @@
+"""
+Tests of the occlusion culling rasteriser, depth pyramid and box test, on a wall in front of a camera looking down -z.
+"""
+
+import glm
+import numpy as np
+import pytest
+
+from mesh import Mesh
+from occlusion import OcclusionCuller, build_hierarchy, rasterise
+
+NEAR = 0.1
+VIEW_PROJECTION = np.array(glm.perspective(glm.radians(50), 2, NEAR, 100) *
+                           glm.lookAt(glm.vec3(0), glm.vec3(0, 0, -1), glm.vec3(0, 1, 0)), dtype='f8')
+
+# Two triangles making a 4x4 pixel square, in pixel coordinates
+SQUARE = np.array([[[1, 1], [5, 1], [5, 5]], [[1, 1], [5, 5], [1, 5]]], dtype='f8')
+
+
+def test_coverage():
+    """
+    Coverage follows pixel centres: a 4x4 pixel square covers exactly 16 pixels at its own depth.
+    """
+    depth = np.full((8, 8), np.inf)
+    rasterise(depth, SQUARE.copy(), np.array([3.0, 3.0]))
+    assert (depth == 3).sum() == 16 and (depth[1:5, 1:5] == 3).all()
+
+
+def test_back_faces_and_nearest_depth():
+    depth = np.full((8, 8), np.inf)
+    rasterise(depth, SQUARE.copy(), np.array([3.0, 3.0]))
+    # Back facing triangles are culled, and the nearest depth wins
+    rasterise(depth, SQUARE[:, ::-1].copy(), np.array([1.0, 1.0]))
+    rasterise(depth, SQUARE.copy(), np.array([2.0, 4.0]))
+    assert (depth[1:5, 1:5] <= 3).all() and (depth == 2).any() and not (depth == 1).any()
+
+
+def test_hierarchy():
+    levels = build_hierarchy(np.arange(12, dtype='f8').reshape(3, 4))
+    assert [level.shape for level in levels] == [(3, 4), (2, 2), (1, 1)]
+    # Texels hold the farthest depth below them, texels reaching past the edge of the level below hold no depth
+    assert levels[1][0, 0] == 5 and levels[1][1, 0] == np.inf
+
+
+@pytest.fixture
+def culler():
+    wall = Mesh(np.array([[-5, -5, -10], [5, -5, -10], [5, 5, -10], [-5, 5, -10]], dtype='f4'),
+                np.array([0, 1, 2, 0, 2, 3], dtype='u2'))
+    culler = OcclusionCuller(NEAR, size=(64, 32))
+    culler.render(VIEW_PROJECTION, [wall], np.eye(4)[None])
+    return culler
+
+
+def test_render(culler):
+    assert culler.occluder_triangles == 2 and np.isclose(culler.levels[-1][0, 0], np.inf)
+    assert np.isclose(culler.levels[0][16, 32], 10)
+
+
+@pytest.mark.parametrize('centre, extent, occluded', [
+    ((0, 0, -20), (1, 1, 1), True),  # Behind the wall
+    ((0, 0, -5), (1, 1, 1), False),  # In front of it
+    ((12, 0, -20), (2, 1, 1), False),  # Sticking out past its edge
+    ((0, 0, -10.5), (0.2, 0.2, 0.2), True),  # Just behind it
+    ((0, 0, -0.05), (1, 1, 1), False),  # Crossing the near plane
+])
+def test_occluded(culler, centre, extent, occluded):
+    result = culler.get_occluded(VIEW_PROJECTION, np.array([centre], dtype='f8'), np.array([extent], dtype='f8'))
+    assert result.tolist() == [occluded]
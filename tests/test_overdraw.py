@@ -0,0 +1,23 @@
+"""
+Tests of the overdraw statistics, on made up fragment counts.
+"""
+
+import numpy as np
+
+from overdraw import OverdrawStats, get_overdraw_stats
+
+
+def test_stats():
+    # Counts read back from the float texture are rounded to whole fragments
+    counts = np.array([0, 1, 1, 2, 3.0001, 0.9999], dtype='f4')
+    assert get_overdraw_stats(counts) == (5, 8, 3, 2)
+    stats = OverdrawStats()
+    stats.covered, stats.fragments, stats.max, stats.overdrawn = get_overdraw_stats(counts)
+    assert stats.overdraw == 1.6
+    assert repr(stats) == '1.60 fragments shaded per pixel (max 3), 40% of 5 pixels shaded more than once'
+
+
+def test_empty_frame():
+    assert get_overdraw_stats(np.zeros(4)) == (0, 0, 0, 0)
+    assert get_overdraw_stats(np.zeros(0)) == (0, 0, 0, 0)
+    assert OverdrawStats().overdraw == 0
@@ -0,0 +1,187 @@
+"""
+Tests of the render queue's sort order and counters, with stub programs, textures, VAOs and models instead of a GL
+context.
+"""
+
+from render_queue import PASS_DEPTH, PASS_OPAQUE, PASS_OVERDRAW, PASS_SHADOW, PASS_TRANSPARENT, RenderQueue
+
+
+class StubProgram:
+    def __init__(self, name):
+        self.name = name
+
+
+class StubTexture:
+    def __init__(self, name):
+        self.name = name
+        self.uses = 0
+
+    def use(self, location=0):
+        self.uses += 1
+
+
+class StubVAO:
+    def __init__(self, name, program):
+        self.name = name
+        self.program = program
+
+
+class StubModel:
+    """
+    Stands in for a model, recording the draws it is asked for in a shared log.
+    """
+
+    def __init__(self, name, program, texture, log, vao=None, shadow_program=None, triangles=10):
+        self.vao_name = name
+        self.shader = program
+        self.texture = texture
+        self.vao = vao or StubVAO(name, program)
+        # The shadow and depth pre-pass programs are shared by every model, as the program cache does
+        self.shadow_shader = self.depth_shader = shadow_program or StubProgram('shadow_map')
+        self.shadow_vao = StubVAO(f'shadow_{name}', self.shadow_shader)
+        self.depth_vao = StubVAO(f'depth_{name}', self.depth_shader)
+        self.log = log
+        self.triangles = triangles
+
+    def write_model_matrix(self):
+        pass
+
+    def update_shadow(self):
+        pass
+
+    def update_depth(self):
+        pass
+
+    def draw(self, planes=None):
+        self.log.append(('draw', self.vao_name))
+        return 1, self.triangles
+
+    def draw_shadow(self, planes=None):
+        self.log.append(('shadow', self.vao_name))
+        return 1, self.triangles
+
+    def draw_depth(self, planes=None):
+        self.log.append(('depth', self.vao_name))
+        return 1, self.triangles
+
+
+def make_scene():
+    """
+    Makes 2 programs, 2 textures and 6 models, 'a' to 'f', where 'a' and 'b' share a VAO (eg. LODs of one mesh).
+    :return: The models by name and the draw log.
+    """
+    log = []
+    lit, unlit, shadow = StubProgram('lit'), StubProgram('unlit'), StubProgram('shadow_map')
+    rock, leaf = StubTexture('rock'), StubTexture('leaf')
+    shared = StubVAO('shared', lit)
+    models = {name: StubModel(name, program, texture, log, vao, shadow) for name, program, texture, vao in (
+        ('a', lit, rock, shared), ('b', lit, rock, shared), ('c', unlit, leaf, None), ('d', lit, leaf, None),
+        ('e', lit, rock, None), ('f', unlit, rock, None))}
+    return models, log
+
+
+def submit(queue, render_pass, models, depths):
+    for name, depth in depths.items():
+        queue.submit(render_pass, models[name], depth)
+
+
+def test_opaque_grouped_by_state_then_front_to_back():
+    models, log = make_scene()
+    queue = RenderQueue()
+    submit(queue, PASS_OPAQUE, models, {'c': 1, 'a': 9, 'd': 2, 'b': 3, 'e': 4, 'f': 5})
+    queue.flush()
+    # Grouped by program (unlit seen first), then texture, then VAO, and 'b' before 'a' as they share all three
+    assert [name for _, name in log] == ['c', 'f', 'd', 'b', 'a', 'e']
+    assert queue.stats.program_binds == 2
+    assert queue.stats.texture_binds == 4
+    assert queue.commands == []
+
+
+def test_transparent_back_to_front():
+    models, log = make_scene()
+    queue = RenderQueue()
+    submit(queue, PASS_TRANSPARENT, models, {'a': 3, 'c': 7, 'd': 1, 'f': 5})
+    queue.flush()
+    assert [name for _, name in log] == ['c', 'f', 'a', 'd']
+
+
+def test_depth_pass_front_to_back_by_program():
+    models, log = make_scene()
+    queue = RenderQueue()
+    submit(queue, PASS_DEPTH, models, {'c': 4, 'a': 2, 'e': 1, 'f': 3})
+    queue.flush()
+    assert log == [('depth', 'e'), ('depth', 'a'), ('depth', 'f'), ('depth', 'c')]
+    assert queue.stats.program_binds == 1
+    assert queue.stats.texture_binds == 0
+
+
+def test_overdraw_pass_follows_opaque_order():
+    models, log = make_scene()
+    depths = {'c': 1, 'a': 9, 'd': 2, 'b': 3, 'e': 4, 'f': 5}
+    queue = RenderQueue()
+    submit(queue, PASS_OPAQUE, models, depths)
+    queue.flush()
+    opaque = [name for _, name in log]
+    log.clear()
+    submit(queue, PASS_OVERDRAW, models, depths)
+    queue.flush()
+    assert log == [('depth', name) for name in opaque]
+
+
+def test_shadow_pass_draws_shadow_vaos():
+    models, log = make_scene()
+    queue = RenderQueue()
+    submit(queue, PASS_SHADOW, models, {'a': 2, 'c': 1})
+    queue.flush()
+    assert sorted(log) == [('shadow', 'a'), ('shadow', 'c')]
+    assert queue.stats.texture_binds == 0
+
+
+def test_counters():
+    models, _ = make_scene()
+    queue = RenderQueue()
+    submit(queue, PASS_OPAQUE, models, {'a': 1, 'b': 2})
+    queue.flush()
+    # Bound state is kept between flushes, so the next pass with the same state binds nothing
+    submit(queue, PASS_TRANSPARENT, models, {'e': 1})
+    queue.flush()
+    stats = queue.stats
+    assert (stats.program_binds, stats.texture_binds, stats.draw_calls, stats.triangles) == (1, 1, 3, 30)
+    assert models['a'].texture.uses == 1
+
+    queue.reset_state()
+    submit(queue, PASS_OPAQUE, models, {'a': 1})
+    queue.flush()
+    assert (stats.program_binds, stats.texture_binds) == (2, 2)
+
+    stats.add_draws((2, 5))
+    stats.end_frame()
+    assert stats.frame == (2, 2, 6, 45)
+    assert (stats.program_binds, stats.texture_binds, stats.draw_calls, stats.triangles) == (0, 0, 0, 0)
+    assert repr(stats) == 'program binds=2 texture binds=2 draw calls=6 triangles=45'
+
+
+def test_forget():
+    """
+    Streaming objects in and out does not grow the ids, and objects drawn after the forgotten ones get new ids.
+    """
+    models, _ = make_scene()
+    queue = RenderQueue()
+    submit(queue, PASS_OPAQUE, models, {'a': 1, 'c': 2})
+    # Shadow draws have no texture, so None has an id too
+    submit(queue, PASS_SHADOW, models, {'a': 1})
+    queue.flush()
+    ids = dict(queue.ids)
+    for _ in range(10):
+        model = StubModel('streamed', models['a'].shader, StubTexture('streamed'), [])
+        submit(queue, PASS_OPAQUE, {'streamed': model}, {'streamed': 1})
+        queue.flush()
+        queue.forget(model.vao, model.shadow_vao, model.depth_vao, model.texture)
+    assert queue.ids == ids
+
+    # A new object never shares an id with one still in use, whatever was forgotten before it
+    queue.forget(models['c'].vao, None)
+    new = StubVAO('new', models['a'].shader)
+    assert queue.get_id(new) > max(ids.values())
+    assert len(set(queue.ids.values())) == len(queue.ids)
+    assert queue.get_id(None) == ids[id(None)]
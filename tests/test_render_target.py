@@ -0,0 +1,27 @@
+"""
+Tests of the dynamic resolution controller, on frame times made up from a scene whose cost is all fill rate.
+"""
+
+from render_target import ADJUST_FRAMES, BUDGET_HEADROOM, MAX_RENDER_SCALE, DynamicResolution
+
+
+def run_frames(controller, cost, frames=ADJUST_FRAMES * 20):
+    """
+    Feeds the controller the frame times of a scene that takes cost milliseconds at full resolution.
+    """
+    for _ in range(frames):
+        controller.update(cost * controller.scale ** 2)
+
+
+def test_scale_lowered_to_budget():
+    controller = DynamicResolution(budget_ms=10)
+    run_frames(controller, 20)
+    assert abs(controller.scale - 0.7) < 1e-9, controller.scale
+    assert controller.budget_ms * BUDGET_HEADROOM <= 20 * controller.scale ** 2 <= controller.budget_ms
+
+
+def test_scale_raised_again():
+    controller = DynamicResolution(budget_ms=10)
+    run_frames(controller, 20)
+    run_frames(controller, 5)
+    assert controller.scale == MAX_RENDER_SCALE, controller.scale
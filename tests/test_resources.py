@@ -0,0 +1,114 @@
+"""
+Tests of the GPU resource registry, on a mock context that creates stand-ins with the attributes of moderngl's objects.
+"""
+
+import os
+
+import moderngl as mgl
+import pytest
+
+from resources import ResourceRegistry, get_object_size
+
+# Objects created outside of an owner are owned by the module that created them, this one.
+MODULE = os.path.splitext(os.path.basename(__file__))[0]
+
+
+class MockObject:
+    """
+    Stand-in for a moderngl object, with the attributes the registry reads.
+    """
+
+    class InvalidObject:
+        pass
+
+    def __init__(self, size=None, components=4, dtype='f1', samples=0, filter=(mgl.LINEAR, mgl.LINEAR)):
+        self.mglo = object()
+        self.size = size
+        self.components = components
+        self.dtype = dtype
+        self.samples = samples
+        self.filter = filter
+
+    def release(self):
+        self.mglo = self.InvalidObject()
+
+
+class MockContext:
+    """
+    Stand-in for a context, creating MockObjects.
+    """
+
+    def buffer(self, data=None, reserve=0):
+        return MockObject(size=len(data) if data is not None else reserve)
+
+    def texture(self, size, components, data=None, dtype='f1', samples=0):
+        return MockObject(size, components, dtype, samples)
+
+    def texture_array(self, size, components, data=None, dtype='f1'):
+        return MockObject(size, components, dtype)
+
+    def texture_cube(self, size, components, data=None, dtype='f1'):
+        return MockObject(size, components, dtype)
+
+    def depth_texture(self, size, data=None):
+        return MockObject(size, 1, 'f4')
+
+    def renderbuffer(self, size, components=4, samples=0, dtype='f1'):
+        return MockObject(size, components, dtype, samples)
+
+    def depth_renderbuffer(self, size, samples=0):
+        return MockObject(size, 1, 'f4', samples)
+
+    def vertex_array(self, *args, **kwargs):
+        return MockObject()
+
+    def program(self, **kwargs):
+        return MockObject()
+
+
+@pytest.fixture
+def registry():
+    """
+    A registry holding a buffer, a mipmapped texture and a vertex array of the 'ground' asset, a cube map, a depth
+    texture and a multisampled depth renderbuffer.
+    """
+    registry = ResourceRegistry()
+    ctx = registry.wrap(MockContext())
+    ctx.buffer(reserve=1000)
+    with registry.owner('ground'):
+        texture = ctx.texture((4, 2), 4)
+        texture.filter = (mgl.LINEAR_MIPMAP_LINEAR, mgl.LINEAR)
+        ctx.vertex_array()
+    ctx.texture_cube((2, 2), 3)
+    ctx.depth_texture((8, 8))
+    ctx.depth_renderbuffer((2, 2), samples=4)
+    return registry
+
+
+def test_sizes(registry):
+    texture = registry.resources[1].gl_object
+    # 4x2 + 2x1 + 1x1 texels of 4 bytes, with the MIP chain
+    assert get_object_size('texture', texture) == 44
+    assert registry.resident_bytes == 1000 + 44 + 6 * 2 * 2 * 3 + 8 * 8 * 4 + 2 * 2 * 4 * 4
+
+
+def test_owners(registry):
+    owners = registry.get_owner_sizes()
+    assert owners['ground'] == {'texture': (1, 44), 'vertex array': (1, 0)}
+    assert owners[MODULE]['buffer'] == (1, 1000)
+
+
+def test_lifetimes_and_leaks(registry):
+    buffer = registry.resources[0].gl_object
+    for _ in range(3):
+        registry.collect()
+    buffer.release()
+    registry.collect()
+    assert registry.released == 1 and registry.released_frames == 4
+
+    leaks = registry.get_leaks()
+    assert len(leaks) == 5 and all(leak.site.startswith(f'{MODULE}.py:') for leak in leaks)
+    assert registry.report_leaks().startswith('5 GPU resources leaked')
+    for leak in leaks:
+        leak.gl_object.release()
+    assert registry.report_leaks() == 'No GPU resources leaked' and registry.resident_bytes == 0
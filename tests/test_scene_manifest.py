@@ -0,0 +1,68 @@
+"""
+Tests of the scene manifest format: instanced objects, saving and loading, and the world bounds of objects.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from scene_manifest import Instance, get_transforms, get_world_bounds, load_manifest, save_manifest
+from tests.meshes import make_sphere
+
+ROCKS = {'name': 'rocks', 'mesh': 'rock.obj', 'texture': 'rock.jpg',
+         'instances': [{'position': [0, 0, 0]}, {'position': [4, 0, 0], 'rotation': [0, 90, 0], 'scale': [2, 2, 2]}]}
+FISH = {'name': 'fish', 'mesh': 'fish.obj', 'texture': 'fish.jpg', 'position': [0, -2, 0], 'rotation': [180, 0, 0],
+        'stream': True, 'bounds': [0, -2, 0, 1]}
+
+
+def write_manifest(path, *objects):
+    path.write_text(json.dumps({'objects': list(objects)}))
+    return str(path)
+
+
+def test_load(tmp_path):
+    rocks, fish = load_manifest(write_manifest(tmp_path / 'scene.json', ROCKS, FISH))
+    assert rocks.instances == (Instance((0, 0, 0), (0, 0, 0), (1, 1, 1)), Instance((4, 0, 0), (0, 90, 0), (2, 2, 2)))
+    assert rocks.bounds is None and not rocks.stream
+    assert fish.instances is None and fish.stream and fish.bounds == (0, -2, 0, 1)
+
+
+def test_invalid(tmp_path):
+    with pytest.raises(ValueError):
+        load_manifest(write_manifest(tmp_path / 'scene.json', dict(ROCKS, instances=[])))
+    with pytest.raises(ValueError):
+        load_manifest(write_manifest(tmp_path / 'scene.json', {'name': 'rocks', 'mesh': 'rock.obj'}))
+
+
+def test_save(tmp_path):
+    objects = load_manifest(write_manifest(tmp_path / 'scene.json', ROCKS, FISH))
+    save_manifest(objects, str(tmp_path / 'saved.json'))
+    assert load_manifest(str(tmp_path / 'saved.json')) == objects
+
+
+def test_transforms(tmp_path):
+    rocks, fish = load_manifest(write_manifest(tmp_path / 'scene.json', ROCKS, FISH))
+    positions, rotations, scales = get_transforms(rocks)
+    assert positions.tolist() == [[0, 0, 0], [4, 0, 0]] and rotations.tolist() == [[0, 0, 0], [0, 90, 0]]
+    assert scales.tolist() == [[1, 1, 1], [2, 2, 2]]
+    # Objects that are not instanced are one copy at their position
+    assert [array.tolist() for array in get_transforms(fish)] == [[[0, -2, 0]], [[180, 0, 0]], [[1, 1, 1]]]
+
+
+def test_world_bounds(tmp_path):
+    rocks, fish = load_manifest(write_manifest(tmp_path / 'scene.json', ROCKS, FISH))
+    mesh = make_sphere(radius=1)
+    centre, radius = mesh.bounding_sphere
+
+    # One copy: the mesh's sphere moved into place
+    x, y, z, fish_radius = get_world_bounds(mesh, fish)
+    assert np.allclose((x, y, z), np.array(centre) * (1, -1, -1) + (0, -2, 0), atol=1e-6)
+    assert np.isclose(fish_radius, radius)
+
+    # Instances: a sphere holding the sphere of every copy
+    *world_centre, world_radius = get_world_bounds(mesh, rocks)
+    for position, scale in (((0, 0, 0), 1), ((4, 0, 0), 2)):
+        reach = np.linalg.norm(np.array(position) - world_centre) + radius * scale
+        assert reach <= world_radius + 1e-6
+    assert world_radius < 2 * radius + 4 + 1e-6
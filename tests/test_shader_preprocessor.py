@@ -0,0 +1,45 @@
+"""
+Tests of the shader preprocessor, on the repo's shaders and on include cycles, without a GL context.
+"""
+
+import os
+
+import pytest
+
+from shader_preprocessor import INCLUDE_PATTERN, preprocess, resolve_includes
+from tests.conftest import ROOT_DIR
+
+SHADER_DIR = os.path.join(ROOT_DIR, 'shaders')
+SHADERS = sorted(os.path.splitext(name)[0] for name in os.listdir(SHADER_DIR) if name.endswith('.vert'))
+
+
+@pytest.mark.parametrize('name', SHADERS)
+def test_includes_resolved(name):
+    _, sources, files = preprocess(name, ['INSTANCED', 'TEXTURE_ARRAY'], SHADER_DIR)
+    for source in sources:
+        assert source.startswith('#version')
+        assert not any(INCLUDE_PATTERN.match(line) for line in source.split('\n'))
+    for stage_files in files:
+        assert len(stage_files) == len(set(stage_files)), f'{name} includes a file twice'
+
+
+def test_variant_keys():
+    """
+    Macros the shader does not use do not make a new variant, and their order does not matter.
+    """
+    assert preprocess('shadow_map', ['TEXTURE_ARRAY'], SHADER_DIR)[0] == preprocess('shadow_map', (), SHADER_DIR)[0]
+    assert preprocess('default', ['INSTANCED', 'WATER'], SHADER_DIR)[0] == \
+        preprocess('default', ['WATER', 'INSTANCED'], SHADER_DIR)[0]
+    assert preprocess('default', ['WATER'], SHADER_DIR)[0] != preprocess('default', (), SHADER_DIR)[0]
+
+
+def test_defines_keep_line_numbers():
+    _, sources, _ = preprocess('default', ['PCF_SIZE 2'], SHADER_DIR)
+    assert sources[1].split('\n')[1:3] == ['#define PCF_SIZE 2', '#line 2 0']
+
+
+def test_include_cycle(tmp_path):
+    for name, include in (('a.glsl', 'b.glsl'), ('b.glsl', 'a.glsl')):
+        (tmp_path / name).write_text(f'#include "{include}"\n')
+    with pytest.raises(ValueError):
+        resolve_includes(str(tmp_path / 'a.glsl'))
@@ -0,0 +1,59 @@
+"""
+Tests of the cascade split and fitting maths of the cascaded shadow maps, without a GPU.
+"""
+
+import glm
+import numpy as np
+import pytest
+
+from camera import FOV, NEAR, FAR
+from shadows import (SHADOW_MAP_SIZE, get_cascade_splits, get_slice_corners, get_world_corners,
+                     fit_cascade_projection, get_tile_viewport)
+
+SPLITS = get_cascade_splits(NEAR, FAR)
+
+# Camera at (0, 2, -6) looking down +x, light from Light's default position.
+CAMERA_VIEW = glm.lookAt(glm.vec3(0, 2, -6), glm.vec3(1, 2, -6), glm.vec3(0, 1, 0))
+LIGHT_VIEW = glm.lookAt(glm.vec3(50, 50, -10), glm.vec3(0), glm.vec3(0, 1, 0))
+CASTER_CORNERS = get_world_corners(np.array([[-50, 0, -50]], 'f8'), np.array([[50, 10, 50]], 'f8'), np.eye(4)[None])
+
+
+def get_cascade_matrix(camera_view, near, far):
+    corners = get_slice_corners(camera_view, FOV, 16 / 9, near, far)
+    return corners, np.array(fit_cascade_projection(LIGHT_VIEW, corners, CASTER_CORNERS) * LIGHT_VIEW, dtype='f8')
+
+
+def test_splits():
+    assert np.isclose(SPLITS[0], NEAR) and np.isclose(SPLITS[-1], FAR) and (np.diff(SPLITS) > 0).all()
+    # Uniform and logarithmic splits
+    assert np.allclose(get_cascade_splits(1, 100, 3, 0), [1, 34, 67, 100])
+    assert np.allclose(get_cascade_splits(1, 1000, 3, 1), [1, 10, 100, 1000])
+
+
+@pytest.mark.parametrize('near, far', list(zip(SPLITS, SPLITS[1:])))
+def test_cascade_covers_slice(near, far):
+    """
+    Every corner of the slice has to land inside the cascade's clip space.
+    """
+    corners, matrix = get_cascade_matrix(CAMERA_VIEW, near, far)
+    clip = np.c_[corners, np.ones(8)] @ matrix.T
+    assert (np.abs(clip[:, :3] / clip[:, 3:]) <= 1).all()
+
+
+@pytest.mark.parametrize('near, far', list(zip(SPLITS, SPLITS[1:])))
+def test_cascade_snapped_to_texels(near, far):
+    """
+    Moving the camera by less than a texel must not move the projection by a fraction of a texel.
+    """
+    _, matrix = get_cascade_matrix(CAMERA_VIEW, near, far)
+    _, moved_matrix = get_cascade_matrix(glm.translate(CAMERA_VIEW, glm.vec3(0, 0, 1e-4)), near, far)
+    texels = (moved_matrix - matrix)[:2, 3] * np.array(SHADOW_MAP_SIZE) / 2
+    assert np.allclose(texels, np.round(texels), atol=1e-3)
+
+
+def test_tile_viewports():
+    viewports = [get_tile_viewport(index) for index in range(len(SPLITS) - 1)]
+    assert viewports[0] == (0, 0, *SHADOW_MAP_SIZE)
+    # Tiles sit side by side without overlapping
+    for first, second in zip(viewports, viewports[1:]):
+        assert second[0] == first[0] + first[2] and second[1:] == first[1:]
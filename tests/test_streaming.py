@@ -0,0 +1,307 @@
+"""
+Tests of streaming textures' MIP levels in and objects in and out around the camera, with stub GL textures, VBOs, VAOs,
+models and render queue instead of a GL context.
+"""
+
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import streaming
+from resources import ResourceRegistry
+from scene_manifest import ManifestObject
+from streaming import FAILED, RESIDENT, STREAM_DISTANCE, UNLOADED, ResidencyManager
+from texture import COARSE_MIP_SIZE, Texture
+from texture_cache import TextureData, build_mipmaps, get_data_size
+from tests.meshes import make_sphere
+
+# GPU bytes of each stub VBO.
+MESH_SIZE = 2 ** 20
+
+
+class StubGLTexture:
+    """
+    Records the levels written to it. build_mipmaps sets the base level and, like the GPU, rebuilds the coarser levels,
+    which the stub marks as generated rather than written.
+    """
+
+    def __init__(self, size=(1, 1), components=3):
+        self.size = size
+        self.components = components
+        self.levels = {}
+        self.base_level = 0
+        self.released = False
+
+    def build_mipmaps(self, base=0, max_level=1000):
+        self.base_level = base
+        for level in range(base + 1, max_level + 1):
+            self.levels[level] = 'generated'
+
+    def write(self, data, level=0):
+        self.levels[level] = data
+
+    def release(self):
+        self.released = True
+
+
+class StubContext:
+    def texture(self, size, components):
+        return StubGLTexture(size, components)
+
+
+class StubVBO:
+    def __init__(self, ctx, file, mesh, optimise=False):
+        self.size = MESH_SIZE
+
+
+class StubVAOs:
+    """
+    Stands in for the link's VAO manager, recording the VAOs removed.
+    """
+
+    def __init__(self):
+        self.vbo = SimpleNamespace(add_vbo=lambda vbo, name: None)
+        self.removed = []
+
+    def add_vao(self, name, shader='default'):
+        pass
+
+    def remove_vao(self, name):
+        self.removed.append(name)
+
+
+class StubModel:
+    transform_ids = 0
+
+    def __init__(self, app, vao_name, texture_id, position, rotation, transparent=False, transform_id=None):
+        self.vao_name = vao_name
+        self.texture_id = texture_id
+        self.texture = None
+        self.vao, self.shadow_vao, self.depth_vao = (SimpleNamespace(name=f'{prefix}{vao_name}')
+                                                     for prefix in ('', 'shadow_', 'depth_'))
+        if transform_id is None:
+            StubModel.transform_ids += 1
+            transform_id = StubModel.transform_ids
+        self.transform_id = transform_id
+
+
+class StubQueue:
+    def __init__(self):
+        self.forgotten = []
+
+    def forget(self, *objects):
+        self.forgotten.extend(objects)
+
+
+def make_data(key, size=256):
+    return TextureData(key, (size, size), 3, build_mipmaps(np.full((size, size, 3), len(key), dtype='u1')))
+
+
+@pytest.fixture
+def texture(monkeypatch):
+    """
+    A texture manager on a stub context, with stub placeholder, skybox and shadow map textures.
+    """
+    for name in ('get_texture', 'get_texture_cube', 'get_depth_texture'):
+        monkeypatch.setattr(Texture, name, lambda self, *args, **kwargs: StubGLTexture())
+    return Texture(SimpleNamespace(ctx=StubContext(), resources=ResourceRegistry()))
+
+
+def test_stream_levels(texture):
+    data = make_data('rock')
+    coarse_level = 2
+    assert max(data.levels[coarse_level].shape[:2]) == COARSE_MIP_SIZE
+    assert texture.add_texture('rock.png', 'rock', data, coarse_first=True) == get_data_size(data, coarse_level)
+    gl_texture = texture.textures['rock']
+    assert texture.streaming['rock'] == (data, coarse_level) and gl_texture.base_level == coarse_level
+    assert all(gl_texture.levels[level] is data.levels[level] for level in range(coarse_level, len(data.levels)))
+
+    # At least one level is uploaded each call however small the budget, and the precomputed coarser levels are
+    # written again over the ones the GPU rebuilt
+    assert texture.stream_levels(1) == get_data_size(data, 1)
+    assert texture.streaming['rock'] == (data, 1) and gl_texture.base_level == 1
+    assert texture.stream_levels(float('inf')) == get_data_size(data)
+    assert 'rock' not in texture.streaming and gl_texture.base_level == 0
+    assert all(gl_texture.levels[level] is pixels for level, pixels in enumerate(data.levels))
+    assert texture.stream_levels(float('inf')) == 0
+
+
+def test_stream_budget(texture):
+    rock, leaf = make_data('rock'), make_data('leaf')
+    texture.add_texture('rock.png', 'rock', rock, coarse_first=True)
+    texture.add_texture('leaf.png', 'leaf', leaf, coarse_first=True)
+    assert texture.stream_levels(get_data_size(rock, 1)) == get_data_size(rock, 1)
+    assert texture.streaming == {'rock': (rock, 1), 'leaf': (leaf, 2)}
+    assert texture.stream_levels(get_data_size(rock, 0) + get_data_size(leaf, 1)) == \
+        get_data_size(rock, 0) + get_data_size(leaf, 1)
+    assert texture.streaming == {'leaf': (leaf, 1)}
+
+
+@pytest.mark.parametrize('size', [COARSE_MIP_SIZE, 16])
+def test_small_texture(texture, size):
+    """
+    Textures whose finest level is already coarse are uploaded whole and never streamed.
+    """
+    data = make_data('pebble', size)
+    assert texture.add_texture('pebble.png', 'pebble', data, coarse_first=True) == get_data_size(data)
+    assert not texture.streaming and texture.textures['pebble'].base_level == 0
+    assert all(texture.textures['pebble'].levels[level] is pixels for level, pixels in enumerate(data.levels))
+    assert texture.stream_levels(1) == 0
+
+
+def test_release_streaming(texture):
+    texture.add_texture('rock.png', 'rock', make_data('rock'), coarse_first=True)
+    gl_texture = texture.textures['rock']
+    assert texture.release_texture('rock') is gl_texture and gl_texture.released
+    assert not texture.streaming and texture.stream_levels(float('inf')) == 0
+
+
+@pytest.fixture
+def stream(monkeypatch, texture):
+    """
+    Makes residency managers of objects along the x axis, STREAM_DISTANCE * 2 apart so the camera is near one at a
+    time. Every mesh takes MESH_SIZE bytes and objects without a texture in textures fail to load.
+    """
+    mesh = make_sphere(radius=1)
+    textures = {}
+    monkeypatch.setattr(streaming, 'ObjVBO', StubVBO)
+    monkeypatch.setattr(streaming, 'ObjModel', StubModel)
+    monkeypatch.setattr(streaming, 'read_mesh', lambda path, optimise=False: (mesh, 0))
+
+    def decode_texture(path):
+        if path not in textures:
+            raise OSError(f'No such file: {path}')
+        return textures[path], 0
+    monkeypatch.setattr(streaming, 'decode_texture', decode_texture)
+
+    def make_manager(names, budget, synchronous=True, shared_texture=False):
+        entries = []
+        for index, name in enumerate(names):
+            texture_file = 'shared.png' if shared_texture else f'{name}.png'
+            textures.setdefault(texture_file, make_data(texture_file))
+            position = (index * STREAM_DISTANCE * 2, 0, 0)
+            entries.append(ManifestObject(name, f'{name}.obj', texture_file, position, (0, 0, 0), False, True,
+                                          (*position, 1), None))
+        app = SimpleNamespace(ctx=StubContext(), resources=ResourceRegistry(),
+                              link=SimpleNamespace(vao=StubVAOs(), texture=texture),
+                              scene_renderer=SimpleNamespace(queue=StubQueue()))
+        return ResidencyManager(app, SimpleNamespace(objects=[], water_models=[]), entries, budget, synchronous)
+    make_manager.textures = textures
+    return make_manager
+
+
+def visit(manager, name):
+    obj = next(obj for obj in manager.objects if obj.name == name)
+    manager.update(obj.entry.position)
+    return obj
+
+
+def get_states(manager):
+    return {obj.name: obj.state for obj in manager.objects}
+
+
+def get_object_size(manager):
+    return MESH_SIZE + get_data_size(make_data(manager.objects[0].entry.texture))
+
+
+def test_lru_eviction(stream):
+    """
+    Objects are evicted least recently used first, and each eviction drops the object's VAOs from the render queue and
+    releases its texture.
+    """
+    manager = stream('abcd', budget=0)
+    manager.budget = get_object_size(manager) * 2
+    for name in 'abc':
+        visit(manager, name)
+    assert get_states(manager) == {'a': UNLOADED, 'b': RESIDENT, 'c': RESIDENT, 'd': UNLOADED}
+
+    # Using 'b' again makes 'c' the least recently used
+    visit(manager, 'b')
+    visit(manager, 'd')
+    assert get_states(manager) == {'a': UNLOADED, 'b': RESIDENT, 'c': UNLOADED, 'd': RESIDENT}
+    visit(manager, 'a')
+    assert get_states(manager) == {'a': RESIDENT, 'b': UNLOADED, 'c': UNLOADED, 'd': RESIDENT}
+
+    link = manager.app.link
+    assert link.vao.removed == ['a', 'c', 'b'] and manager.evictions == 3
+    assert [obj.vao_name for obj in manager.scene.objects] == ['d', 'a']
+    forgotten = manager.app.scene_renderer.queue.forgotten
+    assert [vao.name for vao in forgotten[:3]] == ['a', 'shadow_a', 'depth_a']
+    assert forgotten[3].released and set(link.texture.keys) == {'a', 'd'}
+
+
+def test_budget(stream):
+    manager = stream('abcdef', budget=0)
+    size = get_object_size(manager)
+    manager.budget = size * 3
+    for name in 'abcdefab':
+        visit(manager, name)
+        assert manager.get_resident_size() <= manager.budget
+    assert manager.get_resident_size() == size * 3 and manager.evictions == 5
+
+    # Nothing is evicted while everything fits
+    manager = stream('ghijkl', budget=size * 6)
+    for name in 'ghijkl':
+        visit(manager, name)
+    assert set(get_states(manager).values()) == {RESIDENT} and manager.evictions == 0
+
+
+def test_shared_texture(stream):
+    """
+    Objects sharing a texture count it once, and it is released with the last of them.
+    """
+    manager = stream('abc', budget=0, shared_texture=True)
+    manager.budget = get_object_size(manager) + MESH_SIZE
+    visit(manager, 'a')
+    visit(manager, 'b')
+    assert manager.get_resident_size() == manager.budget and manager.evictions == 0
+    visit(manager, 'c')
+    assert get_states(manager) == {'a': UNLOADED, 'b': RESIDENT, 'c': RESIDENT}
+    assert manager.app.scene_renderer.queue.forgotten[3] is None
+
+
+def test_near_objects_kept(stream):
+    """
+    Objects near the camera are not evicted, even over the budget.
+    """
+    manager = stream('ab', budget=1)
+    manager.update((STREAM_DISTANCE, 0, 0))
+    assert get_states(manager) == {'a': RESIDENT, 'b': RESIDENT} and manager.evictions == 0
+    manager.update((STREAM_DISTANCE, 0, 0))
+    assert manager.evictions == 0
+
+    # Once the camera moves away both go
+    manager.update((STREAM_DISTANCE * 10, 0, 0))
+    assert get_states(manager) == {'a': UNLOADED, 'b': UNLOADED} and manager.get_resident_size() == 0
+    assert not manager.scene.objects
+
+
+def test_failed_load(stream, capsys):
+    manager = stream('ab', budget=2 ** 30)
+    del stream.textures['a.png']
+    for _ in range(2):
+        visit(manager, 'a')
+    assert get_states(manager) == {'a': FAILED, 'b': UNLOADED}
+    assert capsys.readouterr().out == 'Could not stream a: No such file: a.png\n'
+    assert not manager.scene.objects and 'a' not in manager.app.link.texture.keys
+
+
+def test_failed_upload(stream, capsys):
+    """
+    An object whose texture fails after its mesh was uploaded is taken out of the scene again.
+    """
+    manager = stream('a', budget=0, synchronous=False)
+    obj = manager.objects[0]
+    obj.state = streaming.LOADING
+    obj.mesh_job = (make_sphere(radius=1), 0)
+    obj.texture_job = Future()
+    obj.texture_job.set_exception(ValueError('Corrupted texture'))
+    manager.update((STREAM_DISTANCE * 10, 0, 0))
+    manager.destroy()
+
+    assert obj.state == FAILED and obj.model is None and not manager.scene.objects
+    assert manager.app.link.vao.removed == ['a']
+    assert [vao.name for vao in manager.app.scene_renderer.queue.forgotten] == ['a', 'shadow_a', 'depth_a']
+    assert capsys.readouterr().out == 'Could not stream a: Corrupted texture\n'
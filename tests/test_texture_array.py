@@ -0,0 +1,125 @@
+"""
+Tests of the texture array packer: which layer each texture ends up in, and that sampling a texture's layer at the
+texture's own UVs gives back the texture, whatever its size was.
+"""
+
+import re
+
+import numpy as np
+import pytest
+
+from shader_preprocessor import preprocess
+from texture_array import LAYER_SIZE, pack_texture_array, get_resample_error
+from texture_cache import TextureData, build_mipmaps
+
+SIZE = (64, 64)
+
+# Colour of each quadrant, from the first row and column of the pixels (uv (0, 0) in OpenGL).
+QUADRANTS = {(0.25, 0.25): (255, 0, 0), (0.75, 0.25): (0, 255, 0), (0.25, 0.75): (0, 0, 255),
+             (0.75, 0.75): (255, 255, 0)}
+
+
+def make_texture(key, width, height, components=3, alpha=128):
+    """
+    Builds the TextureData of a texture with a solid colour in each quadrant.
+    """
+    image = np.empty((height, width, components), dtype='u1')
+    for (u, v), colour in QUADRANTS.items():
+        rows = slice(0, height // 2) if v < 0.5 else slice(height // 2, height)
+        columns = slice(0, width // 2) if u < 0.5 else slice(width // 2, width)
+        image[rows, columns, :3] = colour
+    if components == 4:
+        image[..., 3] = alpha
+    return TextureData(key, (width, height), components, build_mipmaps(image))
+
+
+def sample(image, u, v):
+    """
+    Nearest texel of an image at a texture coordinate, as OpenGL addresses the uploaded pixels.
+    """
+    height, width = image.shape[:2]
+    return image[min(int(v * height), height - 1), min(int(u * width), width - 1)]
+
+
+def get_layer(array_data, data):
+    return array_data.pixels[array_data.layers[data.key]]
+
+
+def test_layer_occupancy():
+    textures = [make_texture('a', 64, 64), make_texture('b', 16, 32), make_texture('a', 64, 64),
+                make_texture('c', 128, 128), make_texture('b', 16, 32)]
+    array_data = pack_texture_array(textures, SIZE)
+
+    # Each distinct texture gets its own layer, in the order they were first seen, and duplicates share it
+    assert array_data.layers == {'a': 0, 'b': 1, 'c': 2}
+    assert array_data.pixels.shape == (3, SIZE[1], SIZE[0], 3)
+    assert array_data.pixels.dtype == np.uint8
+    assert array_data.size == SIZE and array_data.components == 3
+
+
+@pytest.mark.parametrize('width, height', [(64, 64), (16, 16), (32, 128), (256, 256), (512, 128)])
+def test_layer_contents(width, height):
+    """
+    Same size textures are copied, smaller ones upsampled and bigger ones downsampled from their mip chain, without
+    flipping or transposing them.
+    """
+    data = make_texture('texture', width, height)
+    layer = get_layer(pack_texture_array([data], SIZE), data)
+    if (width, height) == SIZE:
+        assert np.array_equal(layer, data.levels[0])
+    for (u, v), colour in QUADRANTS.items():
+        assert np.array_equal(sample(layer, u, v), colour), (u, v)
+        assert np.array_equal(sample(layer, u, v), sample(data.levels[0], u, v)), (u, v)
+
+
+def test_mixed_sizes():
+    textures = [make_texture(f'texture {size}', size, size) for size in (8, 64, 256)]
+    array_data = pack_texture_array(textures, SIZE)
+    assert sorted(array_data.layers.values()) == [0, 1, 2]
+    for data in textures:
+        layer = get_layer(array_data, data)
+        for (u, v), colour in QUADRANTS.items():
+            assert np.array_equal(sample(layer, u, v), colour), (data.key, u, v)
+        # Only the edges between the quadrants are blurred by resampling
+        assert get_resample_error(data, array_data) < 16
+
+
+def test_alpha():
+    """
+    RGB textures packed with RGBA ones are given an opaque alpha channel.
+    """
+    rgb, rgba = make_texture('rgb', 64, 64), make_texture('rgba', 32, 32, components=4, alpha=128)
+    array_data = pack_texture_array([rgb, rgba], SIZE)
+    assert array_data.components == 4
+    assert np.all(get_layer(array_data, rgb)[..., 3] == 255)
+    assert np.array_equal(get_layer(array_data, rgb)[..., :3], rgb.levels[0])
+    assert np.all(get_layer(array_data, rgba)[..., 3] == 128)
+
+
+def test_default_layer_size():
+    """
+    Textures bigger than a layer are downsampled to it.
+    """
+    data = make_texture('big', LAYER_SIZE[0] * 2, LAYER_SIZE[1] * 2)
+    array_data = pack_texture_array([data])
+    assert array_data.pixels.shape == (1, LAYER_SIZE[1], LAYER_SIZE[0], 3)
+    for (u, v), colour in QUADRANTS.items():
+        assert np.array_equal(sample(array_data.pixels[0], u, v), colour)
+
+
+def test_layer_attribute(main_dir):
+    """
+    The layer is read from the in_layer attribute at location 7 (the per-VAO buffer in vao.py) and used as the third
+    texture coordinate of the array.
+    """
+    _, (vertex, fragment), _ = preprocess('default', ['INSTANCED', 'TEXTURE_ARRAY'])
+    locations = re.findall(r'layout \(location = (\d+)\) in \w+ (\w+);', vertex)
+    assert ('7', 'in_layer') in locations
+    assert [name for location, name in locations if location == '7'] == ['in_layer']
+    assert 'layer = in_layer;' in vertex
+    assert 'texture(u_texture_0, vec3(uv, layer))' in fragment
+
+    # The attribute only exists in the texture array variant
+    sources = preprocess('default')[1]
+    assert not any('#define TEXTURE_ARRAY' in source for source in sources)
+    assert re.search(r'#ifdef TEXTURE_ARRAY\n[^#]*in_layer', sources[0])
@@ -0,0 +1,113 @@
+"""
+Tests of the texture cache: the index of hashed source images, and checking checksums only when a cache is compiled or
+asked for.
+"""
+
+import os
+
+import numpy as np
+import pygame as pg
+import pytest
+
+import texture_cache
+from texture_cache import HEADER_SIZE, TextureCacheError, get_cache_path, load_texture_data, map_texture, read_index
+
+
+@pytest.fixture
+def image(tmp_path):
+    """
+    A 16x8 image with a different colour in each pixel.
+    """
+    surface = pg.Surface((16, 8))
+    for x in range(16):
+        for y in range(8):
+            surface.set_at((x, y), (x * 16, y * 32, 128))
+    path = str(tmp_path / 'image.png')
+    pg.image.save(surface, path)
+    return path
+
+
+@pytest.fixture
+def folder(tmp_path):
+    return str(tmp_path / 'cache')
+
+
+@pytest.fixture
+def hashes(monkeypatch):
+    """
+    Counts the image files hashed.
+    """
+    hashed = []
+    get_content_hash = texture_cache.get_content_hash
+
+    def count_hash(path):
+        hashed.append(path)
+        return get_content_hash(path)
+    monkeypatch.setattr(texture_cache, 'get_content_hash', count_hash)
+    return hashed
+
+
+@pytest.fixture
+def checksums(monkeypatch):
+    """
+    Counts the cache files whose checksum is checked.
+    """
+    checked = []
+    map_texture = texture_cache.map_texture
+
+    def count_checks(path, key, verify=False):
+        if verify:
+            checked.append(path)
+        return map_texture(path, key, verify)
+    monkeypatch.setattr(texture_cache, 'map_texture', count_checks)
+    return checked
+
+
+def test_index(image, folder, hashes):
+    data = load_texture_data(image, folder)
+    assert len(hashes) == 1
+    assert read_index(folder)[os.path.abspath(image)][2] == data.key
+
+    # Unchanged images are found in the index
+    assert load_texture_data(image, folder).key == data.key
+    assert len(hashes) == 1
+
+    # Changed images are hashed again and get a new cache file
+    surface = pg.image.load(image)
+    surface.set_at((0, 0), (255, 255, 255))
+    pg.image.save(surface, image)
+    os.utime(image, ns=(os.stat(image).st_atime_ns, os.stat(image).st_mtime_ns + 10 ** 9))
+    changed = load_texture_data(image, folder)
+    assert len(hashes) == 2 and changed.key != data.key
+    assert tuple(changed.levels[0][-1, 0]) == (255, 255, 255)
+
+
+def test_checksum_on_compile_only(image, folder, checksums):
+    data = load_texture_data(image, folder)
+    assert checksums == [get_cache_path(data.key, folder)]
+    load_texture_data(image, folder)
+    assert len(checksums) == 1
+    load_texture_data(image, folder, verify=True)
+    assert len(checksums) == 2
+
+
+def test_corrupted_cache(image, folder):
+    data = load_texture_data(image, folder)
+    expected = [np.array(level) for level in data.levels]
+    path = get_cache_path(data.key, folder)
+    del data
+    with open(path, 'r+b') as cache:
+        cache.seek(HEADER_SIZE)
+        cache.write(b'\xff\x00\xff')
+
+    # Loading does not read the whole file, so the damage is only found when verifying
+    with pytest.raises(TextureCacheError):
+        map_texture(path, 'key', verify=True)
+    assert not np.array_equal(load_texture_data(image, folder).levels[0], expected[0])
+    repaired = load_texture_data(image, folder, verify=True)
+    assert all(np.array_equal(level, expected_level) for level, expected_level in zip(repaired.levels, expected))
+
+    # Damaged headers are still found without verifying
+    with open(path, 'r+b') as cache:
+        cache.truncate(HEADER_SIZE + 10)
+    assert load_texture_data(image, folder).size == (16, 8)
@@ -0,0 +1,79 @@
+"""
+Tests of the batch transform maths and the transform store against the glm reference chain.
+"""
+
+import numpy as np
+
+from transform import TransformStore, compose_matrices, get_reference_matrix, to_column_major
+
+# The glm chain runs in float32
+TOLERANCE = 1e-4
+
+
+def get_random_transforms(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(-100, 100, (count, 3)), rng.uniform(-np.pi, np.pi, (count, 3)),
+            rng.uniform(0.5, 2, (count, 3)))
+
+
+def get_reference(position, rotation, scale):
+    return np.array(get_reference_matrix(position.tolist(), rotation.tolist(), scale.tolist()), dtype='f8')
+
+
+def test_compose_matches_reference():
+    transforms = get_random_transforms(200)
+    matrices = compose_matrices(*transforms)
+    reference = np.array([get_reference(*transform) for transform in zip(*transforms)])
+    np.testing.assert_allclose(matrices, reference, atol=TOLERANCE)
+
+
+def test_column_major_matches_glm_layout():
+    transform = [values[0] for values in get_random_transforms(1)]
+    matrix = get_reference_matrix(*(values.tolist() for values in transform))
+    np.testing.assert_allclose(to_column_major(compose_matrices(*transform))[0],
+                               np.frombuffer(matrix.to_bytes(), dtype='f4'), atol=TOLERANCE)
+
+
+def test_hierarchy_matches_reference():
+    positions, rotations, scales = get_random_transforms(3, seed=1)
+    store = TransformStore(capacity=2)
+    root = store.add(positions[0], rotations[0], scales[0])
+    child = store.add(positions[1], rotations[1], scales[1], parent=root)
+    grandchild = store.add(positions[2], rotations[2], scales[2], parent=child)
+    assert store.update() == 3
+
+    world = get_reference(positions[0], rotations[0], scales[0])
+    for index in (child, grandchild):
+        world = world @ get_reference(positions[index], rotations[index], scales[index])
+    np.testing.assert_allclose(store.world_matrices[grandchild], world, rtol=TOLERANCE, atol=TOLERANCE)
+    np.testing.assert_allclose(store.matrix_data[grandchild], to_column_major(world[None])[0], rtol=TOLERANCE,
+                               atol=TOLERANCE)
+
+
+def test_only_dirty_transforms_rebuilt():
+    store = TransformStore()
+    root = store.add((1, 0, 0))
+    child = store.add((0, 1, 0), parent=root)
+    other = store.add((0, 0, 1))
+    store.update()
+    assert store.update() == 0
+
+    # Moving the root rebuilds it and its child, not the unrelated transform
+    store.set_position(root, (5, 0, 0))
+    assert store.update() == 2
+    np.testing.assert_allclose(store.world_matrices[child][:3, 3], (5, 1, 0))
+    store.set_scale(other, (2, 2, 2))
+    assert store.update() == 1
+
+
+def test_interpolates_between_steps():
+    store = TransformStore()
+    index = store.add((0, 0, 0))
+    store.update()
+    store.begin_tick()
+    store.set_position(index, (10, 0, 0))
+    store.update(alpha=0.25)
+    np.testing.assert_allclose(store.world_matrices[index][:3, 3], (2.5, 0, 0))
+    # Once the step is reached the interpolated matrix is rebuilt, even without a new change
+    assert store.update() == 1
+    np.testing.assert_allclose(store.world_matrices[index][:3, 3], (10, 0, 0))